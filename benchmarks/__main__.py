@@ -0,0 +1,64 @@
+import argparse
+import asyncio
+import json
+import sys
+
+from . import queue_scenarios, server_scenarios
+from .measure import compare, load_baseline, save_baseline
+
+
+def main():
+    scenarios = sorted(list(queue_scenarios.SCENARIOS) + list(server_scenarios.SCENARIOS))
+
+    parser = argparse.ArgumentParser(prog="benchmarks")
+    parser.add_argument("scenario", nargs="*", help="scenarios to run, all by default: " + ", ".join(scenarios))
+    parser.add_argument("--scale", type=float, default=1.0, help="workload size multiplier")
+    parser.add_argument("--baseline", default="benchmarks/baseline.json", help="baseline file")
+    parser.add_argument("--save", action="store_true", help="store results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative regression")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+
+    args = parser.parse_args()
+
+    for name in args.scenario:
+        if name not in scenarios:
+            parser.error("unknown scenario {}".format(name))
+
+    loop = asyncio.get_event_loop()
+    results = {}
+
+    for name in args.scenario or scenarios:
+        if name in queue_scenarios.SCENARIOS:
+            measurements = queue_scenarios.SCENARIOS[name](args.scale)
+        else:
+            measurements = loop.run_until_complete(server_scenarios.SCENARIOS[name](args.scale))
+
+        for measurement in measurements:
+            results[measurement.name] = measurement.summary()
+
+    baseline = load_baseline(args.baseline)
+    failed = False
+
+    if args.json:
+        print(json.dumps(results, indent=2, sort_keys=True))
+
+    for name, summary in results.items():
+        regressions = compare(summary, baseline.get(name), args.tolerance)
+        failed = failed or bool(regressions)
+
+        if not args.json:
+            print(
+                "{name:45} {operations:8} ops {throughput:12} ops/s  "
+                "p50 {p50_ms:9} ms  p99 {p99_ms:9} ms  rss {rss_mb} MB".format(name=name, **summary))
+            for regression in regressions:
+                print("    REGRESSION: " + regression)
+
+    if args.save:
+        baseline.update(results)
+        save_baseline(args.baseline, baseline)
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
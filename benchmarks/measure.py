@@ -0,0 +1,87 @@
+import json
+import resource
+import time
+from typing import Any, Dict, List, Optional
+
+
+def current_rss() -> int:
+    try:
+        with open("/proc/self/statm") as statm:
+            pages = int(statm.read().split()[1])
+        return pages * resource.getpagesize()
+    except (OSError, ValueError, IndexError):  # pragma: no cover
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class Measurement:
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.operations = 0
+        self.latencies: List[float] = []
+        self.started: float = 0.0
+        self.elapsed: float = 0.0
+        self.rss_before = 0
+        self.rss_after = 0
+
+    def __enter__(self) -> "Measurement":
+        self.rss_before = current_rss()
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.elapsed = time.perf_counter() - self.started
+        self.rss_after = current_rss()
+
+    def record(self, latency: float) -> None:
+        self.operations += 1
+        self.latencies.append(latency)
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "operations": self.operations,
+            "seconds": round(self.elapsed, 4),
+            "throughput": round(self.operations / self.elapsed, 1) if self.elapsed else 0.0,
+            "p50_ms": round(percentile(self.latencies, 0.5) * 1000, 4),
+            "p99_ms": round(percentile(self.latencies, 0.99) * 1000, 4),
+            "rss_mb": round(self.rss_after / 2 ** 20, 1),
+            "rss_delta_mb": round((self.rss_after - self.rss_before) / 2 ** 20, 1),
+        }
+
+
+def load_baseline(path: str) -> Dict[str, Dict[str, Any]]:
+    try:
+        with open(path) as baseline:
+            return json.load(baseline)
+    except FileNotFoundError:
+        return {}
+
+
+def save_baseline(path: str, results: Dict[str, Dict[str, Any]]) -> None:
+    with open(path, "w") as baseline:
+        json.dump(results, baseline, indent=2, sort_keys=True)
+
+
+def compare(current: Dict[str, Any], baseline: Optional[Dict[str, Any]], tolerance: float) -> List[str]:
+    if not baseline:
+        return []
+
+    regressions = []
+
+    if current["throughput"] < baseline["throughput"] * (1 - tolerance):
+        regressions.append("throughput {} < {}".format(current["throughput"], baseline["throughput"]))
+
+    for key in ("p50_ms", "p99_ms"):
+        if current[key] > baseline[key] * (1 + tolerance):
+            regressions.append("{} {} > {}".format(key, current[key], baseline[key]))
+
+    return regressions
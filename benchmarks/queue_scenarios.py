@@ -0,0 +1,98 @@
+import random
+import time
+from typing import Callable, Dict, List
+
+from queueueue.taskqueue import MultiLockPriorityPoolQueue, Task
+
+from .measure import Measurement
+
+
+def _timed(measurement: Measurement, func: Callable, *args, **kwargs):
+    started = time.perf_counter()
+    result = func(*args, **kwargs)
+    measurement.record(time.perf_counter() - started)
+    return result
+
+
+def many_pools(scale: float) -> List[Measurement]:
+    pools = ["pool_{}".format(i) for i in range(max(1, int(500 * scale)))]
+    total = int(20000 * scale)
+    queue = MultiLockPriorityPoolQueue()
+
+    with Measurement("queue.many_pools.put") as put:
+        for i in range(total):
+            _timed(put, queue.put, Task("task", [], pools[i % len(pools)], [i], {}))
+
+    with Measurement("queue.many_pools.get") as get:
+        for pool in reversed(pools):
+            while _timed(get, queue.get, pool) is not None:
+                pass
+
+    return [put, get]
+
+
+def lock_contention(scale: float) -> List[Measurement]:
+    rnd = random.Random(1)
+    locks = ["lock_{}".format(i) for i in range(20)]
+    total = int(10000 * scale)
+    queue = MultiLockPriorityPoolQueue()
+
+    for i in range(total):
+        queue.put(Task("task", rnd.sample(locks, rnd.randint(1, 3)), "pool", [i], {}))
+
+    with Measurement("queue.lock_contention.get") as get, \
+            Measurement("queue.lock_contention.complete") as complete:
+        while len(queue):
+            taken = []
+            while True:
+                task = _timed(get, queue.get, "pool")
+                if task is None:
+                    break
+                taken.append(task)
+
+            for task in taken:
+                _timed(complete, queue.complete, str(task.id), {"status": "success"})
+
+    return [get, complete]
+
+
+def unique_heavy(scale: float) -> List[Measurement]:
+    rnd = random.Random(2)
+    total = int(20000 * scale)
+    queue = MultiLockPriorityPoolQueue()
+
+    with Measurement("queue.unique_heavy.put") as put:
+        for _ in range(total):
+            key = rnd.randint(0, total // 2)
+            task = Task("task", ["lock_{}".format(key % 50)], "pool", [key], {"key": key, "noise": rnd.random()})
+            _timed(put, queue.put, task, unique=True, unique_ignore_kwargs={"noise"})
+
+    return [put]
+
+
+def cancel_storm(scale: float) -> List[Measurement]:
+    rnd = random.Random(3)
+    total = int(20000 * scale)
+    queue = MultiLockPriorityPoolQueue()
+    ids = []
+
+    for i in range(total):
+        task = Task("task", [], "pool_{}".format(i % 10), [i], {})
+        queue.put(task)
+        ids.append(str(task.id))
+
+    rnd.shuffle(ids)
+
+    with Measurement("queue.cancel_storm.remove") as remove:
+        for task_id in ids[:total // 2]:
+            _timed(remove, queue.safe_remove, task_id)
+
+    return [remove]
+
+
+SCENARIOS = {
+    "many_pools": many_pools,
+    "lock_contention": lock_contention,
+    "unique_heavy": unique_heavy,
+    "cancel_storm": cancel_storm,
+}  # type: Dict[str, Callable[[float], List[Measurement]]]
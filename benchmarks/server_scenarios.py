@@ -0,0 +1,184 @@
+import asyncio
+import os
+import socket
+import tempfile
+import time
+from typing import Awaitable, Callable, Dict, List
+
+from aiohttp import ClientSession, UnixConnector, web
+
+from queueueue.acceptor import start_acceptors
+from queueueue.app import build_app
+from queueueue.routes import setup_routes
+from queueueue.server import start_server
+
+from .measure import Measurement
+
+
+async def _serve():
+    app = build_app()
+    setup_routes(app)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    host, port = runner.addresses[0][:2]
+    return runner, "http://{}:{}".format(host, port)
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def _wait_for_port(port: int):
+    for _ in range(100):
+        try:
+            _, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.close()
+            return
+        except OSError:
+            await asyncio.sleep(0.1)
+    raise RuntimeError("Acceptors did not start")
+
+
+async def _roundtrips(measurement: Measurement, session: ClientSession, base: str, total: int, clients: int):
+    async def client(count: int):
+        for _ in range(count):
+            started = time.perf_counter()
+            async with session.patch(base + "/task/pending", params={"pool": "empty"}) as response:
+                await response.read()
+                assert response.status == 200, response.status
+            measurement.record(time.perf_counter() - started)
+
+    with measurement:
+        await asyncio.gather(*[client(total // clients) for _ in range(clients)])
+
+
+def _task_json(pool: str, number: int) -> Dict:
+    return {"name": "task", "locks": [], "pool": pool, "args": [number], "kwargs": {}}
+
+
+async def enqueue_dispatch(scale: float) -> List[Measurement]:
+    total = int(2000 * scale)
+    producers = 8
+    workers = 8
+    runner, base = await _serve()
+
+    async with ClientSession() as session:
+        async def produce(measurement: Measurement, offset: int):
+            for i in range(offset, total, producers):
+                started = time.perf_counter()
+                async with session.post(base + "/task", json=_task_json("pool", i)) as response:
+                    await response.read()
+                measurement.record(time.perf_counter() - started)
+
+        async def work(measurement: Measurement, remaining: List[int]):
+            while remaining[0] > 0:
+                started = time.perf_counter()
+                async with session.patch(base + "/task/pending", params={"pool": "pool"}) as response:
+                    task = await response.json()
+                if task is None:
+                    await asyncio.sleep(0.001)
+                    continue
+                remaining[0] -= 1
+                async with session.patch(base + "/task/" + task["id"], json={"status": "success"}) as response:
+                    await response.read()
+                measurement.record(time.perf_counter() - started)
+
+        remaining = [total]
+        with Measurement("server.enqueue_dispatch.post") as post, \
+                Measurement("server.enqueue_dispatch.take_complete") as take:
+            await asyncio.gather(
+                *[produce(post, offset) for offset in range(producers)],
+                *[work(take, remaining) for _ in range(workers)]
+            )
+
+    await runner.cleanup()
+    return [post, take]
+
+
+async def long_poll_workers(scale: float) -> List[Measurement]:
+    total = int(500 * scale)
+    workers = 32
+    runner, base = await _serve()
+    sent = {}  # type: Dict[str, float]
+
+    async with ClientSession() as session:
+        async def work(measurement: Measurement, remaining: List[int]):
+            while remaining[0] > 0:
+                params = [("pool", "other"), ("pool", "idle"), ("timeout", "1")]
+                async with session.patch(base + "/task/pending", params=params) as response:
+                    task = await response.json()
+                if task is None:
+                    continue
+                measurement.record(time.perf_counter() - sent[task["args"][0]])
+                remaining[0] -= 1
+                async with session.patch(base + "/task/" + task["id"], json={"status": "success"}) as response:
+                    await response.read()
+
+        async def produce():
+            for i in range(total):
+                sent[str(i)] = time.perf_counter()
+                async with session.post(base + "/task", json=_task_json("idle", str(i))) as response:
+                    await response.read()
+                await asyncio.sleep(0.001)
+
+        remaining = [total]
+        with Measurement("server.long_poll_workers.pickup") as pickup:
+            await asyncio.gather(produce(), *[work(pickup, remaining) for _ in range(workers)])
+
+    await runner.cleanup()
+    return [pickup]
+
+
+async def listeners(scale: float) -> List[Measurement]:
+    total = int(4000 * scale)
+    clients = 16
+    measurements = []
+    tmp_dir = tempfile.mkdtemp(prefix="queueueue-bench-")
+    path = os.path.join(tmp_dir, "queue.sock")
+
+    app = build_app()
+    setup_routes(app)
+    port = _free_port()
+    # Acceptors relay to the owner socket with a PROXY header in front.
+    runner = await start_server(app, host="127.0.0.1", port=port, path=path, proxied=True, access_log=None)
+
+    async with ClientSession() as session:
+        measurement = Measurement("server.listener.tcp")
+        await _roundtrips(measurement, session, "http://127.0.0.1:{}".format(port), total, clients)
+        measurements.append(measurement)
+
+    async with ClientSession(connector=UnixConnector(path)) as session:
+        measurement = Measurement("server.listener.unix")
+        await _roundtrips(measurement, session, "http://localhost", total, clients)
+        measurements.append(measurement)
+
+    acceptor_port = _free_port()
+    processes = start_acceptors(2, "127.0.0.1", acceptor_port, path, 128)
+
+    try:
+        await _wait_for_port(acceptor_port)
+        async with ClientSession() as session:
+            measurement = Measurement("server.listener.acceptors")
+            await _roundtrips(measurement, session, "http://127.0.0.1:{}".format(acceptor_port), total, clients)
+            measurements.append(measurement)
+    finally:
+        for process in processes:
+            process.terminate()
+            process.join()
+
+        await runner.cleanup()
+        os.unlink(path)
+        os.rmdir(tmp_dir)
+
+    return measurements
+
+
+SCENARIOS = {
+    "enqueue_dispatch": enqueue_dispatch,
+    "long_poll_workers": long_poll_workers,
+    "listeners": listeners,
+}  # type: Dict[str, Callable[[float], Awaitable[List[Measurement]]]]
@@ -0,0 +1,178 @@
+import asyncio
+import logging
+import multiprocessing
+from typing import Any, Callable, List, Optional, Tuple
+
+PROXY_PREFIX = b"PROXY "
+PROXY_MAX_LENGTH = 107
+
+
+def proxy_header(peername: Any, sockname: Any) -> bytes:
+    # PROXY protocol v1 line carrying the original client address
+    if not isinstance(peername, tuple) or not isinstance(sockname, tuple):
+        return b"PROXY UNKNOWN\r\n"
+
+    family = "TCP6" if ":" in peername[0] else "TCP4"
+    return "PROXY {} {} {} {} {}\r\n".format(
+        family, peername[0], sockname[0], peername[1], sockname[1]).encode()
+
+
+def parse_proxy_header(line: bytes) -> Optional[Tuple[str, int]]:
+    parts = line.decode("ascii").split(" ")
+    if parts[:2] == ["PROXY", "UNKNOWN"]:
+        return None
+    if len(parts) != 6 or parts[1] not in ("TCP4", "TCP6"):
+        raise ValueError("Invalid PROXY header")
+
+    return (parts[2], int(parts[4]))
+
+
+class PeerTransport:
+    # Reports the client address from the PROXY header as the peer of
+    # the relayed connection and delegates everything else.
+
+    def __init__(self, transport: asyncio.Transport, peername: Optional[Tuple[str, int]]) -> None:
+        self._transport = transport
+        self._peername = peername
+
+    def get_extra_info(self, name: str, default: Any = None) -> Any:
+        if name == "peername" and self._peername is not None:
+            return self._peername
+        return self._transport.get_extra_info(name, default)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._transport, name)
+
+
+class ProxyHeaderProtocol(asyncio.Protocol):
+    # Strips the PROXY line acceptors send ahead of the relayed bytes and
+    # hands the connection to the wrapped protocol. Connections without
+    # one, local clients of the owner socket, pass through unchanged.
+
+    def __init__(self, factory: Callable[[], asyncio.Protocol]) -> None:
+        self._factory = factory
+        self._transport = None  # type: Optional[asyncio.Transport]
+        self._protocol = None  # type: Optional[asyncio.Protocol]
+        self._buffer = b""
+
+    def connection_made(self, transport: asyncio.BaseTransport):
+        self._transport = transport
+
+    def _start(self, peername: Optional[Tuple[str, int]], data: bytes):
+        self._protocol = self._factory()
+        self._protocol.connection_made(PeerTransport(self._transport, peername))
+        if data:
+            self._protocol.data_received(data)
+
+    def data_received(self, data: bytes):
+        if self._protocol is not None:
+            self._protocol.data_received(data)
+            return
+
+        self._buffer += data
+        if not self._buffer.startswith(PROXY_PREFIX[:len(self._buffer)]):
+            data, self._buffer = self._buffer, b""
+            self._start(None, data)
+            return
+
+        end = self._buffer.find(b"\r\n")
+        if end < 0:
+            if len(self._buffer) > PROXY_MAX_LENGTH:
+                self._transport.close()
+            return
+
+        try:
+            peername = parse_proxy_header(self._buffer[:end])
+        except (UnicodeDecodeError, ValueError):
+            self._transport.close()
+            return
+
+        data, self._buffer = self._buffer[end + 2:], b""
+        self._start(peername, data)
+
+    def eof_received(self) -> Optional[bool]:
+        if self._protocol is not None:
+            return self._protocol.eof_received()
+        return None
+
+    def connection_lost(self, exc: Optional[Exception]):
+        if self._protocol is not None:
+            self._protocol.connection_lost(exc)
+
+    def pause_writing(self):
+        if self._protocol is not None:
+            self._protocol.pause_writing()
+
+    def resume_writing(self):
+        if self._protocol is not None:
+            self._protocol.resume_writing()
+
+
+async def _pipe(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, half_close: bool):
+    try:
+        while True:
+            data = await reader.read(65536)
+            if not data:
+                break
+            writer.write(data)
+            await writer.drain()
+    except ConnectionError:
+        pass
+    finally:
+        if half_close and writer.can_write_eof() and not writer.transport.is_closing():
+            writer.write_eof()
+        else:
+            writer.close()
+
+
+async def _proxy(client_reader: asyncio.StreamReader, client_writer: asyncio.StreamWriter, upstream: str):
+    try:
+        upstream_reader, upstream_writer = await asyncio.open_unix_connection(upstream)
+    except OSError:
+        client_writer.close()
+        return
+
+    upstream_writer.write(proxy_header(
+        client_writer.get_extra_info("peername"), client_writer.get_extra_info("sockname")))
+
+    await asyncio.gather(
+        _pipe(client_reader, upstream_writer, half_close=True),
+        _pipe(upstream_reader, client_writer, half_close=False)
+    )
+    upstream_writer.close()
+
+
+def run_acceptor(host: str, port: int, upstream: str, backlog: int):
+    # Accepts TCP connections on a SO_REUSEPORT socket shared with the
+    # other acceptors and relays raw bytes to the queue owner's Unix
+    # socket; HTTP itself is only parsed by the owner. Each connection
+    # starts with a PROXY protocol line naming the client.
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+
+    server = loop.run_until_complete(asyncio.start_server(
+        lambda reader, writer: _proxy(reader, writer, upstream),
+        host, port, reuse_port=True, backlog=backlog
+    ))
+
+    logging.getLogger("Acceptor").info("Relaying %s:%s to %s", host, port, upstream)
+
+    try:
+        loop.run_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+        loop.close()
+
+
+def start_acceptors(count: int, host: str, port: int, upstream: str, backlog: int) -> List[multiprocessing.Process]:
+    context = multiprocessing.get_context("spawn")
+    processes = []
+
+    for _ in range(count):
+        process = context.Process(target=run_acceptor, args=(host, port, upstream, backlog), daemon=True)
+        process.start()
+        processes.append(process)
+
+    return processes
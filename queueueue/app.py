@@ -1,20 +1,89 @@
+import asyncio
+import signal
 from base64 import b64encode
-from typing import List
+from typing import List, Optional
 
 from aiohttp import web
 
+from .auth import TokenStore
+from .instrumentation import Instrumentation
+from .limits import EnqueueLimits
 from .stats.collector import StatCollector
 from .taskqueue import MultiLockPriorityPoolQueue
+from .trace import TraceRecorder
 
 
-def build_app() -> web.Application:
+def build_app(queue: Optional[MultiLockPriorityPoolQueue] = None) -> web.Application:
     app = web.Application()
-    app["queue"] = MultiLockPriorityPoolQueue()
-    app["auth"] = set()
-    app["stats"] = StatCollector()
+    app["queue"] = queue if queue is not None else MultiLockPriorityPoolQueue()
+    app["auth"] = TokenStore()
+    app["stats"] = StatCollector(app["queue"])
+    app["instrumentation"] = Instrumentation(app["queue"])
+    app["trace"] = TraceRecorder(app["queue"])
+    app["limits"] = EnqueueLimits()
+    app["expire_interval"] = 1.0
+    app["payload_listing_limit"] = 4096
+    app["trace_dir"] = None
+    app.on_startup.append(start_expiry_sweeper)
+    app.on_cleanup.append(stop_expiry_sweeper)
+    app.on_cleanup.append(stop_instrumentation)
+    app.on_cleanup.append(stop_trace)
+    app.on_cleanup.append(close_queue)
     return app
 
 
+async def sweep_expired_tasks(app: web.Application):
+    while True:
+        await asyncio.sleep(app["expire_interval"])
+
+        expired = app["queue"].expire()
+        for task in expired:
+            app["stats"].push_task_expired(task.pool)
+
+        missed = app["queue"].shed_missed()
+        for task in missed:
+            app["stats"].push_task_shed(task.pool)
+
+        lost = app["queue"].expire_sessions()
+        for session, tasks in lost:
+            app["stats"].push_session_lost(session, tasks)
+
+        if expired or missed or lost:
+            app["stats"].set_tasks_queued(len(app["queue"]))
+
+
+async def start_expiry_sweeper(app: web.Application):
+    app["expiry_sweeper"] = asyncio.ensure_future(sweep_expired_tasks(app))
+
+
+async def stop_expiry_sweeper(app: web.Application):
+    app["expiry_sweeper"].cancel()
+
+
+async def close_queue(app: web.Application):
+    app["queue"].close()
+
+
+async def start_instrumentation(app: web.Application):
+    app["instrumentation"].enable()
+
+
+async def stop_instrumentation(app: web.Application):
+    app["instrumentation"].disable()
+
+
+def setup_trace(app: web.Application, path: str):
+    async def start_trace(app: web.Application):
+        app["trace"].start(path)
+
+    app.on_startup.append(start_trace)
+
+
+async def stop_trace(app: web.Application):
+    if app["trace"].recording:
+        app["trace"].stop()
+
+
 def get_encoded_auth(username: str, password: str) -> str:
     return b64encode("{}:{}".format(username, password).encode()).decode()
 
@@ -29,9 +98,19 @@ def setup_basic_auth(app: web.Application, credentials: List[str]):
                 error=error
             ))
 
-        app["auth"].add("Basic " + get_encoded_auth(username, password))
+        app["auth"].add("basic", "{}:{}".format(username, password))
 
 
 def setup_bearer_auth(app: web.Application, credentials: List[str]):
     for entry in credentials:
-        app["auth"].add("Bearer " + entry)
+        app["auth"].add("bearer", entry)
+
+
+def setup_token_file(app: web.Application, path: str):
+    app["auth"].path = path
+    app["auth"].reload()
+    app.on_startup.append(reload_tokens_on_sighup)
+
+
+async def reload_tokens_on_sighup(app: web.Application):
+    asyncio.get_event_loop().add_signal_handler(signal.SIGHUP, app["auth"].reload)
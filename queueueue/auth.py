@@ -0,0 +1,151 @@
+import binascii
+import hashlib
+import logging
+import time
+from base64 import b64decode
+from collections import OrderedDict
+from typing import Dict, FrozenSet, Iterable, Optional, Tuple
+
+SCHEMES = ("basic", "bearer")
+
+
+def hash_secret(secret: str) -> str:
+    return hashlib.sha256(secret.encode()).hexdigest()
+
+
+class Credential:
+
+    def __init__(self, scheme: str, digest: str, pools: Optional[Iterable[str]] = None) -> None:
+        self.scheme = scheme
+        self.digest = digest
+        self.pools = frozenset(pools) if pools is not None else None  # type: Optional[FrozenSet[str]]
+
+    def allows(self, pool: str) -> bool:
+        return self.pools is None or pool in self.pools
+
+
+class RateLimitedLogger:
+    # Emits at most one record per ``interval`` seconds and reports how many
+    # were suppressed in between.
+
+    def __init__(self, logger: logging.Logger, interval: float = 10.0) -> None:
+        self.logger = logger
+        self.interval = interval
+        self.suppressed = 0
+        self._last = float("-inf")
+
+    def warning(self, message: str, *args) -> None:
+        now = time.monotonic()
+
+        if now - self._last < self.interval:
+            self.suppressed += 1
+            return
+
+        if self.suppressed:
+            message += " (%s similar messages suppressed)"
+            args = args + (self.suppressed,)
+
+        self._last = now
+        self.suppressed = 0
+        self.logger.warning(message, *args)
+
+
+class TokenStore:
+    # Credentials are kept as sha256 digests of the secret: the bearer token
+    # or "username:password" for basic auth. Each line of a token file is
+    #
+    #     <basic|bearer> <sha256 hex digest> [pool,pool,...]
+    #
+    # where a missing pool list grants access to every pool.
+
+    def __init__(self, path: Optional[str] = None, cache_size: int = 1024) -> None:
+        self.path = path
+        self.cache_size = cache_size
+        self._static = {}  # type: Dict[Tuple[str, str], Credential]
+        self._loaded = {}  # type: Dict[Tuple[str, str], Credential]
+        self._cache = OrderedDict()  # type: OrderedDict[str, Credential]
+        self._file_loaded = False
+        self._logger = logging.getLogger("Auth")
+
+        if path:
+            self.reload()
+
+    def __bool__(self) -> bool:
+        # Whether auth is configured at all: a token file that ends up
+        # empty denies every request instead of switching auth off
+        return self.path is not None or bool(self._static)
+
+    def add(self, scheme: str, secret: str, pools: Optional[Iterable[str]] = None):
+        credential = Credential(scheme, hash_secret(secret), pools)
+        self._static[(scheme, credential.digest)] = credential
+        self._cache.clear()
+
+    @staticmethod
+    def parse(lines: Iterable[str]) -> Dict[Tuple[str, str], Credential]:
+        credentials = {}
+
+        for number, line in enumerate(lines, 1):
+            line = line.split("#", 1)[0].strip()
+            if not line:
+                continue
+
+            parts = line.split()
+            if len(parts) not in (2, 3) or parts[0].lower() not in SCHEMES or len(parts[1]) != 64:
+                raise ValueError("Invalid token entry on line {}".format(number))
+
+            scheme, digest = parts[0].lower(), parts[1].lower()
+            pools = parts[2].split(",") if len(parts) == 3 else None
+            credentials[(scheme, digest)] = Credential(scheme, digest, pools)
+
+        return credentials
+
+    def reload(self):
+        try:
+            with open(self.path) as token_file:
+                credentials = self.parse(token_file)
+            if not credentials and not self._file_loaded:
+                raise ValueError("No tokens in {}".format(self.path))
+        except (OSError, ValueError) as error:
+            if not self._file_loaded:
+                raise
+            self._logger.error("Failed to reload tokens from %s, keeping previous set: %s", self.path, error)
+            return
+
+        self._loaded = credentials
+        self._file_loaded = True
+        self._cache.clear()
+        self._logger.info("Loaded %s tokens from %s", len(credentials), self.path)
+
+    def _lookup(self, header: str) -> Optional[Credential]:
+        scheme, _, value = header.partition(" ")
+        scheme = scheme.lower()
+
+        if scheme == "basic":
+            try:
+                value = b64decode(value, validate=True).decode()
+            except (binascii.Error, UnicodeDecodeError):
+                return None
+        elif scheme != "bearer":
+            return None
+
+        # Lookups are keyed by the sha256 of the secret, so how long a
+        # lookup takes tells nothing about the secret itself
+        digest = hash_secret(value)
+        return self._loaded.get((scheme, digest)) or self._static.get((scheme, digest))
+
+    def verify(self, header: Optional[str]) -> Optional[Credential]:
+        if not header:
+            return None
+
+        credential = self._cache.get(header)
+        if credential is not None:
+            self._cache.move_to_end(header)
+            return credential
+
+        credential = self._lookup(header)
+        if credential is not None:
+            self._cache[header] = credential
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+        return credential
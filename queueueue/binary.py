@@ -0,0 +1,161 @@
+import asyncio
+import logging
+import struct
+import uuid
+from typing import Any, List, Optional
+
+from aiohttp import web
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover
+    msgpack = None
+
+# Every frame is a 4 byte big-endian length followed by a msgpack array.
+# Requests are [op, seq, *args], responses are [seq, status, payload].
+# Frames are answered in order, so clients may pipeline any number of
+# requests on one connection.
+HEADER = struct.Struct("!I")
+MAX_FRAME = 16 * 2 ** 20
+
+OP_AUTH = 0
+OP_TAKE = 1
+OP_COMPLETE = 2
+OP_HEARTBEAT = 3
+
+STATUS_OK = 0
+STATUS_ERROR = 1
+
+
+def pack_frame(message: List[Any]) -> bytes:
+    payload = msgpack.packb(message, use_bin_type=True)
+    return HEADER.pack(len(payload)) + payload
+
+
+async def read_frame(reader: asyncio.StreamReader) -> Optional[List[Any]]:
+    try:
+        header = await reader.readexactly(HEADER.size)
+    except asyncio.IncompleteReadError:
+        return None
+
+    length, = HEADER.unpack(header)
+    if length > MAX_FRAME:
+        raise ValueError("Frame too large")
+
+    message = msgpack.unpackb(await reader.readexactly(length), raw=False)
+    if not isinstance(message, list) or len(message) < 2:
+        raise ValueError("Malformed frame")
+
+    return message
+
+
+class BinaryConnection:
+
+    def __init__(self, app: web.Application) -> None:
+        self.app = app
+        self.credential = None
+        self.authenticated = not app["auth"]
+        self.session = None  # type: Optional[str]
+
+    def _allowed(self, pool: str) -> bool:
+        return self.credential is None or self.credential.allows(pool)
+
+    def auth(self, header: str):
+        self.credential = self.app["auth"].verify(header)
+        if self.credential is None:
+            raise PermissionError("Not authorized")
+
+        self.authenticated = True
+
+    def take(self, pool: str):
+        if not self._allowed(pool):
+            raise PermissionError("Access to pool denied")
+
+        task = self.app["queue"].get(pool=pool, session=self.session)
+        if task is None:
+            return None
+
+        self.app["stats"].push_task_taken(task)
+
+        return [task.id.bytes, task.name, task.args, task.kwargs]
+
+    def complete(self, task_id: bytes, data: dict):
+        _id = str(uuid.UUID(bytes=task_id))
+
+        if not self._allowed(self.app["queue"].find(_id).pool):
+            raise PermissionError("Access to pool denied")
+
+        task = self.app["queue"].complete(_id, data)
+        self.app["stats"].push_task_finished(task)
+        self.app["stats"].set_tasks_queued(len(self.app["queue"]))
+
+    def heartbeat(self, session: Optional[str] = None):
+        if session is None:
+            return None
+
+        self.session = session
+        return self.app["queue"].heartbeat(session).timestamp()
+
+    def handle(self, message: List[Any]) -> bytes:
+        op, seq, args = message[0], message[1], message[2:]
+
+        try:
+            if op == OP_AUTH:
+                result = self.auth(*args)
+            elif not self.authenticated:
+                raise PermissionError("Not authorized")
+            elif op == OP_TAKE:
+                result = self.take(*args)
+            elif op == OP_COMPLETE:
+                result = self.complete(*args)
+            elif op == OP_HEARTBEAT:
+                result = self.heartbeat(*args)
+            else:
+                raise ValueError("Unknown operation {}".format(op))
+        except LookupError:
+            return pack_frame([seq, STATUS_ERROR, "Unknown task"])
+        except (PermissionError, ValueError, TypeError) as error:
+            return pack_frame([seq, STATUS_ERROR, str(error)])
+
+        return pack_frame([seq, STATUS_OK, result])
+
+    async def serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                message = await read_frame(reader)
+                if message is None:
+                    break
+
+                writer.write(self.handle(message))
+                await writer.drain()
+        except (ValueError, ConnectionError, asyncio.IncompleteReadError) as error:
+            logging.getLogger("Binary").warning("Closing binary connection: %s", error)
+        finally:
+            writer.close()
+
+
+def setup_binary_protocol(app: web.Application,
+                          host: Optional[str] = None,
+                          port: Optional[int] = None,
+                          path: Optional[str] = None):
+    if msgpack is None:
+        raise RuntimeError("The binary protocol requires the msgpack package")
+
+    async def start(app: web.Application):
+        def handler(reader, writer):
+            return BinaryConnection(app).serve(reader, writer)
+
+        servers = []
+        if port:
+            servers.append(await asyncio.start_server(handler, host, port))
+        if path:
+            servers.append(await asyncio.start_unix_server(handler, path))
+        app["binary_servers"] = servers
+
+    async def stop(app: web.Application):
+        for server in app["binary_servers"]:
+            server.close()
+            await server.wait_closed()
+
+    app.on_startup.append(start)
+    app.on_cleanup.append(stop)
@@ -0,0 +1,159 @@
+import asyncio
+import cProfile
+import io
+import pstats
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from .taskqueue import MultiLockPriorityPoolQueue
+
+
+class OperationCounter:
+
+    def __init__(self) -> None:
+        self.calls = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+        self.scanned = 0
+        self.max_scanned = 0
+
+    def add(self, seconds: float, scanned: int) -> None:
+        self.calls += 1
+        self.seconds += seconds
+        self.scanned += scanned
+        if seconds > self.max_seconds:
+            self.max_seconds = seconds
+        if scanned > self.max_scanned:
+            self.max_scanned = scanned
+
+    def for_json(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "seconds": self.seconds,
+            "avg_us": self.seconds / self.calls * 1e6 if self.calls else 0.0,
+            "max_us": self.max_seconds * 1e6,
+            "scanned": self.scanned,
+            "avg_scanned": self.scanned / self.calls if self.calls else 0.0,
+            "max_scanned": self.max_scanned
+        }
+
+
+class LoopLagMonitor:
+
+    def __init__(self, interval: float = 0.1) -> None:
+        self.interval = interval
+        self.samples = 0
+        self.lag_total = 0.0
+        self.lag_max = 0.0
+        self._future = None  # type: Optional[asyncio.Future]
+
+    async def _monitor(self) -> None:
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, time.monotonic() - expected)
+
+            self.samples += 1
+            self.lag_total += lag
+            if lag > self.lag_max:
+                self.lag_max = lag
+
+    @property
+    def running(self) -> bool:
+        return self._future is not None
+
+    def start(self) -> None:
+        if self._future is None:
+            self._future = asyncio.ensure_future(self._monitor())
+
+    def stop(self) -> None:
+        if self._future is not None:
+            self._future.cancel()
+            self._future = None
+
+    def for_json(self) -> Dict[str, Any]:
+        return {
+            "running": self.running,
+            "samples": self.samples,
+            "avg_ms": self.lag_total / self.samples * 1000 if self.samples else 0.0,
+            "max_ms": self.lag_max * 1000
+        }
+
+
+class Instrumentation:
+    # Observes the timed queue operations while enabled, see
+    # ``taskqueue.observed``.
+    operations = ("put", "get", "complete", "safe_remove")
+
+    def __init__(self, queue: MultiLockPriorityPoolQueue) -> None:
+        self.queue = queue
+        self.counters = {}  # type: Dict[str, OperationCounter]
+        self.loop_lag = LoopLagMonitor()
+        self._profile = None  # type: Optional[cProfile.Profile]
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.counters)
+
+    def observe(self,
+                operation: str,
+                args: Tuple[Any, ...],
+                kwargs: Dict[str, Any],
+                result: Any,
+                error: Optional[Exception],
+                seconds: float) -> None:
+        self.counters[operation].add(seconds, self.queue.last_scanned)
+
+    def enable(self) -> None:
+        if self.enabled:
+            return
+
+        for name in self.operations:
+            self.counters[name] = OperationCounter()
+
+        self.queue.observers.append(self)
+        self.loop_lag.start()
+
+    def disable(self) -> None:
+        if self in self.queue.observers:
+            self.queue.observers.remove(self)
+
+        self.counters = {}
+        self.loop_lag.stop()
+
+    @property
+    def profiling(self) -> bool:
+        return self._profile is not None
+
+    def start_profile(self) -> None:
+        if self._profile is None:
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+
+    def stop_profile(self, sort: str = "cumulative", limit: int = 50) -> str:
+        if self._profile is None:
+            raise LookupError
+
+        self._profile.disable()
+        output = io.StringIO()
+
+        try:
+            stats = pstats.Stats(self._profile, stream=output).sort_stats(sort)
+        except KeyError:
+            self._profile.enable()
+            raise
+
+        self._profile = None
+        stats.print_stats(limit)
+        return output.getvalue()
+
+    def for_json(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "profiling": self.profiling,
+            "operations": {
+                name: counter.for_json()
+                for name, counter in self.counters.items()
+            },
+            "loop_lag": self.loop_lag.for_json()
+        }
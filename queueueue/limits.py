@@ -0,0 +1,71 @@
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+
+class TokenBucket:
+
+    def __init__(self, rate: float, burst: float, now: float) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = now
+
+    def take(self, now: float) -> float:
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+
+        return (1 - self.tokens) / self.rate
+
+
+class EnqueueLimits:
+    # Both checks are O(1) per request: depth comes from the queue's per
+    # pool index and every client has its own token bucket.
+
+    def __init__(self,
+                 max_depth: Optional[int] = None,
+                 pool_max_depth: Optional[Dict[str, int]] = None,
+                 rate: Optional[float] = None,
+                 burst: Optional[float] = None,
+                 depth_retry_after: float = 1.0,
+                 max_clients: int = 10000) -> None:
+        self.max_depth = max_depth
+        self.pool_max_depth = pool_max_depth or {}
+        self.rate = rate
+        self.burst = burst if burst is not None else rate
+        self.depth_retry_after = depth_retry_after
+        self.max_clients = max_clients
+        self._buckets = OrderedDict()  # type: OrderedDict[str, TokenBucket]
+
+    def _bucket(self, client: str, now: float) -> TokenBucket:
+        # Buckets are kept in least recently used order, a new client
+        # beyond max_clients evicts the one idle the longest
+        bucket = self._buckets.get(client)
+
+        if bucket is None:
+            if len(self._buckets) >= self.max_clients:
+                self._buckets.popitem(last=False)
+            bucket = self._buckets[client] = TokenBucket(self.rate, self.burst, now)
+        else:
+            self._buckets.move_to_end(client)
+
+        return bucket
+
+    def check(self, client: str, pool: str, depth: int, now: Optional[float] = None) -> Tuple[Optional[str], float]:
+        max_depth = self.pool_max_depth.get(pool, self.max_depth)
+        if max_depth is not None and depth >= max_depth:
+            return ("Queue depth limit reached", self.depth_retry_after)
+
+        if self.rate:
+            if now is None:
+                now = time.monotonic()
+
+            wait = self._bucket(client, now).take(now)
+            if wait:
+                return ("Rate limit exceeded", wait)
+
+        return (None, 0.0)
@@ -0,0 +1,103 @@
+import json
+import logging
+import logging.handlers
+import queue
+from collections import defaultdict
+from typing import DefaultDict, List, Optional
+
+
+class EventSamplingFilter(logging.Filter):
+    # Keeps every record without a queue event and one out of ``every``
+    # records of each queue event type.
+
+    def __init__(self, every: int = 1) -> None:
+        super().__init__()
+        self.every = max(1, every)
+        self._seen = defaultdict(int)  # type: DefaultDict[str, int]
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        event = getattr(record, "event", None)
+        if event is None or self.every == 1 or record.levelno > logging.INFO:
+            return True
+
+        seen = self._seen[event]
+        self._seen[event] = seen + 1
+        return seen % self.every == 0
+
+
+class StructuredFormatter(logging.Formatter):
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage()
+        }
+
+        event = getattr(record, "event", None)
+        if event is not None:
+            data["event"] = event
+
+        task = getattr(record, "task", None)
+        if task is not None:
+            data["task_id"] = str(task.id)
+            data["task_name"] = task.name
+            data["pool"] = task.pool
+            data["locks"] = [str(lock) for lock in task.locks]
+
+        if record.exc_info:
+            data["exc_info"] = self.formatException(record.exc_info)
+
+        return json.dumps(data, default=str)
+
+
+class BufferedQueueHandler(logging.handlers.QueueHandler):
+    # Unlike the stdlib QueueHandler, records are passed to the listener
+    # thread unformatted: formatting happens there, off the event loop.
+    # Only container arguments are copied, as the event loop may still
+    # change them meanwhile. When the buffer is full records are dropped
+    # instead of blocking.
+
+    def __init__(self, buffer: queue.Queue) -> None:
+        super().__init__(buffer)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        if isinstance(record.args, tuple):
+            record.args = tuple(
+                arg.copy() if isinstance(arg, (set, list, dict)) else arg
+                for arg in record.args)
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def setup_logging(level: str,
+                  log_format: str = "text",
+                  sample_every: int = 1,
+                  buffer_size: int = 0) -> Optional[logging.handlers.QueueListener]:
+    handler = logging.StreamHandler()  # type: logging.Handler
+
+    if log_format == "json":
+        handler.setFormatter(StructuredFormatter())
+    else:
+        handler.setFormatter(logging.Formatter(logging.BASIC_FORMAT))
+
+    logging.getLogger("Queue").addFilter(EventSamplingFilter(sample_every))
+
+    listener = None
+    handlers = [handler]  # type: List[logging.Handler]
+
+    if buffer_size:
+        listener = logging.handlers.QueueListener(queue.Queue(buffer_size), handler)
+        handlers = [BufferedQueueHandler(listener.queue)]
+        listener.start()
+
+    logging.basicConfig(level=level, handlers=handlers)
+
+    return listener
@@ -1,24 +1,156 @@
 import argparse
-import logging
 import os
+from typing import Dict, List
 
-from aiohttp import web
+from aiohttp.log import access_logger
 
-from .app import build_app, setup_basic_auth, setup_bearer_auth
+from .app import (build_app, setup_basic_auth, setup_bearer_auth,
+                  setup_token_file, setup_trace, start_instrumentation)
+from .limits import EnqueueLimits
+from .logs import setup_logging
 from .routes import setup_routes
+from .server import run_server
+from .taskqueue import MultiLockPriorityPoolQueue
+
+
+def parse_pool_limits(parser: argparse.ArgumentParser, entries: List[str]) -> Dict[str, int]:
+    limits = {}
+
+    for entry in entries:
+        pool, _, value = entry.rpartition("=")
+        try:
+            limits[pool] = int(value)
+        except ValueError:
+            parser.error("Invalid pool limit {}".format(entry))
+
+    return limits
 
 
 def main():
     parser = argparse.ArgumentParser(prog='queueueue')
     parser.add_argument("--host", help="queueueue listen address")
-    parser.add_argument("--port", help="queueueue listen port")
+    parser.add_argument("--port", help="queueueue listen port", type=int)
+    parser.add_argument("--unix-socket", help="queueueue listen Unix socket path")
+    parser.add_argument("--backlog", help="listen socket backlog size", type=int, default=128)
+    parser.add_argument("--keepalive-timeout", help="idle keep-alive connection timeout", type=float, default=75.0)
+    parser.add_argument("--binary-port", help="binary worker protocol listen port", type=int)
+    parser.add_argument("--binary-unix-socket", help="binary worker protocol Unix socket path")
+    parser.add_argument(
+        "--acceptors",
+        help="Accept TCP connections in N SO_REUSEPORT processes relaying to this one over a Unix socket",
+        type=int, default=0
+    )
     parser.add_argument("--auth-basic", help="authentication credentials", action="append")
     parser.add_argument("--auth-bearer", help="authentication credentials", action="append")
+    parser.add_argument("--auth-file", help="hashed token file, reloaded on SIGHUP")
     parser.add_argument(
         "--loglevel",
         choices=["CRITICAL", "ERROR", "WARNING", "INFO", "DEBUG", "NOTSET"],
         default="INFO"
     )
+    parser.add_argument(
+        "--log-format",
+        choices=["text", "json"],
+        default="text",
+        help="Log record format"
+    )
+    parser.add_argument(
+        "--log-sample",
+        help="Log only one of every N queue events of each type",
+        type=int, default=1
+    )
+    parser.add_argument(
+        "--log-buffer",
+        help="Write logs from a background thread through a buffer of N records, 0 writes inline",
+        type=int, default=0
+    )
+    parser.add_argument(
+        "--no-access-log",
+        help="Disable per-request access logging",
+        action="store_true"
+    )
+    parser.add_argument(
+        "--expire-interval",
+        help="Seconds between sweeps for expired tasks",
+        type=float, default=1.0
+    )
+    parser.add_argument(
+        "--max-queue-depth",
+        help="Reject new tasks for a pool with this many queued tasks",
+        type=int
+    )
+    parser.add_argument(
+        "--pool-max-depth",
+        help="Queue depth limit for a single pool as POOL=N",
+        action="append", default=[]
+    )
+    parser.add_argument(
+        "--rate-limit",
+        help="Tasks per second each client may enqueue",
+        type=float
+    )
+    parser.add_argument(
+        "--rate-burst",
+        help="Tasks a client may enqueue in a burst, defaults to the rate limit",
+        type=float
+    )
+    parser.add_argument(
+        "--spill-dir",
+        help="Directory for spilling the tail of deep pools to disk"
+    )
+    parser.add_argument(
+        "--spill-threshold",
+        help="Queued tasks per pool kept in memory when spilling is enabled",
+        type=int, default=10000
+    )
+    parser.add_argument(
+        "--session-timeout",
+        help="Seconds without a heartbeat after which a worker session is lost",
+        type=float, default=30.0
+    )
+    parser.add_argument(
+        "--session-lost",
+        choices=["requeue", "fail"],
+        default="requeue",
+        help="What happens to the active tasks of a lost worker session"
+    )
+    parser.add_argument(
+        "--lock-reserve-after",
+        help="Seconds after which a queued task reserves its locks ahead of newer tasks",
+        type=float
+    )
+    parser.add_argument(
+        "--edf-pool",
+        help="Dispatch tasks of this pool by earliest deadline, shedding those that cannot make it",
+        action="append", default=[]
+    )
+    parser.add_argument(
+        "--output-limit",
+        help="Bytes of streamed stdout/stderr kept in memory per running task and stream",
+        type=int, default=65536
+    )
+    parser.add_argument(
+        "--output-dir",
+        help="Directory to also write streamed task output to in full"
+    )
+    parser.add_argument(
+        "--payload-listing-limit",
+        help="Task listings replace args/kwargs larger than this many bytes with their digest",
+        type=int, default=4096
+    )
+    parser.add_argument(
+        "--instrumentation",
+        help="Collect queue operation timings and event loop lag from startup",
+        action="store_true"
+    )
+    parser.add_argument(
+        "--trace",
+        help="Record queue operations to this file for python -m queueueue.simulator"
+    )
+    parser.add_argument(
+        "--trace-dir",
+        help="Directory POST /admin/trace may start recordings in"
+    )
     parser.add_argument(
         "--graphite",
         default=os.environ.get("QUEUE_GRAPHITE", None),
@@ -35,15 +167,51 @@ def main():
 
     args = parser.parse_args()
 
-    app = build_app()
+    if args.rate_limit and args.unix_socket and not (args.auth_basic or args.auth_bearer or args.auth_file):
+        # Clients of a Unix socket have no address, without credentials
+        # they would all share a single token bucket
+        parser.error("--rate-limit with --unix-socket requires authentication")
+
+    app = build_app(MultiLockPriorityPoolQueue(
+        spill_dir=args.spill_dir,
+        spill_threshold=args.spill_threshold,
+        session_timeout=args.session_timeout,
+        session_requeue=args.session_lost == "requeue",
+        output_limit=args.output_limit,
+        output_dir=args.output_dir,
+        lock_reserve_after=args.lock_reserve_after,
+        edf_pools=args.edf_pool
+    ))
+    app["expire_interval"] = args.expire_interval
+    app["payload_listing_limit"] = args.payload_listing_limit
+    app["trace_dir"] = args.trace_dir
+    app["limits"] = EnqueueLimits(
+        max_depth=args.max_queue_depth,
+        pool_max_depth=parse_pool_limits(parser, args.pool_max_depth),
+        rate=args.rate_limit,
+        burst=args.rate_burst
+    )
     setup_routes(app)
 
+    if args.instrumentation:
+        app.on_startup.append(start_instrumentation)
+
+    if args.trace:
+        setup_trace(app, args.trace)
+
     if args.auth_basic:
         setup_basic_auth(app, args.auth_basic)
 
     if args.auth_bearer:
         setup_bearer_auth(app, args.auth_bearer)
 
+    if args.auth_file:
+        setup_token_file(app, args.auth_file)
+
+    if args.binary_port or args.binary_unix_socket:
+        from .binary import setup_binary_protocol
+        setup_binary_protocol(app, host=args.host, port=args.binary_port, path=args.binary_unix_socket)
+
     if args.graphite:
         from .stats.pusher_graphite import GraphiteStatPusher
         pusher = GraphiteStatPusher(
@@ -55,14 +223,28 @@ def main():
 
         pusher.start()
 
-    logging.basicConfig(level=args.loglevel)
-
-    web.run_app(
-        app,
-        host=args.host,
-        port=args.port
+    listener = setup_logging(
+        args.loglevel,
+        log_format=args.log_format,
+        sample_every=args.log_sample,
+        buffer_size=args.log_buffer
     )
 
+    try:
+        run_server(
+            app,
+            host=args.host,
+            port=args.port,
+            path=args.unix_socket,
+            backlog=args.backlog,
+            keepalive_timeout=args.keepalive_timeout,
+            acceptors=args.acceptors,
+            access_log=None if args.no_access_log else access_logger
+        )
+    finally:
+        if listener:
+            listener.stop()
+
 
 if __name__ == "__main__":
     main()
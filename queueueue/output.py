@@ -0,0 +1,111 @@
+import asyncio
+import os
+from collections import deque
+from typing import Deque, List, Optional, Tuple
+
+
+class OutputBuffer:
+    # Keeps the last ``limit`` bytes of a task output stream as a ring of
+    # appended chunks addressed by absolute offsets. With a spill path
+    # every chunk is also appended to a file, so older output stays
+    # readable after it drops out of memory.
+
+    read_block = 65536
+
+    def __init__(self, limit: int = 65536, spill_path: Optional[str] = None) -> None:
+        self.limit = limit
+        self.chunks = deque()  # type: Deque[Tuple[int, bytes]]
+        self.start = 0
+        self.end = 0
+        self.closed = False
+        self.spill_path = spill_path
+        self._spill = open(spill_path, "ab") if spill_path else None
+        self._waiters = []  # type: List[asyncio.Future]
+
+    def append(self, data: bytes):
+        if self.closed:
+            raise ValueError("Output is closed")
+
+        if self._spill is not None:
+            self._spill.write(data)
+
+        offset = self.end
+        self.end += len(data)
+
+        if len(data) > self.limit:
+            # Only the tail of an oversized chunk is kept
+            self.chunks.clear()
+            offset, data = self.end - self.limit, data[-self.limit:]
+
+        self.chunks.append((offset, data))
+        while self.end - self.chunks[0][0] > self.limit:
+            offset, data = self.chunks[0]
+            excess = self.end - self.limit - offset
+            if excess < len(data):
+                self.chunks[0] = (offset + excess, data[excess:])
+            else:
+                self.chunks.popleft()
+        self.start = self.chunks[0][0]
+
+        self._wake()
+
+    def read(self, offset: int) -> Tuple[int, List[bytes]]:
+        # Returns the offset the data actually starts at and chunks that
+        # share memory with the buffer instead of a joined copy.
+        if offset < self.start and self._spill is not None:
+            if not self._spill.closed:
+                self._spill.flush()
+            with open(self.spill_path, "rb") as spill:
+                spill.seek(offset)
+                return offset, [spill.read(min(self.read_block, self.start - offset))]
+
+        offset = max(offset, self.start)
+        chunks = []
+
+        for chunk_offset, data in reversed(self.chunks):
+            if chunk_offset + len(data) <= offset:
+                break
+            chunks.append(memoryview(data)[max(offset - chunk_offset, 0):])
+
+        chunks.reverse()
+        return offset, chunks
+
+    @property
+    def text(self) -> str:
+        return b"".join(data for _, data in self.chunks).decode(errors="replace")
+
+    async def wait(self, offset: int):
+        if self.closed or self.end > offset:
+            return
+
+        waiter = asyncio.get_event_loop().create_future()
+        self._waiters.append(waiter)
+        await waiter
+
+    def _wake(self):
+        waiters, self._waiters = self._waiters, []
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+
+    def close(self):
+        if self.closed:
+            return
+
+        self.closed = True
+        if self._spill is not None:
+            self._spill.close()
+        self._wake()
+
+    def delete(self):
+        # Closes the buffer and removes its spill file, later reads only
+        # see what is still in memory
+        self.close()
+
+        if self.spill_path is not None:
+            try:
+                os.unlink(self.spill_path)
+            except FileNotFoundError:
+                pass
+            self.spill_path = None
+            self._spill = None
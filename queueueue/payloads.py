@@ -0,0 +1,52 @@
+import hashlib
+import json
+from typing import Any, Dict, List, Tuple
+
+
+def payload_digest(value: Any) -> Tuple[str, int]:
+    encoded = json.dumps(value, sort_keys=True, default=str).encode()
+    return hashlib.sha1(encoded).hexdigest(), len(encoded)
+
+
+class PayloadStore:
+    # Identical args/kwargs of queued tasks share a single object, kept
+    # here by digest for as long as some task references it.
+
+    def __init__(self) -> None:
+        self._payloads = {}  # type: Dict[str, List[Any]]
+        self.size = 0
+
+    def __len__(self) -> int:
+        return len(self._payloads)
+
+    def __contains__(self, digest: str) -> bool:
+        return digest in self._payloads
+
+    def intern(self, digest: str, size: int, value: Any) -> Any:
+        entry = self._payloads.get(digest)
+        if entry is None:
+            entry = self._payloads[digest] = [value, size, 0]
+            self.size += size
+
+        entry[2] += 1
+        return entry[0]
+
+    def release(self, digest: str):
+        entry = self._payloads.get(digest)
+        if entry is None:
+            return
+
+        entry[2] -= 1
+        if not entry[2]:
+            del self._payloads[digest]
+            self.size -= entry[1]
+
+    def refcount(self, digest: str) -> int:
+        entry = self._payloads.get(digest)
+        return entry[2] if entry else 0
+
+    def for_json(self) -> Dict[str, int]:
+        return {
+            "count": len(self._payloads),
+            "size": self.size
+        }
@@ -9,11 +9,36 @@ if TYPE_CHECKING:  # pragma: no cover
 def setup_routes(app: "web.Application"):
     app.router.add_route('GET', '/task', views.list_tasks)
     app.router.add_route('GET', '/task/taken', views.list_taken_tasks)
+    app.router.add_route('GET', '/task/delayed', views.list_delayed_tasks)
+    app.router.add_route('GET', '/task/blocked', views.list_blocked_tasks)
+    app.router.add_route('GET', '/task/stream', views.stream_tasks)
     app.router.add_route('POST', '/task', views.add_task)
 
     app.router.add_route('PATCH', '/task/pending', views.get_task)
 
+    app.router.add_route('POST', '/task/{task_id}/output/{stream}', views.append_output)
+    app.router.add_route('GET', '/task/{task_id}/output/{stream}', views.read_output)
+
     app.router.add_route('DELETE', '/task/{task_id}', views.delete_task)
     app.router.add_route('PATCH', '/task/{task_id}', views.complete_task)
 
+    app.router.add_route('GET', '/group/{group}', views.get_group)
+    app.router.add_route('PATCH', '/group/{group}', views.seal_group)
+
+    app.router.add_route('GET', '/session', views.list_sessions)
+    app.router.add_route('PATCH', '/session/{session}', views.heartbeat_session)
+    app.router.add_route('DELETE', '/session/{session}', views.end_session)
+
     app.router.add_route('GET', '/lock', views.list_locks)
+    app.router.add_route('GET', '/summary', views.summary)
+
+    app.router.add_route('GET', '/admin/instrumentation', views.get_instrumentation)
+    app.router.add_route('POST', '/admin/instrumentation', views.enable_instrumentation)
+    app.router.add_route('DELETE', '/admin/instrumentation', views.disable_instrumentation)
+    app.router.add_route('GET', '/admin/trace', views.get_trace)
+    app.router.add_route('POST', '/admin/trace', views.start_trace)
+    app.router.add_route('DELETE', '/admin/trace', views.stop_trace)
+    app.router.add_route('POST', '/admin/profile', views.start_profile)
+    app.router.add_route('DELETE', '/admin/profile', views.stop_profile)
+    app.router.add_route('GET', '/admin/snapshot', views.export_snapshot)
+    app.router.add_route('POST', '/admin/snapshot', views.import_snapshot)
@@ -0,0 +1,92 @@
+import asyncio
+import os
+import signal
+import tempfile
+from typing import Optional
+
+from aiohttp import web
+from aiohttp.log import access_logger
+
+from .acceptor import ProxyHeaderProtocol, start_acceptors
+
+
+class ProxiedUnixSite(web.UnixSite):
+    # Owner socket of the acceptors, which announce each client with a
+    # PROXY header so the real client address reaches the handlers
+
+    async def start(self) -> None:
+        await web.BaseSite.start(self)
+        loop = asyncio.get_event_loop()
+        server = self._runner.server
+        self._server = await loop.create_unix_server(
+            lambda: ProxyHeaderProtocol(server), self._path, ssl=self._ssl_context, backlog=self._backlog)
+
+
+async def start_server(app: web.Application,
+                       host: Optional[str] = None,
+                       port: Optional[int] = None,
+                       path: Optional[str] = None,
+                       backlog: int = 128,
+                       keepalive_timeout: float = 75.0,
+                       reuse_port: bool = False,
+                       proxied: bool = False,
+                       access_log=access_logger) -> web.AppRunner:
+    runner = web.AppRunner(app, access_log=access_log, keepalive_timeout=keepalive_timeout)
+    await runner.setup()
+
+    if path:
+        site = ProxiedUnixSite if proxied else web.UnixSite
+        await site(runner, path, backlog=backlog).start()
+
+    if port or not path:
+        await web.TCPSite(runner, host, port or 8080, backlog=backlog, reuse_port=reuse_port).start()
+
+    return runner
+
+
+def run_server(app: web.Application,
+               host: Optional[str] = None,
+               port: Optional[int] = None,
+               path: Optional[str] = None,
+               backlog: int = 128,
+               keepalive_timeout: float = 75.0,
+               acceptors: int = 0,
+               access_log=access_logger):
+    loop = asyncio.get_event_loop()
+    processes = []
+    tmp_dir = None
+
+    if acceptors:
+        # The owner only listens on a Unix socket, acceptor processes
+        # share the TCP port through SO_REUSEPORT and relay to it.
+        if not path:
+            tmp_dir = tempfile.mkdtemp(prefix="queueueue-")
+            path = os.path.join(tmp_dir, "owner.sock")
+
+        runner = loop.run_until_complete(start_server(
+            app, path=path, backlog=backlog, keepalive_timeout=keepalive_timeout, proxied=True,
+            access_log=access_log))
+        processes = start_acceptors(acceptors, host or "0.0.0.0", port or 8080, path, backlog)
+    else:
+        runner = loop.run_until_complete(start_server(
+            app, host=host, port=port, path=path, backlog=backlog,
+            keepalive_timeout=keepalive_timeout, access_log=access_log))
+
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, loop.stop)
+
+    for address in runner.addresses:
+        print("======== Running on {} ========".format(address))
+
+    try:
+        loop.run_forever()
+    finally:
+        for process in processes:
+            process.terminate()
+            process.join()
+
+        loop.run_until_complete(runner.cleanup())
+
+        if tmp_dir:
+            os.unlink(path)
+            os.rmdir(tmp_dir)
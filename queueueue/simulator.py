@@ -0,0 +1,212 @@
+import argparse
+import heapq
+import itertools
+import json
+import time
+from collections import defaultdict
+from typing import Any, DefaultDict, Dict, Iterable, List, Optional, Tuple
+
+from .taskqueue import MultiLockPriorityPoolQueue, Task
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def read_trace(path: str) -> Iterable[List[Any]]:
+    with open(path) as trace:
+        for line in trace:
+            if line.strip():
+                yield json.loads(line)
+
+
+class Simulation:
+    # Replays recorded arrivals and removals against a fresh queue on a
+    # virtual clock. Each attempt of a task runs for as long as it did
+    # when recorded; the worker fleet per pool is what gets varied.
+
+    def __init__(self,
+                 trace: Iterable[List[Any]],
+                 workers: Optional[Dict[str, int]] = None,
+                 ignore_locks: bool = False,
+                 default_duration: Optional[float] = None) -> None:
+        self.arrivals = []  # type: List[List[Any]]
+        self.removals = []  # type: List[Tuple[float, str]]
+        self.attempts = defaultdict(list)  # type: DefaultDict[str, List[Tuple[float, Any]]]
+        self.ignore_locks = ignore_locks
+
+        taken = {}  # type: Dict[str, float]
+        active = defaultdict(int)  # type: DefaultDict[str, int]
+        observed = defaultdict(int)  # type: DefaultDict[str, int]
+        pools = {}  # type: Dict[str, str]
+
+        for record in trace:
+            at, operation, task_id = record[0], record[1], record[2]
+
+            if operation == "put":
+                self.arrivals.append(record)
+                pools[task_id] = record[3]
+            elif operation == "get":
+                taken[task_id] = at
+                active[record[3]] += 1
+                observed[record[3]] = max(observed[record[3]], active[record[3]])
+            elif operation == "complete" and task_id in taken:
+                self.attempts[task_id].append((at - taken.pop(task_id), record[3]))
+                active[pools.get(task_id)] -= 1
+            elif operation == "remove":
+                self.removals.append((at, task_id))
+                if task_id in taken:
+                    del taken[task_id]
+                    active[pools.get(task_id)] -= 1
+
+        durations = [duration for attempts in self.attempts.values() for duration, _ in attempts]
+        self.default_duration = default_duration if default_duration is not None else percentile(durations, 0.5)
+
+        self.workers = dict(observed)
+        self.workers.update(workers or {})
+
+    def run(self) -> Dict[str, Any]:
+        started = time.perf_counter()
+        queue = MultiLockPriorityPoolQueue()
+
+        counter = itertools.count()
+        events = []  # type: List[Tuple[float, int, str, Any]]
+        for record in self.arrivals:
+            events.append((record[0], next(counter), "put", record))
+        for at, task_id in self.removals:
+            events.append((at, next(counter), "remove", task_id))
+        heapq.heapify(events)
+
+        idle = {pool: count for pool, count in self.workers.items()}
+        ready = {}  # type: Dict[str, float]
+        running = {}  # type: Dict[str, Tuple[int, str]]
+        waits = defaultdict(list)  # type: DefaultDict[str, List[float]]
+        completed = defaultdict(int)  # type: DefaultDict[str, int]
+        failed = removed = processed = 0
+        now = 0.0
+
+        while events:
+            now, _, kind, data = heapq.heappop(events)
+            processed += 1
+
+            if kind == "put":
+                _, _, task_id, pool, name, locks = data
+                attempts = len(self.attempts.get(task_id, ())) or 1
+                ready[task_id] = now
+                queue.put(Task(
+                    name, [] if self.ignore_locks else locks, pool, [], {},
+                    id=task_id, max_retries=attempts - 1, retry_delay=0))
+
+            elif kind == "remove":
+                try:
+                    queue.safe_remove(data)
+                    removed += 1
+                except LookupError:
+                    continue
+
+                if data in running:
+                    # The pending "done" event of this task is skipped
+                    _, pool = running.pop(data)
+                    idle[pool] += 1
+
+            elif kind == "done":
+                task_id, pool, status, attempt = data
+                if running.get(task_id) != (attempt, pool):
+                    continue
+
+                del running[task_id]
+                idle[pool] += 1
+                task = queue.complete(task_id, {"status": status})
+
+                if task.completed.is_set():
+                    completed[pool] += 1
+                    if status == "failed":
+                        failed += 1
+                else:
+                    # Retries are replayed without their delay
+                    ready[task_id] = now
+                    queue.expire()
+
+            for pool, count in idle.items():
+                while count and queue.queued_count(pool):
+                    task = queue.get(pool)
+                    if task is None:
+                        break
+
+                    task_id = task.id.hex
+                    attempts = self.attempts.get(task_id, ())
+                    attempt = task.retries
+                    if attempt < len(attempts):
+                        duration, status = attempts[attempt]
+                    else:
+                        duration, status = self.default_duration, "success"
+
+                    count -= 1
+                    running[task_id] = (attempt, pool)
+                    waits[pool].append(now - ready.pop(task_id))
+                    heapq.heappush(events, (now + duration, next(counter), "done", (task_id, pool, status, attempt)))
+
+                idle[pool] = count
+
+        all_waits = [wait for pool_waits in waits.values() for wait in pool_waits]
+        total = sum(completed.values())
+
+        return {
+            "tasks": len(self.arrivals),
+            "completed": total,
+            "failed": failed,
+            "removed": removed,
+            "unfinished": len(queue) + len(queue.tasks_delayed) + len(queue.tasks_blocked),
+            "makespan": now,
+            "throughput": total / now if now else 0.0,
+            "wait_p50": percentile(all_waits, 0.5),
+            "wait_p99": percentile(all_waits, 0.99),
+            "wait_max": max(all_waits, default=0.0),
+            "events": processed,
+            "wall_seconds": time.perf_counter() - started,
+            "pools": {
+                pool: {
+                    "workers": workers,
+                    "completed": completed[pool],
+                    "wait_p50": percentile(waits[pool], 0.5),
+                    "wait_p99": percentile(waits[pool], 0.99)
+                }
+                for pool, workers in sorted(self.workers.items())
+            }
+        }
+
+
+def main():
+    from .main import parse_pool_limits
+
+    parser = argparse.ArgumentParser(prog="queueueue.simulator")
+    parser.add_argument("trace", help="trace file recorded with --trace or POST /admin/trace")
+    parser.add_argument(
+        "--workers",
+        help="Workers serving a pool as POOL=N, defaults to the concurrency seen in the trace",
+        action="append", default=[]
+    )
+    parser.add_argument("--ignore-locks", help="Replay tasks without their locks", action="store_true")
+    parser.add_argument(
+        "--default-duration",
+        help="Run time of tasks that never finished in the trace, defaults to the median",
+        type=float
+    )
+
+    args = parser.parse_args()
+
+    simulation = Simulation(
+        read_trace(args.trace),
+        workers=parse_pool_limits(parser, args.workers),
+        ignore_locks=args.ignore_locks,
+        default_duration=args.default_duration
+    )
+    print(json.dumps(simulation.run(), indent=2, sort_keys=True))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+import json
+import os
+import uuid
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+
+class SpillSegment:
+    # Append-only NDJSON file holding the tail of a single pool. Records
+    # are read back in the order they were written; records of tasks
+    # removed in the meantime are skipped by the queue.
+
+    def __init__(self, directory: str) -> None:
+        self.path = os.path.join(directory, "{}.ndjson".format(uuid.uuid4().hex))
+        self._writer = open(self.path, "ab")
+        self._reader = open(self.path, "rb")
+        self.write_offset = 0
+        self.read_offset = 0
+        self.pending = 0
+        self.closed = False
+
+    @property
+    def exhausted(self) -> bool:
+        return self.read_offset >= self.write_offset
+
+    def append(self, record: Dict[str, Any]) -> int:
+        offset = self.write_offset
+        line = json.dumps(record).encode() + b"\n"
+
+        self._writer.write(line)
+        self.write_offset += len(line)
+        self.pending += 1
+
+        return offset
+
+    def read_at(self, offset: int) -> Dict[str, Any]:
+        self._writer.flush()
+        self._reader.seek(offset)
+        return json.loads(self._reader.readline())
+
+    def read_next(self) -> Optional[Tuple[int, Dict[str, Any]]]:
+        if self.exhausted:
+            return None
+
+        self._writer.flush()
+        self._reader.seek(self.read_offset)
+        line = self._reader.readline()
+
+        offset = self.read_offset
+        self.read_offset += len(line)
+
+        return (offset, json.loads(line))
+
+    def iter_unread(self) -> Iterator[Tuple[int, Dict[str, Any]]]:
+        self._writer.flush()
+        end = self.write_offset
+
+        with open(self.path, "rb") as reader:
+            reader.seek(self.read_offset)
+            offset = self.read_offset
+
+            while offset < end:
+                line = reader.readline()
+                yield (offset, json.loads(line))
+                offset += len(line)
+
+    def close(self):
+        self.closed = True
+        self._writer.close()
+        self._reader.close()
+
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:  # pragma: no cover
+            pass
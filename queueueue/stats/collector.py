@@ -1,10 +1,20 @@
+import time
 from collections import defaultdict
-from typing import DefaultDict, Iterable, Tuple
+from typing import TYPE_CHECKING, DefaultDict, Dict, Iterable, List, Optional, Tuple
+
+from .window import EWMA_ALPHA, RollingCounter, ewma
+
+if TYPE_CHECKING:  # pragma: no cover
+    from queueueue.taskqueue import MultiLockPriorityPoolQueue, Task
 
 
 class StatCollector:
 
-    def __init__(self) -> None:
+    ewma_alpha = EWMA_ALPHA
+
+    def __init__(self, queue: Optional["MultiLockPriorityPoolQueue"] = None) -> None:
+        self.queue = queue
+
         self.tasks_received_total: int = 0
         self.tasks_received: DefaultDict[str, int] = defaultdict(int)
 
@@ -17,27 +27,162 @@ class StatCollector:
         self.tasks_duplicates_total: int = 0
         self.tasks_duplicates: DefaultDict[str, int] = defaultdict(int)
 
+        self.tasks_retried_total: int = 0
+        self.tasks_retried: DefaultDict[str, int] = defaultdict(int)
+
+        self.tasks_dead_lettered_total: int = 0
+        self.tasks_dead_lettered: DefaultDict[str, int] = defaultdict(int)
+
+        self.tasks_expired_total: int = 0
+        self.tasks_expired: DefaultDict[str, int] = defaultdict(int)
+
+        self.tasks_rejected_total: int = 0
+        self.tasks_rejected: DefaultDict[str, int] = defaultdict(int)
+
+        self.tasks_lost_total: int = 0
+        self.tasks_lost: DefaultDict[str, int] = defaultdict(int)
+
+        self.tasks_shed_total: int = 0
+        self.tasks_shed: DefaultDict[str, int] = defaultdict(int)
+
+        self.deadline_missed_total: int = 0
+        self.deadline_missed: DefaultDict[str, int] = defaultdict(int)
+
+        self.worker_taken: DefaultDict[str, int] = defaultdict(int)
+        self.worker_finished: DefaultDict[str, int] = defaultdict(int)
+
         self.tasks_queued_total: int = 0
 
+        self.tasks_received_window_total = RollingCounter()
+        self.tasks_received_window: Dict[str, RollingCounter] = {}
+
+        self.tasks_completed_window_total = RollingCounter()
+        self.tasks_completed_window: Dict[str, RollingCounter] = {}
+
+        self.tasks_duplicates_window_total = RollingCounter()
+        self.tasks_duplicates_window: Dict[str, RollingCounter] = {}
+
+        self.task_processing_ewma_total: Optional[float] = None
+        self.task_processing_ewma: Dict[str, float] = {}
+
+    @staticmethod
+    def _push_window(total: RollingCounter, windows: Dict[str, RollingCounter], pool: str) -> None:
+        now = time.monotonic()
+        total.add(now=now)
+
+        window = windows.get(pool)
+        if window is None:
+            window = windows[pool] = RollingCounter()
+        window.add(now=now)
+
     def push_task_received(self, pool: str) -> None:
         self.tasks_received_total += 1
         self.tasks_received[pool] += 1
+        self._push_window(self.tasks_received_window_total, self.tasks_received_window, pool)
 
     def push_task_completed(self, pool: str) -> None:
         self.tasks_completed_total += 1
         self.tasks_completed[pool] += 1
+        self._push_window(self.tasks_completed_window_total, self.tasks_completed_window, pool)
+
+    def push_task_run_time(self, pool: str, seconds: float) -> None:
+        alpha = self.ewma_alpha
+        self.task_processing_ewma_total = ewma(self.task_processing_ewma_total, seconds, alpha)
+        self.task_processing_ewma[pool] = ewma(self.task_processing_ewma.get(pool), seconds, alpha)
 
     def push_task_processing(self, pool: str, seconds: int) -> None:
         self.tasks_processing_total += seconds
         self.tasks_processing[pool] += seconds
 
+    def push_task_taken(self, task: "Task") -> None:
+        if task.session is not None:
+            self.worker_taken[task.session] += 1
+
+    def push_task_finished(self, task: "Task") -> None:
+        if task.session is not None:
+            self.worker_finished[task.session] += 1
+
+        if not task.completed.is_set():
+            self.push_task_retried(task.pool)
+            return
+
+        if task.dead_lettered:
+            self.push_task_dead_lettered(task.pool)
+
+        self.push_task_completed(task.pool)
+
+        if task.deadline is not None and task.finished is not None and task.finished > task.deadline:
+            self.push_deadline_missed(task.pool)
+
+        self.push_task_processing(task.pool, task.processing_duration)
+
+        if task.taken is not None and task.finished is not None:
+            self.push_task_run_time(task.pool, (task.finished - task.taken).total_seconds())
+
     def push_task_duplicate(self, pool: str) -> None:
         self.tasks_duplicates_total += 1
         self.tasks_duplicates[pool] += 1
+        self._push_window(self.tasks_duplicates_window_total, self.tasks_duplicates_window, pool)
+
+    def push_task_retried(self, pool: str) -> None:
+        self.tasks_retried_total += 1
+        self.tasks_retried[pool] += 1
+
+    def push_task_dead_lettered(self, pool: str) -> None:
+        self.tasks_dead_lettered_total += 1
+        self.tasks_dead_lettered[pool] += 1
+
+    def push_task_expired(self, pool: str) -> None:
+        self.tasks_expired_total += 1
+        self.tasks_expired[pool] += 1
+
+    def push_task_rejected(self, pool: str) -> None:
+        self.tasks_rejected_total += 1
+        self.tasks_rejected[pool] += 1
+
+    def push_task_shed(self, pool: str) -> None:
+        self.tasks_shed_total += 1
+        self.tasks_shed[pool] += 1
+        self.push_deadline_missed(pool)
+
+    def push_deadline_missed(self, pool: str) -> None:
+        self.deadline_missed_total += 1
+        self.deadline_missed[pool] += 1
+
+    def push_session_lost(self, session: str, tasks: List["Task"]) -> None:
+        for task in tasks:
+            self.tasks_lost_total += 1
+            self.tasks_lost[task.pool] += 1
+
+        self.worker_taken.pop(session, None)
+        self.worker_finished.pop(session, None)
 
     def set_tasks_queued(self, value: int) -> None:
         self.tasks_queued_total = value
 
+    @staticmethod
+    def _window_iter(name: str,
+                     total: RollingCounter,
+                     windows: Dict[str, RollingCounter],
+                     now: float) -> Iterable[Tuple[str, float]]:
+        for window, rate in zip(total.windows, total.rates(now)):
+            yield (f"{name}_{window // 60}m.total", rate)
+
+        idle = []
+
+        for pool, counter in windows.items():
+            pool_name = pool.replace(".", "_")
+            for window, rate in zip(counter.windows, counter.rates(now)):
+                yield (f"{name}_{window // 60}m.pool.{pool_name}", rate)
+
+            if counter.idle:
+                idle.append(pool)
+
+        # Pools idle for the whole longest window report zero once and
+        # are dropped, so iteration only covers recently active pools.
+        for pool in idle:
+            del windows[pool]
+
     def stat_iter(self) -> Iterable[Tuple[str, int]]:
         yield ("tasks_received.total", self.tasks_received_total)
 
@@ -63,4 +208,87 @@ class StatCollector:
             pool_name = pool_name.replace(".", "_")
             yield (f"tasks_duplicates.pool.{pool_name}", task_counter)
 
+        yield ("tasks_retried.total", self.tasks_retried_total)
+
+        for pool_name, task_counter in self.tasks_retried.items():
+            pool_name = pool_name.replace(".", "_")
+            yield (f"tasks_retried.pool.{pool_name}", task_counter)
+
+        yield ("tasks_dead_lettered.total", self.tasks_dead_lettered_total)
+
+        for pool_name, task_counter in self.tasks_dead_lettered.items():
+            pool_name = pool_name.replace(".", "_")
+            yield (f"tasks_dead_lettered.pool.{pool_name}", task_counter)
+
+        yield ("tasks_expired.total", self.tasks_expired_total)
+
+        for pool_name, task_counter in self.tasks_expired.items():
+            pool_name = pool_name.replace(".", "_")
+            yield (f"tasks_expired.pool.{pool_name}", task_counter)
+
+        yield ("tasks_rejected.total", self.tasks_rejected_total)
+
+        for pool_name, task_counter in self.tasks_rejected.items():
+            pool_name = pool_name.replace(".", "_")
+            yield (f"tasks_rejected.pool.{pool_name}", task_counter)
+
+        yield ("tasks_lost.total", self.tasks_lost_total)
+
+        for pool_name, task_counter in self.tasks_lost.items():
+            pool_name = pool_name.replace(".", "_")
+            yield (f"tasks_lost.pool.{pool_name}", task_counter)
+
+        yield ("tasks_shed.total", self.tasks_shed_total)
+
+        for pool_name, task_counter in self.tasks_shed.items():
+            pool_name = pool_name.replace(".", "_")
+            yield (f"tasks_shed.pool.{pool_name}", task_counter)
+
+        yield ("deadline_missed.total", self.deadline_missed_total)
+
+        for pool_name, task_counter in self.deadline_missed.items():
+            pool_name = pool_name.replace(".", "_")
+            yield (f"deadline_missed.pool.{pool_name}", task_counter)
+
+        for worker, task_counter in self.worker_taken.items():
+            worker = worker.replace(".", "_")
+            yield (f"worker_taken.worker.{worker}", task_counter)
+
+        for worker, task_counter in self.worker_finished.items():
+            worker = worker.replace(".", "_")
+            yield (f"worker_finished.worker.{worker}", task_counter)
+
         yield ("tasks_queued.total", self.tasks_queued_total)
+
+        now = time.monotonic()
+        yield from self._window_iter("tasks_received_rate", self.tasks_received_window_total,
+                                     self.tasks_received_window, now)
+        yield from self._window_iter("tasks_completed_rate", self.tasks_completed_window_total,
+                                     self.tasks_completed_window, now)
+        yield from self._window_iter("tasks_duplicates_rate", self.tasks_duplicates_window_total,
+                                     self.tasks_duplicates_window, now)
+
+        if self.task_processing_ewma_total is not None:
+            yield ("task_processing_ewma.total", self.task_processing_ewma_total)
+
+        for pool_name, value in self.task_processing_ewma.items():
+            pool_name = pool_name.replace(".", "_")
+            yield (f"task_processing_ewma.pool.{pool_name}", value)
+
+        if self.queue is None:
+            return
+
+        yield ("payloads_stored.total", len(self.queue.payloads))
+        yield ("payloads_size.total", self.queue.payloads.size)
+
+        for worker, summary in self.queue.session_summary().items():
+            worker = worker.replace(".", "_")
+            yield (f"worker_active.worker.{worker}", summary["active"])
+
+        for pool_name, summary in self.queue.pool_summary().items():
+            pool_name = pool_name.replace(".", "_")
+            yield (f"tasks_queued.pool.{pool_name}", summary["queued"])
+            yield (f"tasks_active.pool.{pool_name}", summary["active"])
+
+            if summary["oldest_queued_age"] is not None:
+                yield (f"tasks_oldest_queued_age.pool.{pool_name}", summary["oldest_queued_age"])
@@ -0,0 +1,52 @@
+import time
+from typing import List, Optional, Sequence
+
+WINDOWS = (60, 300, 900)
+EWMA_ALPHA = 0.2
+
+
+def ewma(current: Optional[float], value: float, alpha: float = EWMA_ALPHA) -> float:
+    return value if current is None else current + alpha * (value - current)
+
+
+class RollingCounter:
+    # Fixed ring of ``resolution`` second slots with a running sum per
+    # window, so adding and reading rates never walk the whole ring.
+
+    def __init__(self, windows: Sequence[int] = WINDOWS, resolution: int = 10) -> None:
+        self.windows = tuple(windows)
+        self.resolution = resolution
+        self.spans = [max(window // resolution, 1) for window in self.windows]
+        self.slots = [0] * max(self.spans)
+        self.sums = [0] * len(self.windows)
+        self.slot = None  # type: Optional[int]
+
+    def _advance(self, now: float):
+        current = int(now // self.resolution)
+        if self.slot is None or current - self.slot >= len(self.slots):
+            # Idle for longer than the largest window, nothing to keep
+            self.slots = [0] * len(self.slots)
+            self.sums = [0] * len(self.sums)
+            self.slot = current
+            return
+
+        size = len(self.slots)
+        while self.slot < current:
+            self.slot += 1
+            for index, span in enumerate(self.spans):
+                self.sums[index] -= self.slots[(self.slot - span) % size]
+            self.slots[self.slot % size] = 0
+
+    def add(self, value: int = 1, now: Optional[float] = None):
+        self._advance(time.monotonic() if now is None else now)
+        self.slots[self.slot % len(self.slots)] += value
+        for index in range(len(self.sums)):
+            self.sums[index] += value
+
+    def rates(self, now: Optional[float] = None) -> List[float]:
+        self._advance(time.monotonic() if now is None else now)
+        return [total / window for total, window in zip(self.sums, self.windows)]
+
+    @property
+    def idle(self) -> bool:
+        return not any(self.sums)
@@ -1,8 +1,107 @@
 import asyncio
+import functools
+import heapq
+import itertools
 import logging
+import math
+import os
+import random
+import re
+import time
 import uuid
-from datetime import datetime, timezone
-from typing import Any, Dict, FrozenSet, List, Optional, Set, Tuple, Iterator
+from collections import Counter, OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, FrozenSet, List, Optional, Set, Tuple, Iterator, Union
+
+from .output import OutputBuffer
+from .payloads import PayloadStore, payload_digest
+from .spill import SpillSegment
+from .stats.window import ewma
+
+
+# ISO 8601 as produced by isoformat(), also with a "Z" suffix; parsed by
+# hand since datetime.fromisoformat is missing on Python 3.6
+ISO_DATETIME = re.compile(
+    r"(\d{4})-(\d{2})-(\d{2})"
+    r"(?:[T ](\d{2}):(\d{2})(?::(\d{2})(?:\.(\d{1,6})\d*)?)?)?"
+    r"(Z|[+-]\d{2}:?\d{2})?$",
+    re.IGNORECASE)
+
+
+def parse_datetime(value: Union[str, datetime]) -> datetime:
+    if isinstance(value, str):
+        match = ISO_DATETIME.match(value.strip())
+        if match is None:
+            raise ValueError("Invalid datetime {!r}".format(value))
+
+        year, month, day, hour, minute, second, fraction, offset = match.groups()
+        tzinfo = None
+        if offset is not None and offset.upper() != "Z":
+            digits = offset[1:].replace(":", "")
+            delta = timedelta(hours=int(digits[:2]), minutes=int(digits[2:]))
+            tzinfo = timezone(-delta if offset[0] == "-" else delta)
+
+        value = datetime(
+            int(year), int(month), int(day), int(hour or 0), int(minute or 0), int(second or 0),
+            int((fraction or "0").ljust(6, "0")), tzinfo=tzinfo)
+
+    if not isinstance(value, datetime):
+        raise TypeError("Expected a datetime, got {!r}".format(value))
+
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+
+    return value
+
+
+LATEST = datetime.max.replace(tzinfo=timezone.utc)
+
+
+def observed(func: Callable) -> Callable:
+    # Reports each call to the observers of the queue as
+    #   observer.observe(operation, args, kwargs, result, error, seconds)
+    # with nothing but this check in the way while there are none.
+    operation = func.__name__
+
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        if not self.observers:
+            return func(self, *args, **kwargs)
+
+        self.last_scanned = 0
+        result = error = None
+        started = time.perf_counter()
+        try:
+            result = func(self, *args, **kwargs)
+            return result
+        except Exception as exc:
+            error = exc
+            raise
+        finally:
+            seconds = time.perf_counter() - started
+            for observer in tuple(self.observers):
+                observer.observe(operation, args, kwargs, result, error, seconds)
+
+    return wrapper
+
+
+def non_negative(name: str, value: Any, kind: Callable = float) -> Any:
+    try:
+        result = kind(value)
+    except (TypeError, ValueError):
+        raise ValueError("Invalid {} {!r}".format(name, value))
+
+    if not math.isfinite(result) or result < 0:
+        raise ValueError("Invalid {} {!r}".format(name, value))
+
+    return result
+
+
+def weighted_order(pools: List[str], weights: List[float], rng: random.Random = random) -> List[str]:
+    # Weighted random permutation: pools with larger weights tend to come
+    # first, without excluding anything from the fallback order.
+    keys = [rng.random() ** (1.0 / weight) for weight in weights]
+    return [pool for _, pool in sorted(zip(keys, pools), key=lambda entry: entry[0], reverse=True)]
 
 
 class Task(object):
@@ -14,6 +113,17 @@ class Task(object):
                  args: List[Any],
                  kwargs: Dict[str, Any],
                  status: str = "pending",
+                 max_retries: int = 0,
+                 retry_delay: float = 1.0,
+                 retry_backoff: float = 2.0,
+                 retry_max_delay: float = 300.0,
+                 dead_letter_pool: Optional[str] = None,
+                 expires_at: Optional[Union[str, datetime]] = None,
+                 ttl: Optional[float] = None,
+                 depends_on: Optional[List[str]] = None,
+                 on_parent_failure: str = "cancel",
+                 group: Optional[str] = None,
+                 deadline: Optional[Union[str, datetime]] = None,
                  **kw) -> None:
         if "id" in kw:
             self.id = uuid.UUID(kw.pop("id"))
@@ -22,18 +132,50 @@ class Task(object):
         self.name = name
         self.locks = frozenset(locks)
         self.pool = pool
+        self._args_info = None  # type: Optional[Tuple[str, int]]
+        self._kwargs_info = None  # type: Optional[Tuple[str, int]]
         self.args = args or []
         self.kwargs = kwargs or {}
         self.status = status
 
+        self.max_retries = non_negative("max_retries", max_retries, int)
+        self.retry_delay = non_negative("retry_delay", retry_delay)
+        self.retry_backoff = non_negative("retry_backoff", retry_backoff)
+        self.retry_max_delay = non_negative("retry_max_delay", retry_max_delay)
+        self.dead_letter_pool = dead_letter_pool
+        self.retries = 0
+        self.dead_lettered = False
+
         self.stdout = None
         self.stderr = None
+        self.outputs = {}  # type: Dict[str, OutputBuffer]
         self.result = None
         self.traceback = None
 
         self.created = datetime.now(timezone.utc)
         self.finished = None  # type: Optional[datetime]
         self.taken = None  # type: Optional[datetime]
+        self.queued_at = self.created
+        self.session = None  # type: Optional[str]
+
+        self.expires_at = None  # type: Optional[datetime]
+        if expires_at is not None:
+            self.expires_at = parse_datetime(expires_at)
+        elif ttl is not None:
+            self.expires_at = self.created + timedelta(seconds=ttl)
+
+        self.deadline = parse_datetime(deadline) if deadline is not None else None
+
+        if on_parent_failure not in ("cancel", "run"):
+            raise ValueError("Unknown parent failure handling {}".format(on_parent_failure))
+
+        self.depends_on = [uuid.UUID(str(parent)) for parent in depends_on or []]
+        self.on_parent_failure = on_parent_failure
+        self.waiting_on = set()  # type: Set[uuid.UUID]
+        self.group = group
+        self.watched = False
+
+        self._identity = None  # type: Optional[Tuple[str, FrozenSet[str], str]]
 
         self.completed = asyncio.Event()
 
@@ -51,9 +193,58 @@ class Task(object):
             self.kwargs == other.kwargs
         )
 
+    @property
+    def args(self) -> List[Any]:
+        return self._args
+
+    @args.setter
+    def args(self, value: List[Any]):
+        self._args = value
+        self._args_info = None
+
+    @property
+    def kwargs(self) -> Dict[str, Any]:
+        return self._kwargs
+
+    @kwargs.setter
+    def kwargs(self, value: Dict[str, Any]):
+        self._kwargs = value
+        self._kwargs_info = None
+
+    @property
+    def args_digest(self) -> str:
+        if self._args_info is None:
+            self._args_info = payload_digest(self._args)
+
+        return self._args_info[0]
+
+    @property
+    def kwargs_digest(self) -> str:
+        if self._kwargs_info is None:
+            self._kwargs_info = payload_digest(self._kwargs)
+
+        return self._kwargs_info[0]
+
+    def intern_payload(self, store: PayloadStore):
+        self._args = store.intern(self.args_digest, self._args_info[1], self._args)
+        self._kwargs = store.intern(self.kwargs_digest, self._kwargs_info[1], self._kwargs)
+
+    def release_payload(self, store: PayloadStore):
+        store.release(self.args_digest)
+        store.release(self.kwargs_digest)
+
+    def take_kwargs(self, other: "Task"):
+        self._kwargs = other._kwargs
+        self._kwargs_info = other._kwargs_info
+
     def is_equal_to(self, other: "Task", ignore_kwargs: Optional[Set[str]] = None):
-        if ignore_kwargs is None:
-            ignore_kwargs = frozenset()
+        if not ignore_kwargs:
+            return (
+                self.name == other.name and
+                self.locks == other.locks and
+                self.args_digest == other.args_digest and
+                self.kwargs_digest == other.kwargs_digest
+            )
 
         self_kwargs = set(self.kwargs.keys())
         other_kwargs = set(other.kwargs.keys())
@@ -79,6 +270,10 @@ class Task(object):
         for attr in ["stdout", "stderr", "result", "status", "traceback"]:
             if attr in data:
                 setattr(self, attr, data[attr])
+            elif attr in self.outputs:
+                setattr(self, attr, self.outputs[attr].text)
+
+        self.delete_output()
 
         self.completed.data = {
             "status": data.get("status"),
@@ -87,18 +282,60 @@ class Task(object):
         self.finished = datetime.now(timezone.utc)
         self.completed.set()
 
-    def for_json(self) -> Dict[str, Any]:
-        return {
+    def delete_output(self):
+        for output in self.outputs.values():
+            output.delete()
+
+    @property
+    def identity(self) -> Tuple[str, FrozenSet[str], str]:
+        if self._identity is None:
+            self._identity = (self.name, self.locks, self.args_digest)
+
+        return self._identity
+
+    def is_expired(self, now: datetime) -> bool:
+        return self.expires_at is not None and self.expires_at <= now
+
+    def misses_deadline(self, now: datetime, run_time: timedelta) -> bool:
+        return self.deadline is not None and self.deadline < now + run_time
+
+    @property
+    def can_retry(self) -> bool:
+        return self.retries < self.max_retries
+
+    def next_retry_delay(self) -> timedelta:
+        delay = self.retry_delay * self.retry_backoff ** self.retries
+        return timedelta(seconds=min(delay, self.retry_max_delay))
+
+    def for_json(self, payload_limit: Optional[int] = None) -> Dict[str, Any]:
+        data = {
             "id": str(self.id),
             "name": self.name,
             "locks": list(self.locks),
             "pool": self.pool,
             "args": self.args,
             "kwargs": self.kwargs,
+            "max_retries": self.max_retries,
+            "retries": self.retries,
+            "dead_letter_pool": self.dead_letter_pool,
+            "expires_at": self.expires_at.isoformat() if self.expires_at else None,
+            "deadline": self.deadline.isoformat() if self.deadline else None,
+            "depends_on": [str(parent) for parent in self.depends_on],
+            "group": self.group,
             "created": self.created.isoformat(),
             "taken": self.taken.isoformat() if self.taken else None
         }
 
+        # Payloads above the limit are replaced by their digest and size
+        if payload_limit is not None:
+            if self.args_digest and self._args_info[1] > payload_limit:
+                data.update(args=None, args_digest=self.args_digest, args_size=self._args_info[1])
+
+            if self.kwargs_digest and self._kwargs_info[1] > payload_limit:
+                data.update(kwargs=None, kwargs_digest=self.kwargs_digest, kwargs_size=self._kwargs_info[1])
+
+        return data
+
     @property
     def worker_info(self) -> Dict[str, Any]:
         return {
@@ -124,6 +361,47 @@ class Task(object):
             "traceback": self.traceback
         }
 
+    @property
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "id": str(self.id),
+            "name": self.name,
+            "locks": list(self.locks),
+            "pool": self.pool,
+            "args": self.args,
+            "kwargs": self.kwargs,
+            "status": self.status,
+            "max_retries": self.max_retries,
+            "retry_delay": self.retry_delay,
+            "retry_backoff": self.retry_backoff,
+            "retry_max_delay": self.retry_max_delay,
+            "dead_letter_pool": self.dead_letter_pool,
+            "retries": self.retries,
+            "expires_at": self.expires_at.isoformat() if self.expires_at else None,
+            "deadline": self.deadline.isoformat() if self.deadline else None,
+            "depends_on": [str(parent) for parent in self.depends_on],
+            "on_parent_failure": self.on_parent_failure,
+            "group": self.group,
+            "created": self.created.isoformat(),
+            "taken": self.taken.isoformat() if self.taken else None
+        }
+
+    @classmethod
+    def from_snapshot(cls, data: Dict[str, Any]) -> "Task":
+        data = dict(data)
+        retries = data.pop("retries", 0)
+        created = data.pop("created", None)
+        taken = data.pop("taken", None)
+
+        task = cls(**data)
+        task.retries = retries
+        if created:
+            task.created = parse_datetime(created)
+        if taken:
+            task.taken = parse_datetime(taken)
+
+        return task
+
     @property
     def processing_duration(self) -> int:
         if not self.finished:  # pragma: no cover
@@ -132,26 +410,149 @@ class Task(object):
         return int((self.finished - self.created).total_seconds())
 
 
+class TaskGroup(object):
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.counts = Counter()  # type: Counter[str]
+        self.pools = set()  # type: Set[str]
+        self.sealed = False
+        self.callback = None  # type: Optional[Task]
+        self.finished = None  # type: Optional[datetime]
+        self.completed = asyncio.Event()
+
+    @property
+    def pending(self) -> int:
+        return self.counts["queued"] + self.counts["active"]
+
+    def move(self, source: Optional[str], target: Optional[str]):
+        if source is not None:
+            self.counts[source] -= 1
+        if target is not None:
+            self.counts[target] += 1
+
+    def for_json(self) -> Dict[str, Any]:
+        return {
+            "group": self.name,
+            "queued": self.counts["queued"],
+            "active": self.counts["active"],
+            "done": self.counts["done"],
+            "failed": self.counts["failed"],
+            "sealed": self.sealed,
+            "finished": self.finished.isoformat() if self.finished else None,
+            "callback": str(self.callback.id) if self.callback else None
+        }
+
+
 class MultiLockPriorityPoolQueue(object):
 
-    def __init__(self):
+    finished_groups_limit = 1000
+    spill_segment_size = 4 * 1024 * 1024
+
+    def __init__(self,
+                 spill_dir: Optional[str] = None,
+                 spill_threshold: Optional[int] = None,
+                 session_timeout: float = 30.0,
+                 session_requeue: bool = True,
+                 output_limit: int = 65536,
+                 output_dir: Optional[str] = None,
+                 lock_reserve_after: Optional[float] = None,
+                 edf_pools: Optional[List[str]] = None):
         self._locks = {}  # type: Dict[str, Tuple[Task, datetime]]
-        self._tasks = []  # type: List[Task]
+        self._tasks = OrderedDict()  # type: OrderedDict[uuid.UUID, Task]
+        self._pools = {}  # type: Dict[str, OrderedDict[uuid.UUID, Task]]
+        self._pools_active = Counter()  # type: Counter[str]
+        self._lock_waiters = {}  # type: Dict[str, OrderedDict[uuid.UUID, Task]]
+        self._reservations = {}  # type: Dict[str, Task]
+        self._delayed = []  # type: List[Tuple[datetime, int, Task]]
+        self._delayed_tasks = {}  # type: Dict[uuid.UUID, Task]
+        self._expiry = []  # type: List[Tuple[datetime, int, Task]]
+        self._expired = []  # type: List[Task]
+        self._heap_counter = itertools.count()
         self._active_tasks = {}  # type: Dict[uuid.UUID, Task]
+        self._identities = {}  # type: Dict[Tuple[str, FrozenSet[str], str], OrderedDict[uuid.UUID, Task]]
+        self.payloads = PayloadStore()
         self._logger = logging.getLogger("Queue")
 
+        # With spilling enabled each pool keeps at most ``spill_threshold``
+        # queued tasks in memory, the rest of it is written to segment
+        # files, oldest first. Writing moves on to a new segment once the
+        # last one reaches ``spill_segment_size`` bytes, and segments are
+        # deleted once nothing in them is pending. Spilled tasks are
+        # tracked by id and identity hash only.
+        self.spill_dir = spill_dir
+        self.spill_threshold = spill_threshold if spill_dir else None
+        self._segments = {}  # type: Dict[str, List[SpillSegment]]
+        self._spilled = {}  # type: Dict[uuid.UUID, Tuple[str, SpillSegment, int]]
+        self._spilled_identities = {}  # type: Dict[int, Dict[uuid.UUID, None]]
+        self._materialized = {}  # type: Dict[uuid.UUID, Task]
+
+        # Tasks waiting for their parents stay out of the pools entirely;
+        # finishing a parent only visits its own direct dependents.
+        self._blocked = OrderedDict()  # type: OrderedDict[uuid.UUID, Task]
+        self._dependents = {}  # type: Dict[uuid.UUID, List[Task]]
+
+        # Worker sessions ordered by deadline: every heartbeat pushes a
+        # session to the end, so expiry stops at the first live one.
+        self.session_timeout = session_timeout
+        self.session_requeue = session_requeue
+        self._sessions = OrderedDict()  # type: OrderedDict[str, datetime]
+        self._session_tasks = {}  # type: Dict[str, OrderedDict[uuid.UUID, Task]]
+
+        # Groups finish once sealed with no queued or active task left;
+        # the most recently finished ones are kept for status queries.
+        self._groups = {}  # type: Dict[str, TaskGroup]
+        self._finished_groups = OrderedDict()  # type: OrderedDict[str, TaskGroup]
+
+        # A task queued for longer than ``lock_reserve_after`` seconds
+        # reserves all of its locks, held or free, so tasks needing only a
+        # part of them can no longer overtake it. Older tasks may take
+        # over reservations of younger ones.
+        self.lock_reserve_after = lock_reserve_after
+
+        # Pools dispatching by earliest deadline instead of arrival keep a
+        # heap per pool next to their FIFO. Entries of dispatched tasks are
+        # left behind and skipped. Tasks that cannot finish in time given
+        # the pool's average run time are shed without being dispatched.
+        self.edf_pools = frozenset(edf_pools or ())
+        self._deadlines = {}  # type: Dict[str, List[Tuple[datetime, int, Task]]]
+        self._run_times = {}  # type: Dict[str, float]
+        self._missed = []  # type: List[Task]
+
+        # Output appended by workers while tasks run, optionally also
+        # written in full to a file per task and stream
+        self.output_limit = output_limit
+        self.output_dir = output_dir
+
+        # Long-polling workers, woken one per newly available task
+        self._waiters = {}  # type: Dict[str, OrderedDict[asyncio.Future, None]]
+
+        # Candidates examined by the last put or get call
+        self.last_scanned = 0
+
+        # Instrumentation and trace recording, see ``observed``
+        self.observers = []  # type: List[Any]
+
     @property
     def task_count(self) -> int:
         return len(self._tasks)
 
     @property
     def tasks(self) -> Tuple[Task, ...]:
-        return tuple(self._tasks)
+        return tuple(self._tasks.values())
 
     @property
     def tasks_taken(self) -> Tuple[Task, ...]:
         return tuple(self._active_tasks.values())
 
+    @property
+    def tasks_delayed(self) -> Tuple[Task, ...]:
+        return tuple(task for _, _, task in sorted(self._delayed))
+
+    @property
+    def tasks_blocked(self) -> Tuple[Task, ...]:
+        return tuple(self._blocked.values())
+
     @property
     def locks(self) -> FrozenSet[str]:
         return frozenset(self._locks)
@@ -163,84 +564,926 @@ class MultiLockPriorityPoolQueue(object):
 
     @property
     def tasks_pending(self) -> Tuple[uuid.UUID, ...]:
-        return tuple(task.id for task in self._tasks)
+        return tuple(self._tasks.keys())
 
     @property
     def tasks_active(self) -> Tuple[uuid.UUID, ...]:
         return tuple(self._active_tasks.keys())
 
+    def queued_count(self, pool: str) -> int:
+        spilled = sum(segment.pending for segment in self._segments.get(pool, ()))
+        return len(self._pools.get(pool, ())) + spilled
+
+    def lock_summary(self) -> Dict[str, Dict[str, Any]]:
+        return {
+            str(lock): {
+                "waiters": len(self._lock_waiters.get(lock, ())),
+                "taken": lock in self._locks,
+                "reserved": str(self._reservations[lock].id) if lock in self._reservations else None
+            }
+            for lock in set(self._lock_waiters).union(self._locks)
+        }
+
+    def session_summary(self, now: Optional[datetime] = None) -> Dict[str, Dict[str, Any]]:
+        if now is None:
+            now = datetime.now(timezone.utc)
+
+        return {
+            session: {
+                "active": len(self._session_tasks.get(session, ())),
+                "expires_in": (deadline - now).total_seconds()
+            }
+            for session, deadline in self._sessions.items()
+        }
+
+    def session_tasks(self, session: str) -> Tuple[Task, ...]:
+        return tuple(self._session_tasks.get(session, {}).values())
+
+    def pool_summary(self, now: Optional[datetime] = None) -> Dict[str, Dict[str, Any]]:
+        if now is None:
+            now = datetime.now(timezone.utc)
+
+        summary = {}
+
+        for pool in set(self._pools).union(self._pools_active, self._segments):
+            queued = self._pools.get(pool)
+            oldest = next(iter(queued.values())).created if queued else None
+
+            summary[pool] = {
+                "queued": self.queued_count(pool),
+                "active": self._pools_active[pool],
+                "oldest_queued_age": (now - oldest).total_seconds() if oldest else None
+            }
+
+        return summary
+
     def __len__(self) -> int:
-        return len(self._tasks)
+        return len(self._tasks) + len(self._spilled)
+
+    def iter_snapshot(self) -> Iterator[Tuple[str, Task, Optional[datetime]]]:
+        # Only task references are copied up front; callers serialize them
+        # one by one while the queue keeps changing.
+        active = tuple(self._active_tasks.values())
+        queued = tuple(self._tasks.values())
+        delayed = tuple(self._delayed)
+        blocked = tuple(self._blocked.values())
+
+        for task in active:
+            yield ("active", task, None)
+
+        for task in queued:
+            yield ("queued", task, None)
+
+        for task in self._iter_spilled():
+            yield ("queued", task, None)
 
+        for ready_at, _, task in delayed:
+            yield ("delayed", task, ready_at)
+
+        for task in blocked:
+            yield ("blocked", task, None)
+
+    def _iter_spilled(self) -> Iterator[Task]:
+        for pool, segments in list(self._segments.items()):
+            for segment in list(segments):
+                if segment.closed:
+                    continue
+
+                for offset, record in segment.iter_unread():
+                    task_id = uuid.UUID(record["task"]["id"])
+
+                    if self._spilled.get(task_id) == (pool, segment, offset):
+                        yield self._materialized.get(task_id) or Task.from_snapshot(record["task"])
+
+    def iter_queued(self) -> Iterator[Task]:
+        # Queued tasks in memory followed by the spilled ones, which are
+        # read back from their segments on the way
+        yield from tuple(self._tasks.values())
+        yield from self._iter_spilled()
+
+    def watch(self, task: Task):
+        # Callers waiting for completion hold on to this very object, so
+        # it has to outlive spilling instead of being read back later.
+        task.watched = True
+        if task.id in self._spilled:
+            self._materialized[task.id] = task
+
+    def restore(self, state: str, task: Task, ready_at: Optional[datetime] = None):
+        if self._is_pending(task.id):
+            raise ValueError("Task {} already exists".format(task.id))
+        if state not in ("active", "delayed", "queued", "blocked"):
+            raise ValueError("Unknown task state {}".format(state))
+        if state == "active" and not task.locks.isdisjoint(self._locks):
+            raise ValueError("Locks of task {} are already taken".format(task.id))
+
+        task.intern_payload(self.payloads)
+
+        self._move_group(self._task_group(task, create=True), None, "active" if state == "active" else "queued")
+
+        if state == "active":
+            self._activate(task, task.taken or datetime.now(timezone.utc))
+        elif state == "delayed":
+            self._delay(task, ready_at or datetime.now(timezone.utc))
+        elif state == "queued":
+            self._add(task)
+        elif not self._block(task):
+            self._add(task)
+
+    def find(self, task_id: str) -> Task:
+        _task_id = uuid.UUID(task_id)
+        task = self._active_tasks.get(_task_id) or self._tasks.get(_task_id)
+
+        if task is None and _task_id in self._spilled:
+            task = self._load_spilled(_task_id)
+
+        if task is None:
+            task = self._delayed_tasks.get(_task_id) or self._blocked.get(_task_id)
+
+        if task is None:
+            raise LookupError
+
+        return task
+
+    @observed
     def put(self,
             task: Task,
             unique: bool = False,
-            unique_ignore_kwargs: Optional[Set[str]] = None) -> bool:
-        if unique:
-            for e_task in self._tasks:
+            unique_ignore_kwargs: Optional[Set[str]] = None,
+            replace: bool = False) -> Task:
+        # Returns the task that will carry out the work: either the given
+        # one or, for a unique duplicate, the already waiting task, so
+        # callers can attach to its completion.
+        task.intern_payload(self.payloads)
+        similar = self._identities.get(task.identity)
+        self.last_scanned = 0
+
+        if replace and similar:
+            e_task = next(iter(similar.values()))
+            self.payloads.release(e_task.kwargs_digest)
+            self.payloads.release(task.args_digest)
+            e_task.take_kwargs(task)
+            self._log_event("replace", "Task %s replaced payload of %s", e_task, task)
+            return e_task
+
+        if unique and similar:
+            for self.last_scanned, e_task in enumerate(similar.values(), 1):
                 if e_task.is_equal_to(task, unique_ignore_kwargs):
-                    self._logger.info("Task %s not unique", repr(task))
-                    return False
+                    task.release_payload(self.payloads)
+                    self._log_event("duplicate", "Task %s coalesced with duplicate %s", e_task, task)
+                    return e_task
 
-        self._logger.info("Queued task %s", repr(task))
-        self._tasks.append(task)
+        if (unique or replace) and self._spilled:
+            for e_task in self._spilled_similar(task):
+                if replace or e_task.is_equal_to(task, unique_ignore_kwargs):
+                    # A replaced payload only exists on this object, which
+                    # is kept for paging the task back in. Waiters keep
+                    # theirs through watch().
+                    if replace:
+                        self._materialized[e_task.id] = e_task
+                        e_task.take_kwargs(task)
+                    task.release_payload(self.payloads)
+                    self._log_event("duplicate", "Task %s coalesced with spilled %s", e_task, task)
+                    return e_task
+
+        self._move_group(self._task_group(task, create=True), None, "queued")
+
+        if self._block(task):
+            self._log_event("block", "Task %s is waiting for %s", task, frozenset(task.waiting_on))
+            return task
+
+        self._log_event("put", "Queued task %s", task)
+        self._add(task)
         self._logger.debug("Queue length: %s", len(self._tasks))
 
+        return task
+
+    def _add(self, task: Task):
+        if self.spill_threshold is not None and (
+                task.pool in self._segments or
+                len(self._pools.get(task.pool, ())) >= self.spill_threshold):
+            self._spill(task)
+            return
+
+        self._index_add(task)
+        self._enqueue(task)
+
+    def _is_pending(self, task_id: uuid.UUID) -> bool:
+        return (
+            task_id in self._tasks or
+            task_id in self._active_tasks or
+            task_id in self._delayed_tasks or
+            task_id in self._blocked or
+            task_id in self._spilled
+        )
+
+    def _block(self, task: Task) -> bool:
+        # Parents that are not known to the queue, finished ones included,
+        # count as satisfied.
+        task.waiting_on = {parent for parent in task.depends_on if self._is_pending(parent)}
+        if not task.waiting_on:
+            return False
+
+        self._blocked[task.id] = task
+        for parent in task.waiting_on:
+            self._dependents.setdefault(parent, []).append(task)
+
         return True
 
-    def get(self, pool: str) -> Optional[Task]:
-        for task in self._tasks:
-            if task.pool != pool:
+    def _release_dependents(self, parent: Task, failed: bool):
+        # Cancellations cascade through arbitrarily long chains, so they
+        # are walked with a stack rather than by recursion
+        parents = [(parent, failed)]
+
+        while parents:
+            parent, failed = parents.pop()
+
+            for task in self._dependents.pop(parent.id, ()):
+                if self._blocked.get(task.id) is not task:
+                    continue
+
+                if failed and task.on_parent_failure == "cancel":
+                    del self._blocked[task.id]
+                    task.release_payload(self.payloads)
+                    self._move_group(self._task_group(task), "queued", "failed")
+                    self._log_event("cancel", "Cancelled task %s after parent %s failed", task, parent)
+                    task.complete(status="cancelled")
+                    parents.append((task, True))
+                    continue
+
+                task.waiting_on.discard(parent.id)
+                if not task.waiting_on:
+                    del self._blocked[task.id]
+                    self._log_event("release", "Released task %s", task)
+                    self._add(task)
+
+    def _spill(self, task: Task):
+        segments = self._segments.setdefault(task.pool, [])
+        if not segments or segments[-1].write_offset >= self.spill_segment_size:
+            segments.append(SpillSegment(self.spill_dir))
+
+        segment = segments[-1]
+        offset = segment.append({"task": task.snapshot})
+        task.release_payload(self.payloads)
+        self._spilled[task.id] = (task.pool, segment, offset)
+        if task.watched:
+            self._materialized[task.id] = task
+        self._spilled_identities.setdefault(hash(task.identity), {})[task.id] = None
+
+    def _drop_segment(self, pool: str, segment: SpillSegment):
+        segment.close()
+        segments = self._segments[pool]
+        segments.remove(segment)
+        if not segments:
+            del self._segments[pool]
+
+    def _unspill(self, task_id: uuid.UUID, identity_hash: int) -> Optional[Tuple[str, SpillSegment, int]]:
+        location = self._spilled.pop(task_id, None)
+        if location is None:
+            return None
+
+        pool, segment, _ = location
+        segment.pending -= 1
+        if not segment.pending:
+            self._drop_segment(pool, segment)
+
+        similar = self._spilled_identities[identity_hash]
+        del similar[task_id]
+        if not similar:
+            del self._spilled_identities[identity_hash]
+
+        return location
+
+    def _load_spilled(self, task_id: uuid.UUID) -> Task:
+        task = self._materialized.get(task_id)
+        if task is None:
+            _, segment, offset = self._spilled[task_id]
+            task = Task.from_snapshot(segment.read_at(offset)["task"])
+
+        return task
+
+    def _spilled_similar(self, task: Task) -> Iterator[Task]:
+        for task_id in list(self._spilled_identities.get(hash(task.identity), ())):
+            e_task = self._load_spilled(task_id)
+            if e_task.identity == task.identity:
+                yield e_task
+
+    def _page_in(self, pool: str):
+        room = self.spill_threshold - len(self._pools.get(pool, ()))
+        now = datetime.now(timezone.utc)
+
+        while room > 0 and pool in self._segments:
+            segment = self._segments[pool][0]
+            entry = segment.read_next()
+            if entry is None:
+                # Whatever is left of a fully read segment is stale
+                self._drop_segment(pool, segment)
                 continue
-            if self.locks & task.locks:
+
+            offset, record = entry
+            task_id = uuid.UUID(record["task"]["id"])
+            if self._spilled.get(task_id) != (pool, segment, offset):
                 continue
 
-            task.taken = datetime.now(timezone.utc)
+            task = self._materialized.pop(task_id, None) or Task.from_snapshot(record["task"])
+            self._unspill(task_id, hash(task.identity))
 
-            self._tasks.remove(task)
-            self._active_tasks[task.id] = task
+            if task.is_expired(now):
+                self._move_group(self._task_group(task), "queued", "failed")
+                self._log_event("expire", "Expired task %s", task)
+                task.complete(status="expired")
+                self._expired.append(task)
+                self._release_dependents(task, failed=True)
+                continue
 
-            for lock in task.locks:
-                self._locks[lock] = (task, task.taken)
+            task.intern_payload(self.payloads)
+            self._index_add(task)
+            self._enqueue(task)
+            room -= 1
+
+        while pool in self._segments and self._segments[pool][0].exhausted:
+            self._drop_segment(pool, self._segments[pool][0])
+
+    def close(self):
+        for task in self._active_tasks.values():
+            task.delete_output()
+
+        for segments in self._segments.values():
+            for segment in segments:
+                segment.close()
 
-            self._logger.info("Sending task %s", repr(task))
+        self._segments = {}
+        self._spilled = {}
+        self._spilled_identities = {}
+        self._materialized = {}
+
+    def _log_event(self, event: str, message: str, task: Task, *args):
+        # Tasks are passed unformatted, so their repr is only built for
+        # records that actually get emitted.
+        if self._logger.isEnabledFor(logging.INFO):
+            self._logger.info(message, task, *args, extra={"event": event, "task": task})
+
+    def _log_locks(self):
+        if self._logger.isEnabledFor(logging.DEBUG):
             self._logger.debug("Active locks: %s", self.locks)
-            return task
+
+    def _index_add(self, task: Task):
+        self._identities.setdefault(task.identity, OrderedDict())[task.id] = task
+
+    def _index_discard(self, task: Task):
+        similar = self._identities.get(task.identity)
+        if similar is None:
+            return
+
+        similar.pop(task.id, None)
+        if not similar:
+            del self._identities[task.identity]
+
+    def _enqueue(self, task: Task):
+        self._tasks[task.id] = task
+        self._pools.setdefault(task.pool, OrderedDict())[task.id] = task
+        task.queued_at = datetime.now(timezone.utc)
+
+        for lock in task.locks:
+            self._lock_waiters.setdefault(lock, OrderedDict())[task.id] = task
+
+        if task.expires_at is not None:
+            heapq.heappush(self._expiry, (task.expires_at, next(self._heap_counter), task))
+
+        if task.pool in self.edf_pools:
+            heapq.heappush(
+                self._deadlines.setdefault(task.pool, []),
+                (task.deadline or LATEST, next(self._heap_counter), task))
+
+        if task.pool in self._waiters:
+            self._wake(task.pool)
+
+    def _dequeue(self, task: Task):
+        if self._tasks.pop(task.id, None) is None:
+            return
+
+        pool = self._pools[task.pool]
+        del pool[task.id]
+        if not pool:
+            del self._pools[task.pool]
+
+        for lock in task.locks:
+            waiters = self._lock_waiters[lock]
+            del waiters[task.id]
+            if not waiters:
+                del self._lock_waiters[lock]
+
+            if self._reservations.get(lock) is task:
+                del self._reservations[lock]
+
+        self._maybe_page_in(task.pool)
+
+    def _maybe_reserve(self, task: Task, now: datetime) -> bool:
+        if (now - task.queued_at).total_seconds() < self.lock_reserve_after:
+            return False
+
+        for lock in task.locks:
+            holder = self._reservations.get(lock)
+            if holder is None or holder.queued_at > task.queued_at:
+                self._reservations[lock] = task
+
+        return True
+
+    def _reserved_for_other(self, task: Task) -> bool:
+        for lock in task.locks:
+            holder = self._reservations.get(lock)
+            if holder is not None and holder is not task:
+                return True
+
+        return False
+
+    def _maybe_page_in(self, pool: str):
+        if pool in self._segments and len(self._pools.get(pool, ())) <= self.spill_threshold // 2:
+            self._page_in(pool)
+
+    def _activate(self, task: Task, taken: datetime, session: Optional[str] = None):
+        task.taken = taken
+        task.session = session
+        self._active_tasks[task.id] = task
+        self._pools_active[task.pool] += 1
+
+        if session is not None:
+            self._session_tasks.setdefault(session, OrderedDict())[task.id] = task
+
+        for lock in task.locks:
+            self._locks[lock] = (task, taken)
+
+    def _deactivate(self, task_id: uuid.UUID) -> Optional[Task]:
+        task = self._active_tasks.pop(task_id, None)
+        if task is None:
+            return None
+
+        self._pools_active[task.pool] -= 1
+        if not self._pools_active[task.pool]:
+            del self._pools_active[task.pool]
+
+        for lock in task.locks:
+            self._locks.pop(lock, None)
+
+        if self.lock_reserve_after is not None:
+            # Only the oldest waiter of each released lock is considered
+            now = datetime.now(timezone.utc)
+            for lock in task.locks:
+                waiters = self._lock_waiters.get(lock)
+                if waiters:
+                    self._maybe_reserve(next(iter(waiters.values())), now)
+
+        if task.locks and self._waiters:
+            for pool in list(self._waiters):
+                if pool in self._pools:
+                    self._wake(pool)
+
+        tasks = self._session_tasks.get(task.session)
+        if tasks is not None:
+            del tasks[task.id]
+            if not tasks:
+                del self._session_tasks[task.session]
+
+        return task
+
+    def _task_group(self, task: Task, create: bool = False) -> Optional[TaskGroup]:
+        # Dead-lettered tasks already counted as failed for their group
+        if task.group is None or task.dead_lettered:
+            return None
+
+        group = self._groups.get(task.group)
+        if create:
+            if group is None:
+                group = self._groups[task.group] = TaskGroup(task.group)
+                self._finished_groups.pop(task.group, None)
+            group.pools.add(task.pool)
+
+        return group
+
+    def _move_group(self, group: Optional[TaskGroup], source: Optional[str], target: Optional[str]):
+        if group is None:
+            return
+
+        group.move(source, target)
+        if group.sealed and not group.pending:
+            self._finish_group(group)
+
+    def _finish_group(self, group: TaskGroup):
+        del self._groups[group.name]
+        self._finished_groups[group.name] = group
+        while len(self._finished_groups) > self.finished_groups_limit:
+            self._finished_groups.popitem(last=False)
+
+        group.finished = datetime.now(timezone.utc)
+        group.completed.set()
+        self._logger.info("Group %s finished: %s", group.name, dict(group.counts), extra={"event": "group"})
+
+        if group.callback is not None:
+            self.put(group.callback)
+
+    def find_group(self, name: str) -> TaskGroup:
+        group = self._groups.get(name) or self._finished_groups.get(name)
+        if group is None:
+            raise LookupError
+
+        return group
+
+    def seal_group(self, name: str, callback: Optional[Task] = None) -> TaskGroup:
+        group = self._groups.get(name)
+        if group is None:
+            if name in self._finished_groups:
+                raise ValueError("Group {} already finished".format(name))
+
+            group = self._groups[name] = TaskGroup(name)
+
+        group.sealed = True
+        group.callback = callback
+        if callback is not None:
+            group.pools.add(callback.pool)
+        self._move_group(group, None, None)
+        return group
+
+    def heartbeat(self, session: str, now: Optional[datetime] = None) -> datetime:
+        if now is None:
+            now = datetime.now(timezone.utc)
+
+        deadline = self._sessions[session] = now + timedelta(seconds=self.session_timeout)
+        self._sessions.move_to_end(session)
+        return deadline
+
+    def end_session(self, session: str) -> List[Task]:
+        self._sessions.pop(session, None)
+        tasks = list(self._session_tasks.pop(session, {}).values())
+
+        for task in reversed(tasks):
+            if not self.session_requeue:
+                self.complete(str(task.id), {
+                    "status": "failed",
+                    "traceback": "Worker session {} expired".format(session)
+                })
+                continue
+
+            task.session = None
+            self._deactivate(task.id)
+            self._move_group(self._task_group(task), "active", "queued")
+            task.taken = None
+            self._index_add(task)
+            self._enqueue(task)
+            self._tasks.move_to_end(task.id, last=False)
+            self._pools[task.pool].move_to_end(task.id, last=False)
+            for lock in task.locks:
+                self._lock_waiters[lock].move_to_end(task.id, last=False)
+            self._log_event("requeue", "Requeued task %s of lost session %s", task, session)
+
+        return tasks
+
+    def expire_sessions(self, now: Optional[datetime] = None) -> List[Tuple[str, List[Task]]]:
+        if now is None:
+            now = datetime.now(timezone.utc)
+
+        expired = []
+        while self._sessions:
+            session, deadline = next(iter(self._sessions.items()))
+            if deadline > now:
+                break
+
+            expired.append((session, self.end_session(session)))
+
+        return expired
+
+    def _delay(self, task: Task, until: datetime):
+        self._index_add(task)
+        self._delayed_tasks[task.id] = task
+        heapq.heappush(self._delayed, (until, next(self._heap_counter), task))
+
+    def _promote_delayed(self, now: datetime):
+        while self._delayed and self._delayed[0][0] <= now:
+            _, _, task = heapq.heappop(self._delayed)
+            del self._delayed_tasks[task.id]
+
+            if task.is_expired(now):
+                self._drop_expired(task)
+                continue
+
+            self._log_event("requeue", "Requeued delayed task %s", task)
+            self._enqueue(task)
+
+    def _drop_expired(self, task: Task):
+        self._dequeue(task)
+        self._index_discard(task)
+        task.release_payload(self.payloads)
+        self._move_group(self._task_group(task), "queued", "failed")
+        self._log_event("expire", "Expired task %s", task)
+        task.complete(status="expired")
+        self._expired.append(task)
+        self._release_dependents(task, failed=True)
+
+    def _shed(self, task: Task):
+        self._dequeue(task)
+        self._index_discard(task)
+        task.release_payload(self.payloads)
+        self._move_group(self._task_group(task), "queued", "failed")
+        self._log_event("shed", "Shed task %s missing its deadline", task)
+        task.complete(status="missed")
+        self._missed.append(task)
+        self._release_dependents(task, failed=True)
+
+    def _run_time(self, pool: str) -> timedelta:
+        return timedelta(seconds=self._run_times.get(pool, 0.0))
+
+    def _deadline_heap(self, pool: str) -> List[Tuple[datetime, int, Task]]:
+        heap = self._deadlines.get(pool, [])
+
+        # Same as for expiry, rebuild once stale entries dominate
+        if len(heap) > 2 * len(self._pools.get(pool, ())) + 64:
+            seen = set()  # type: Set[uuid.UUID]
+            valid = []
+            for entry in heap:
+                task = entry[2]
+                if task.id not in seen and task.pool == pool and self._tasks.get(task.id) is task:
+                    seen.add(task.id)
+                    valid.append(entry)
+
+            heapq.heapify(valid)
+            heap = self._deadlines[pool] = valid
+
+        return heap
+
+    def _is_queued_in(self, task: Task, pool: str) -> bool:
+        return task.pool == pool and self._tasks.get(task.id) is task
+
+    def shed_missed(self, now: Optional[datetime] = None) -> List[Task]:
+        if now is None:
+            now = datetime.now(timezone.utc)
+
+        for pool in list(self._deadlines):
+            heap = self._deadline_heap(pool)
+            run_time = self._run_time(pool)
+
+            while heap:
+                task = heap[0][2]
+                if self._is_queued_in(task, pool) and not task.misses_deadline(now, run_time):
+                    break
+
+                # Shedding may enqueue dependents or paged in tasks onto
+                # this heap, so the entry goes first
+                heapq.heappop(heap)
+                if self._is_queued_in(task, pool):
+                    self._shed(task)
+
+            if not heap:
+                del self._deadlines[pool]
+
+        missed, self._missed = self._missed, []
+        return missed
+
+    def expire(self, now: Optional[datetime] = None) -> List[Task]:
+        if now is None:
+            now = datetime.now(timezone.utc)
+
+        self._promote_delayed(now)
+
+        while self._expiry and self._expiry[0][0] <= now:
+            _, _, task = heapq.heappop(self._expiry)
+
+            if self._tasks.get(task.id) is task:
+                self._drop_expired(task)
+
+        # Entries of tasks dispatched before their expiry are left behind
+        # in the heap; rebuild it once they start to dominate.
+        if len(self._expiry) > 2 * len(self._tasks) + 64:
+            self._expiry = [entry for entry in self._expiry if self._tasks.get(entry[2].id) is entry[2]]
+            heapq.heapify(self._expiry)
+
+        expired, self._expired = self._expired, []
+        return expired
+
+    @observed
+    def get(self, pool: str, session: Optional[str] = None) -> Optional[Task]:
+        now = datetime.now(timezone.utc)
+        if session is not None:
+            self.heartbeat(session, now)
+
+        self._promote_delayed(now)
+        self._maybe_page_in(pool)
+
+        if pool in self.edf_pools:
+            found = self._find_earliest(pool, now)
+        else:
+            found = None
+            expired = []
+            scanned = 0
+
+            for scanned, task in enumerate(self._pools.get(pool, {}).values(), 1):
+                if task.is_expired(now):
+                    expired.append(task)
+                    continue
+                if not self._dispatchable(task, now):
+                    continue
+
+                found = task
+                break
+
+            self.last_scanned = scanned
+
+            for task in expired:
+                self._drop_expired(task)
+
+        if found is None:
+            return None
+
+        task = found
+        self._dequeue(task)
+        self._index_discard(task)
+        self._move_group(self._task_group(task), "queued", "active")
+        self._activate(task, now, session)
+
+        self._log_event("get", "Sending task %s", task)
+        self._log_locks()
+        return task
+
+    def _dispatchable(self, task: Task, now: datetime) -> bool:
+        if not task.locks.isdisjoint(self._locks) or (self._reservations and self._reserved_for_other(task)):
+            if self.lock_reserve_after is not None:
+                self._maybe_reserve(task, now)
+            return False
+
+        return True
+
+    def _find_earliest(self, pool: str, now: datetime) -> Optional[Task]:
+        heap = self._deadline_heap(pool)
+        run_time = self._run_time(pool)
+        found = None
+        dropped = []
+        skipped = []
+        scanned = 0
+
+        while heap:
+            entry = heapq.heappop(heap)
+            task = entry[2]
+            if not self._is_queued_in(task, pool):
+                continue
+
+            scanned += 1
+            if task.is_expired(now) or task.misses_deadline(now, run_time):
+                dropped.append(task)
+                continue
+            if not self._dispatchable(task, now):
+                skipped.append(entry)
+                continue
+
+            found = task
+            break
+
+        for entry in skipped:
+            heapq.heappush(heap, entry)
+
+        self.last_scanned = scanned
+
+        for task in dropped:
+            if task.is_expired(now):
+                self._drop_expired(task)
+            else:
+                self._shed(task)
+
+        return found
+
+    def append_output(self, task_id: str, stream: str, data: bytes) -> OutputBuffer:
+        if stream not in ("stdout", "stderr"):
+            raise ValueError("Unknown output stream {}".format(stream))
+
+        task = self._active_tasks.get(uuid.UUID(task_id))
+        if task is None:
+            raise LookupError
+
+        output = task.outputs.get(stream)
+        if output is None or output.closed:
+            spill_path = None
+            if self.output_dir:
+                spill_path = os.path.join(self.output_dir, "{}.{}".format(task.id.hex, stream))
+            output = task.outputs[stream] = OutputBuffer(self.output_limit, spill_path)
+
+        output.append(data)
+        return output
+
+    def get_any(self, pools: List[str], session: Optional[str] = None) -> Optional[Task]:
+        for pool in pools:
+            task = self.get(pool, session)
+            if task is not None:
+                return task
+
         return None
 
+    async def wait_for_task(self, pools: List[str], timeout: float):
+        waiter = asyncio.get_event_loop().create_future()
+        for pool in pools:
+            self._waiters.setdefault(pool, OrderedDict())[waiter] = None
+
+        try:
+            await asyncio.wait_for(waiter, timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            for pool in pools:
+                waiters = self._waiters.get(pool)
+                if waiters is not None:
+                    waiters.pop(waiter, None)
+                    if not waiters:
+                        del self._waiters[pool]
+
+    def _wake(self, pool: str):
+        waiters = self._waiters[pool]
+        while waiters:
+            waiter, _ = waiters.popitem(last=False)
+            if not waiter.done():
+                waiter.set_result(None)
+                break
+
+        if not waiters:
+            del self._waiters[pool]
+
+    @observed
     def complete(self, task_id: str, data: Dict[str, Any]) -> Task:
         _task_id = uuid.UUID(task_id)
-        task = self._active_tasks.pop(_task_id, None)
+        task = self._deactivate(_task_id)
 
         if not task:
             raise LookupError
 
-        self._logger.info("Completed task %s", repr(task))
+        group = self._task_group(task)
+        task.dead_lettered = False
+        failed = data.get("status") == "failed"
+
+        if task.pool in self.edf_pools and task.taken is not None:
+            seconds = (datetime.now(timezone.utc) - task.taken).total_seconds()
+            self._run_times[task.pool] = ewma(self._run_times.get(task.pool), seconds)
+
+        if failed and task.can_retry:
+            self._move_group(group, "active", "queued")
+            delay = task.next_retry_delay()
+            task.retries += 1
+            task.taken = None
+            self._delay(task, datetime.now(timezone.utc) + delay)
+            self._log_event(
+                "retry", "Retrying task %s (%s/%s) in %s",
+                task, task.retries, task.max_retries, delay)
+            return task
+
+        self._log_event("complete", "Completed task %s", task)
         task.complete(**data)
+        self._move_group(group, "active", "failed" if failed else "done")
 
-        for lock in task.locks:
-            self._locks.pop(lock, None)
+        if failed and task.dead_letter_pool and task.pool != task.dead_letter_pool:
+            task.pool = task.dead_letter_pool
+            task.taken = None
+            task.dead_lettered = True
+            self._add(task)
+            self._log_event("dead_letter", "Dead-lettered task %s", task)
+        else:
+            task.release_payload(self.payloads)
+
+        self._release_dependents(task, failed=failed)
 
         self._logger.debug("Queue length: %s", len(self._tasks))
-        self._logger.debug("Active locks: %s", self.locks)
+        self._log_locks()
 
         return task
 
+    @observed
     def safe_remove(self, task_id: str):
         _task_id = uuid.UUID(task_id)
+        state = "queued"
+        spilled = False
 
-        if _task_id in self._active_tasks:
-            task = self._active_tasks.pop(_task_id)
+        task = self._deactivate(_task_id)
+        if task is not None:
+            state = "active"
 
-            for lock in task.locks:
-                self._locks.pop(lock, None)
+        if task is None and _task_id in self._delayed_tasks:
+            task = self._delayed_tasks.pop(_task_id)
+            self._delayed = [entry for entry in self._delayed if entry[2] is not task]
+            heapq.heapify(self._delayed)
+            self._index_discard(task)
 
-            return
+        if task is None and _task_id in self._spilled:
+            task = self._load_spilled(_task_id)
+            self._materialized.pop(_task_id, None)
+            self._unspill(_task_id, hash(task.identity))
+            spilled = True
 
-        try:
-            task = next(
-                (t for t in self._tasks if t.id == _task_id)
-            )
-            self._tasks.remove(task)
-        except StopIteration:
-            raise LookupError
+        if task is None and _task_id in self._blocked:
+            task = self._blocked.pop(_task_id)
+
+        if task is None:
+            task = self._tasks.get(_task_id)
+            if task is None:
+                raise LookupError
+
+            self._dequeue(task)
+            self._index_discard(task)
+
+        if not spilled:
+            task.release_payload(self.payloads)
+        task.delete_output()
+
+        self._move_group(self._task_group(task), state, "failed")
+        self._release_dependents(task, failed=True)
@@ -0,0 +1,79 @@
+import json
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from .taskqueue import MultiLockPriorityPoolQueue
+
+
+class TraceRecorder:
+    # Appends one compact JSON array per queue operation:
+    #   [t, "put", id, pool, name, locks]
+    #   [t, "get", id, pool]
+    #   [t, "complete", id, status]
+    #   [t, "remove", id]
+    # where t is seconds since recording started. Like instrumentation,
+    # recording observes the queue operations, see ``taskqueue.observed``.
+
+    def __init__(self, queue: MultiLockPriorityPoolQueue) -> None:
+        self.queue = queue
+        self.path = None  # type: Optional[str]
+        self.records = 0
+        self._file = None
+        self._started = 0.0
+
+    @property
+    def recording(self) -> bool:
+        return self._file is not None
+
+    def _write(self, record: List[Any]):
+        record[0] = round(time.monotonic() - self._started, 6)
+        self._file.write(json.dumps(record, separators=(",", ":"), default=str) + "\n")
+        self.records += 1
+
+    def observe(self,
+                operation: str,
+                args: Tuple[Any, ...],
+                kwargs: Dict[str, Any],
+                result: Any,
+                error: Optional[Exception],
+                seconds: float):
+        if error is not None:
+            return
+
+        if operation == "put":
+            task = args[0]
+            if result is task:
+                self._write([0, "put", task.id.hex, task.pool, task.name, sorted(str(lock) for lock in task.locks)])
+        elif operation == "get":
+            if result is not None:
+                self._write([0, "get", result.id.hex, result.pool])
+        elif operation == "complete":
+            self._write([0, "complete", result.id.hex, args[1].get("status")])
+        elif operation == "safe_remove":
+            self._write([0, "remove", args[0].replace("-", "")])
+
+    def start(self, path: str):
+        if self.recording:
+            raise ValueError("Already recording to {}".format(self.path))
+
+        self._file = open(path, "a")
+        self.path = path
+        self.records = 0
+        self._started = time.monotonic()
+        self.queue.observers.append(self)
+
+    def stop(self) -> int:
+        if not self.recording:
+            raise LookupError
+
+        self.queue.observers.remove(self)
+        self._file.close()
+        self._file = None
+        return self.records
+
+    def for_json(self) -> Dict[str, Any]:
+        return {
+            "recording": self.recording,
+            "path": self.path,
+            "records": self.records
+        }
@@ -1,3 +1,11 @@
+import asyncio
+import json
+import os
+from typing import Any, Iterable
+
+from aiohttp import web
+
+
 def safe_int_conversion(value, default, min_val=None, max_val=None):
     try:
         result = int(value)
@@ -10,3 +18,28 @@ def safe_int_conversion(value, default, min_val=None, max_val=None):
         result = default
 
     return result
+
+
+def is_file_name(value) -> bool:
+    # A single path component, nothing that could leave its directory
+    return isinstance(value, str) and value not in ("", ".", "..") and "\0" not in value \
+        and os.path.basename(value) == value and not (os.path.altsep and os.path.altsep in value)
+
+
+async def write_ndjson(response: web.StreamResponse, records: Iterable[Any], chunk_size: int = 500):
+    # Records are written in chunks, giving the event loop a chance to
+    # serve other requests between them.
+    chunk = []
+
+    for record in records:
+        chunk.append(json.dumps(record))
+
+        if len(chunk) >= chunk_size:
+            chunk.append("")
+            await response.write("\n".join(chunk).encode())
+            await asyncio.sleep(0)
+            chunk = []
+
+    if chunk:
+        chunk.append("")
+        await response.write("\n".join(chunk).encode())
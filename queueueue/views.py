@@ -1,33 +1,106 @@
+import asyncio
+import itertools
+import json
+import math
+import os
+from functools import wraps
+from typing import Iterable
 from logging import getLogger
 
-from aiohttp.web_response import json_response
+from aiohttp.web_response import Response, StreamResponse, json_response
 
-from queueueue.utils import safe_int_conversion
+from queueueue.auth import RateLimitedLogger
+from queueueue.utils import is_file_name, safe_int_conversion, write_ndjson
 
-from .taskqueue import Task
+from .taskqueue import Task, TaskGroup, parse_datetime, weighted_order
+
+
+auth_failure_log = RateLimitedLogger(getLogger("aiohttp.access"))
 
 
 def authenticate(func):
 
+    @wraps(func)
     async def wrapper(request, *args, **kwargs):
-        provided_auth = request.headers.get("AUTHORIZATION")
-        if request.app["auth"] and provided_auth not in request.app["auth"]:
-            getLogger("aiohttp.access").warning(
-                "Request with invalid auth credentials blocked: %s %s",
-                request.method, request.path_qs)
-            return json_response({
-                "error": "Not authorized"
-            }, status=403)
+        credential = None
+
+        if request.app["auth"]:
+            credential = request.app["auth"].verify(request.headers.get("AUTHORIZATION"))
+
+            if credential is None:
+                auth_failure_log.warning(
+                    "Request with invalid auth credentials blocked: %s %s",
+                    request.method, request.path_qs)
+                return json_response({
+                    "error": "Not authorized"
+                }, status=403)
+
+        request["credential"] = credential
         return await func(request, *args, **kwargs)
 
     return wrapper
 
 
+def admin_only(func):
+
+    @wraps(func)
+    async def wrapper(request, *args, **kwargs):
+        credential = request.get("credential")
+        if credential is not None and credential.pools is not None:
+            return forbidden()
+        return await func(request, *args, **kwargs)
+
+    return wrapper
+
+
+def pool_allowed(request, pool: str) -> bool:
+    credential = request.get("credential")
+    return credential is None or credential.allows(pool)
+
+
+def allowed_tasks(request, tasks: Iterable[Task]) -> Iterable[Task]:
+    credential = request.get("credential")
+    if credential is None or credential.pools is None:
+        return tasks
+
+    return (task for task in tasks if credential.allows(task.pool))
+
+
+def session_allowed(request, session: str) -> bool:
+    # Scoped credentials may only act on sessions running nothing but
+    # tasks of their own pools
+    credential = request.get("credential")
+    return credential is None or all(
+        credential.allows(task.pool) for task in request.app["queue"].session_tasks(session))
+
+
+def group_allowed(request, group: TaskGroup) -> bool:
+    # Scoped credentials need access to every pool the group's tasks and
+    # callback used
+    credential = request.get("credential")
+    return credential is None or all(credential.allows(pool) for pool in group.pools)
+
+
+def payload_limit(request):
+    if request.query.get("payload") == "full":
+        return None
+
+    return request.app["payload_listing_limit"]
+
+
+def invalid_task(error: Exception):
+    return json_response({"error": "Invalid task: {}".format(error)}, status=400)
+
+
+def forbidden():
+    return json_response({"error": "Access to pool denied"}, status=403)
+
+
 @authenticate
 async def list_tasks(request):
     offset = safe_int_conversion(
         request.query.get("offset"), 0,
-        min_val=0, max_val=request.app["queue"].task_count
+        min_val=0, max_val=len(request.app["queue"])
     )
     limit = safe_int_conversion(
         request.query.get("limit"), 50,
@@ -35,8 +108,8 @@ async def list_tasks(request):
     )
 
     return json_response([
-        task.for_json()
-        for task in request.app["queue"].tasks[offset:offset + limit]
+        task.for_json(payload_limit(request))
+        for task in itertools.islice(allowed_tasks(request, request.app["queue"].iter_queued()), offset, offset + limit)
     ])
 
 
@@ -52,35 +125,119 @@ async def list_taken_tasks(request):
     )
 
     return json_response([
-        task.for_json()
-        for task in request.app["queue"].tasks_taken[offset:offset + limit]
+        task.for_json(payload_limit(request))
+        for task in itertools.islice(allowed_tasks(request, request.app["queue"].tasks_taken), offset, offset + limit)
+    ])
+
+
+@authenticate
+async def list_delayed_tasks(request):
+    offset = safe_int_conversion(
+        request.query.get("offset"), 0,
+        min_val=0
+    )
+    limit = safe_int_conversion(
+        request.query.get("limit"), 50,
+        min_val=1, max_val=50
+    )
+
+    return json_response([
+        task.for_json(payload_limit(request))
+        for task in itertools.islice(allowed_tasks(request, request.app["queue"].tasks_delayed), offset, offset + limit)
+    ])
+
+
+@authenticate
+async def list_blocked_tasks(request):
+    offset = safe_int_conversion(
+        request.query.get("offset"), 0,
+        min_val=0
+    )
+    limit = safe_int_conversion(
+        request.query.get("limit"), 50,
+        min_val=1, max_val=50
+    )
+
+    return json_response([
+        task.for_json(payload_limit(request))
+        for task in itertools.islice(allowed_tasks(request, request.app["queue"].tasks_blocked), offset, offset + limit)
     ])
 
 
+@authenticate
+async def stream_tasks(request):
+    queue = request.app["queue"]
+    sources = {
+        "queued": queue.iter_queued,
+        "taken": lambda: queue.tasks_taken,
+        "delayed": lambda: queue.tasks_delayed,
+        "blocked": lambda: queue.tasks_blocked
+    }
+
+    state = request.query.get("state", "queued")
+    if state not in sources:
+        return json_response({"error": "Unknown state"}, status=400)
+
+    pool = request.query.get("pool")
+    limit = payload_limit(request)
+    tasks = allowed_tasks(request, sources[state]())
+
+    response = StreamResponse(headers={"Content-Type": "application/x-ndjson"})
+    await response.prepare(request)
+
+    await write_ndjson(response, (
+        task.for_json(limit)
+        for task in tasks
+        if pool is None or task.pool == pool
+    ))
+
+    await response.write_eof()
+    return response
+
+
 @authenticate
 async def add_task(request):
     data = await request.json()
-    task = Task(**data)
+    try:
+        task = Task(**data)
+    except (TypeError, ValueError) as error:
+        return invalid_task(error)
+
+    if not pool_allowed(request, task.pool):
+        return forbidden()
+
+    client = request["credential"].digest if request["credential"] else request.remote
+    error, retry_after = request.app["limits"].check(
+        client, task.pool, request.app["queue"].queued_count(task.pool))
+
+    if error:
+        request.app["stats"].push_task_rejected(task.pool)
+        return json_response(
+            {"error": error},
+            status=429,
+            headers={"Retry-After": str(math.ceil(retry_after))})
 
-    unique = request.query.get("unique", "").lower() == "true"
+    unique = request.query.get("unique", "").lower()
     wait = request.query.get("wait", "").lower() == "true"
     unique_ignore_kwargs = request.query.getall("unique_ignore_kwarg", [])
     unique_ignore_kwargs = set(unique_ignore_kwargs)
 
-    added = request.app["queue"].put(
+    queued = request.app["queue"].put(
         task,
-        unique=unique,
-        unique_ignore_kwargs=unique_ignore_kwargs)
+        unique=unique == "true",
+        unique_ignore_kwargs=unique_ignore_kwargs,
+        replace=unique == "replace")
     request.app["stats"].push_task_received(task.pool)
 
-    if not added:
+    if queued is not task:
         request.app["stats"].push_task_duplicate(task.pool)
 
     request.app["stats"].set_tasks_queued(len(request.app["queue"]))
 
     if wait:
-        await task.completed.wait()
-        result = task.completed.data
+        request.app["queue"].watch(queued)
+        await queued.completed.wait()
+        result = queued.completed.data
     else:
         result = {"result": "success"}
 
@@ -89,13 +246,51 @@ async def add_task(request):
 
 @authenticate
 async def get_task(request):
-    pool = request.query.get("pool")
-    if not pool:
+    pools = [pool for pool in request.query.getall("pool", []) if pool]
+    if not pools:
         return json_response(None)
 
-    task = request.app["queue"].get(pool=pool)
-    data = task.worker_info if task else None
-    return json_response(data)
+    if not all(pool_allowed(request, pool) for pool in pools):
+        return forbidden()
+
+    order = request.query.get("order", "strict")
+    if order == "weighted":
+        try:
+            weights = [float(weight) for weight in request.query.getall("weight", [])] or [1.0] * len(pools)
+        except ValueError:
+            weights = []
+
+        if len(weights) != len(pools) or min(weights) <= 0:
+            return json_response({"error": "Expected a positive weight per pool"}, status=400)
+    elif order != "strict":
+        return json_response({"error": "Unknown order"}, status=400)
+
+    session = request.query.get("session") or request.headers.get("X-Worker-Session")
+    timeout = safe_int_conversion(
+        request.query.get("timeout"), 0,
+        min_val=0, max_val=300
+    )
+    deadline = asyncio.get_event_loop().time() + timeout
+    queue = request.app["queue"]
+
+    while True:
+        if order == "weighted":
+            task = queue.get_any(weighted_order(pools, weights), session=session)
+        else:
+            task = queue.get_any(pools, session=session)
+
+        remaining = deadline - asyncio.get_event_loop().time()
+        if task is not None or remaining <= 0:
+            break
+
+        # Delayed tasks become ready without a wakeup, recheck regularly
+        await queue.wait_for_task(pools, min(remaining, 1.0))
+
+    if task is None:
+        return json_response(None)
+
+    request.app["stats"].push_task_taken(task)
+    return json_response(task.worker_info)
 
 
 @authenticate
@@ -104,19 +299,83 @@ async def complete_task(request):
     data = await request.json()
 
     try:
+        if not pool_allowed(request, request.app["queue"].find(_id).pool):
+            return forbidden()
+
         task = request.app["queue"].complete(_id, data)
-        request.app["stats"].push_task_completed(task.pool)
-        request.app["stats"].push_task_processing(task.pool, task.processing_duration)
+        request.app["stats"].push_task_finished(task)
         request.app["stats"].set_tasks_queued(len(request.app["queue"]))
         return json_response({"result": "Success"})
     except LookupError:
         return json_response({"error": "Unknown task"}, status=404)
 
 
+@authenticate
+async def append_output(request):
+    _id = request.match_info.get('task_id')
+    data = await request.read()
+
+    try:
+        if not pool_allowed(request, request.app["queue"].find(_id).pool):
+            return forbidden()
+
+        output = request.app["queue"].append_output(_id, request.match_info["stream"], data)
+    except LookupError:
+        return json_response({"error": "Unknown task"}, status=404)
+    except ValueError as error:
+        return json_response({"error": str(error)}, status=400)
+
+    return json_response({"offset": output.end})
+
+
+@authenticate
+async def read_output(request):
+    _id = request.match_info.get('task_id')
+    stream = request.match_info["stream"]
+
+    try:
+        task = request.app["queue"].find(_id)
+    except LookupError:
+        return json_response({"error": "Unknown task"}, status=404)
+
+    if not pool_allowed(request, task.pool):
+        return forbidden()
+
+    output = task.outputs.get(stream)
+    if output is None:
+        return json_response({"error": "No output"}, status=404)
+
+    follow = request.query.get("follow", "").lower() == "true"
+    offset, chunks = output.read(max(safe_int_conversion(request.query.get("offset"), 0), 0))
+
+    response = StreamResponse(headers={
+        "Content-Type": "application/octet-stream",
+        "X-Output-Offset": str(offset)
+    })
+    await response.prepare(request)
+
+    while True:
+        for chunk in chunks:
+            await response.write(chunk)
+            offset += len(chunk)
+
+        if offset >= output.end and (not follow or output.closed):
+            break
+
+        await output.wait(offset)
+        offset, chunks = output.read(offset)
+
+    await response.write_eof()
+    return response
+
+
 @authenticate
 async def delete_task(request):
     _id = request.match_info.get('task_id')
     try:
+        if not pool_allowed(request, request.app["queue"].find(_id).pool):
+            return forbidden()
+
         request.app["queue"].safe_remove(_id)
         return json_response({"result": "Success"})
     except LookupError:
@@ -128,8 +387,242 @@ async def list_locks(request):
     return json_response([
         {
             "id": _id,
-            "task": task.for_json(),
+            "task": task.for_json(payload_limit(request)),
             "taken": taken.isoformat()
         }
         for _id, task, taken in request.app["queue"].iter_locks
+        if pool_allowed(request, task.pool)
     ])
+
+
+@authenticate
+async def get_group(request):
+    try:
+        group = request.app["queue"].find_group(request.match_info["group"])
+    except LookupError:
+        return json_response({"error": "Unknown group"}, status=404)
+
+    if not group_allowed(request, group):
+        return forbidden()
+
+    if request.query.get("wait", "").lower() == "true":
+        timeout = safe_int_conversion(
+            request.query.get("timeout"), 30,
+            min_val=0, max_val=300
+        )
+
+        try:
+            await asyncio.wait_for(group.completed.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    return json_response(group.for_json())
+
+
+@authenticate
+async def seal_group(request):
+    data = await request.json() if request.can_read_body else {}
+    callback = None
+
+    if data.get("callback"):
+        try:
+            callback = Task(**data["callback"])
+        except (TypeError, ValueError) as error:
+            return invalid_task(error)
+        if not pool_allowed(request, callback.pool):
+            return forbidden()
+
+    try:
+        group = request.app["queue"].find_group(request.match_info["group"])
+    except LookupError:
+        pass
+    else:
+        if not group_allowed(request, group):
+            return forbidden()
+
+    try:
+        group = request.app["queue"].seal_group(request.match_info["group"], callback)
+    except ValueError as error:
+        return json_response({"error": str(error)}, status=409)
+
+    return json_response(group.for_json())
+
+
+@authenticate
+async def list_sessions(request):
+    return json_response({
+        session: data
+        for session, data in request.app["queue"].session_summary().items()
+        if session_allowed(request, session)
+    })
+
+
+@authenticate
+async def heartbeat_session(request):
+    session = request.match_info["session"]
+    if not session_allowed(request, session):
+        return forbidden()
+
+    deadline = request.app["queue"].heartbeat(session)
+    return json_response({"session": session, "expires_at": deadline.isoformat()})
+
+
+@authenticate
+async def end_session(request):
+    session = request.match_info["session"]
+    if not session_allowed(request, session):
+        return forbidden()
+
+    tasks = request.app["queue"].end_session(session)
+    request.app["stats"].push_session_lost(session, tasks)
+    request.app["stats"].set_tasks_queued(len(request.app["queue"]))
+    return json_response({"released": len(tasks)})
+
+
+@authenticate
+async def summary(request):
+    queue = request.app["queue"]
+    pools = queue.pool_summary()
+    locks = queue.lock_summary()
+
+    credential = request.get("credential")
+    if credential is not None and credential.pools is not None:
+        # Scoped credentials only see their pools and the locks held there
+        held = {str(lock) for lock, task, _ in queue.iter_locks if credential.allows(task.pool)}
+        pools = {pool: data for pool, data in pools.items() if credential.allows(pool)}
+        locks = {lock: data for lock, data in locks.items() if lock in held}
+
+    return json_response({
+        "pools": pools,
+        "locks": locks,
+        "payloads": queue.payloads.for_json()
+    })
+
+
+@authenticate
+@admin_only
+async def get_instrumentation(request):
+    return json_response(request.app["instrumentation"].for_json())
+
+
+@authenticate
+@admin_only
+async def enable_instrumentation(request):
+    request.app["instrumentation"].enable()
+    return json_response(request.app["instrumentation"].for_json())
+
+
+@authenticate
+@admin_only
+async def disable_instrumentation(request):
+    request.app["instrumentation"].disable()
+    return json_response(request.app["instrumentation"].for_json())
+
+
+@authenticate
+@admin_only
+async def get_trace(request):
+    return json_response(request.app["trace"].for_json())
+
+
+@authenticate
+@admin_only
+async def start_trace(request):
+    directory = request.app["trace_dir"]
+    if directory is None:
+        return json_response({"error": "No trace directory configured"}, status=403)
+
+    data = await request.json()
+    name = data.get("name") if isinstance(data, dict) else None
+    if not is_file_name(name):
+        return json_response({"error": "Expected a trace file name"}, status=400)
+
+    try:
+        request.app["trace"].start(os.path.join(directory, name))
+    except ValueError as error:
+        return json_response({"error": str(error)}, status=409)
+    except OSError as error:
+        return json_response({"error": str(error)}, status=400)
+
+    return json_response(request.app["trace"].for_json())
+
+
+@authenticate
+@admin_only
+async def stop_trace(request):
+    try:
+        request.app["trace"].stop()
+    except LookupError:
+        return json_response({"error": "Not recording"}, status=400)
+
+    return json_response(request.app["trace"].for_json())
+
+
+@authenticate
+@admin_only
+async def start_profile(request):
+    request.app["instrumentation"].start_profile()
+    return json_response({"result": "Success"})
+
+
+@authenticate
+@admin_only
+async def stop_profile(request):
+    sort = request.query.get("sort", "cumulative")
+    limit = safe_int_conversion(request.query.get("limit"), 50, min_val=1)
+
+    try:
+        report = request.app["instrumentation"].stop_profile(sort=sort, limit=limit)
+    except KeyError:
+        return json_response({"error": "Unknown sort key"}, status=400)
+    except LookupError:
+        return json_response({"error": "Profiling is not running"}, status=404)
+
+    return Response(text=report)
+
+
+@authenticate
+@admin_only
+async def export_snapshot(request):
+    response = StreamResponse(headers={"Content-Type": "application/x-ndjson"})
+    await response.prepare(request)
+
+    await write_ndjson(response, (
+        {
+            "state": state,
+            "ready_at": ready_at.isoformat() if ready_at else None,
+            "task": task.snapshot
+        }
+        for state, task, ready_at in request.app["queue"].iter_snapshot()
+    ))
+
+    await response.write_eof()
+    return response
+
+
+@authenticate
+@admin_only
+async def import_snapshot(request):
+    restored = 0
+    skipped = 0
+
+    async for line in request.content:
+        if not line.strip():
+            continue
+
+        try:
+            record = json.loads(line)
+            task = Task.from_snapshot(record["task"])
+            ready_at = parse_datetime(record["ready_at"]) if record.get("ready_at") else None
+            request.app["queue"].restore(record["state"], task, ready_at)
+        except (ValueError, KeyError, TypeError):
+            skipped += 1
+            continue
+
+        restored += 1
+        if restored % 500 == 0:
+            await asyncio.sleep(0)
+
+    request.app["stats"].set_tasks_queued(len(request.app["queue"]))
+
+    return json_response({"restored": restored, "skipped": skipped})
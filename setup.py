@@ -7,10 +7,13 @@ setup(
     maintainer="Eugene Protozanov",
     maintainer_email="protozanov@noblecode.ru",
     description="Advanced task queueueue",
-    packages=find_packages(),
+    packages=find_packages(exclude=["benchmarks"]),
     install_requires=[
         'aiohttp==3.5.1'
     ],
+    extras_require={
+        'binary': ['msgpack'],
+    },
     entry_points={
         'console_scripts': [
             'queueueue = queueueue.main:main',
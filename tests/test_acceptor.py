@@ -0,0 +1,18 @@
+import pytest
+
+from queueueue.acceptor import parse_proxy_header, proxy_header
+
+
+def test_proxy_header_round_trip():
+    line = proxy_header(("10.0.0.1", 5000), ("10.0.0.2", 8080))
+    assert line == b"PROXY TCP4 10.0.0.1 10.0.0.2 5000 8080\r\n"
+    assert parse_proxy_header(line[:-2]) == ("10.0.0.1", 5000)
+
+    line = proxy_header(("::1", 5000, 0, 0), ("::1", 8080, 0, 0))
+    assert parse_proxy_header(line[:-2]) == ("::1", 5000)
+
+    assert proxy_header("", "") == b"PROXY UNKNOWN\r\n"
+    assert parse_proxy_header(b"PROXY UNKNOWN") is None
+
+    with pytest.raises(ValueError):
+        parse_proxy_header(b"PROXY UDP4 a b 1 2")
@@ -0,0 +1,95 @@
+import logging
+from base64 import b64encode
+
+import pytest
+
+from queueueue.auth import RateLimitedLogger, TokenStore, hash_secret
+
+
+def test_token_store_verify():
+    store = TokenStore()
+    assert not store
+
+    store.add("bearer", "token", pools=["pool"])
+    store.add("basic", "user:password")
+    assert store
+
+    credential = store.verify("Bearer token")
+    assert credential.allows("pool")
+    assert not credential.allows("other")
+
+    basic = "Basic " + b64encode(b"user:password").decode()
+    assert store.verify(basic).allows("other")
+
+    assert store.verify("Bearer wrong") is None
+    assert store.verify("Basic !!!") is None
+    assert store.verify("Digest token") is None
+    assert store.verify(None) is None
+
+
+def test_token_store_cache():
+    store = TokenStore(cache_size=1)
+    store.add("bearer", "one")
+    store.add("bearer", "two")
+
+    store.verify("Bearer one")
+    store.verify("Bearer two")
+
+    assert list(store._cache) == ["Bearer two"]
+
+
+def test_token_store_file_reload(tmpdir):
+    token_file = tmpdir.join("tokens")
+    token_file.write("# comment\nbearer {} a,b\n".format(hash_secret("first")))
+
+    store = TokenStore(str(token_file))
+    assert store.verify("Bearer first").pools == {"a", "b"}
+
+    token_file.write("bearer {}\n".format(hash_secret("second")))
+    store.reload()
+    assert store.verify("Bearer first") is None
+    assert store.verify("Bearer second").pools is None
+
+    token_file.write("bearer not-a-digest\n")
+    store.reload()
+    assert store.verify("Bearer second") is not None
+
+
+def test_token_store_revoke_all(tmpdir):
+    token_file = tmpdir.join("tokens")
+    token_file.write("bearer {}\n".format(hash_secret("token")))
+
+    store = TokenStore(str(token_file))
+    assert store.verify("Bearer token") is not None
+
+    token_file.write("# all revoked\n")
+    store.reload()
+    assert store
+    assert store.verify("Bearer token") is None
+
+
+def test_token_store_empty_file(tmpdir):
+    token_file = tmpdir.join("tokens")
+    token_file.write("# nothing yet\n")
+
+    with pytest.raises(ValueError):
+        TokenStore(str(token_file))
+
+
+def test_token_store_invalid_file(tmpdir):
+    token_file = tmpdir.join("tokens")
+    token_file.write("unknown {}\n".format(hash_secret("token")))
+
+    with pytest.raises(ValueError):
+        TokenStore(str(token_file))
+
+
+def test_rate_limited_logger(caplog):
+    log = RateLimitedLogger(logging.getLogger("test"), interval=60)
+
+    with caplog.at_level(logging.WARNING):
+        for _ in range(5):
+            log.warning("blocked %s", "request")
+
+    assert len(caplog.records) == 1
+    assert log.suppressed == 4
@@ -0,0 +1,91 @@
+import asyncio
+
+import pytest
+
+from queueueue.app import build_app
+from queueueue.taskqueue import Task
+
+msgpack = pytest.importorskip("msgpack")
+
+from queueueue.binary import (OP_AUTH, OP_COMPLETE, OP_HEARTBEAT, OP_TAKE,  # noqa: E402
+                              STATUS_ERROR, STATUS_OK, pack_frame, read_frame,
+                              setup_binary_protocol)
+
+
+@pytest.fixture
+def binary_app(loop, tmpdir, aiohttp_server):
+    app = build_app()
+    path = str(tmpdir.join("binary.sock"))
+    setup_binary_protocol(app, path=path)
+    loop.run_until_complete(aiohttp_server(app))
+    return app, path
+
+
+async def test_binary_pipelined_take_complete(binary_app):
+    app, path = binary_app
+    for number in range(3):
+        app["queue"].put(Task("test_task", [], "pool", [number], {}))
+
+    reader, writer = await asyncio.open_unix_connection(path)
+
+    writer.write(b"".join([
+        pack_frame([OP_HEARTBEAT, 1]),
+        pack_frame([OP_TAKE, 2, "pool"]),
+        pack_frame([OP_TAKE, 3, "pool"]),
+        pack_frame([OP_TAKE, 4, "other"]),
+    ]))
+
+    responses = [await read_frame(reader) for _ in range(4)]
+    assert [response[0] for response in responses] == [1, 2, 3, 4]
+    assert responses[1][2][2] == [0]
+    assert responses[2][2][2] == [1]
+    assert responses[3] == [4, STATUS_OK, None]
+
+    writer.write(b"".join(
+        pack_frame([OP_COMPLETE, seq, response[2][0], {"status": "success", "result": seq}])
+        for seq, response in zip((5, 6), responses[1:3])
+    ))
+    writer.write(pack_frame([OP_COMPLETE, 7, responses[1][2][0], {"status": "success"}]))
+
+    assert await read_frame(reader) == [5, STATUS_OK, None]
+    assert await read_frame(reader) == [6, STATUS_OK, None]
+    assert await read_frame(reader) == [7, STATUS_ERROR, "Unknown task"]
+
+    stats_data = dict(app["stats"].stat_iter())
+    assert stats_data["tasks_completed.pool.pool"] == 2
+
+    writer.close()
+
+
+async def test_binary_session(binary_app):
+    app, path = binary_app
+    app["queue"].put(Task("test_task", [], "pool", [1], {}))
+
+    reader, writer = await asyncio.open_unix_connection(path)
+
+    writer.write(pack_frame([OP_HEARTBEAT, 1, "worker"]))
+    writer.write(pack_frame([OP_TAKE, 2, "pool"]))
+
+    assert (await read_frame(reader))[1] == STATUS_OK
+    assert (await read_frame(reader))[1] == STATUS_OK
+    assert app["queue"].session_summary()["worker"]["active"] == 1
+
+    writer.close()
+
+
+async def test_binary_auth(binary_app):
+    app, path = binary_app
+    app["auth"].add("bearer", "token", pools=["pool"])
+
+    reader, writer = await asyncio.open_unix_connection(path)
+
+    writer.write(pack_frame([OP_TAKE, 1, "pool"]))
+    assert await read_frame(reader) == [1, STATUS_ERROR, "Not authorized"]
+
+    writer.write(pack_frame([OP_AUTH, 2, "Bearer token"]))
+    assert await read_frame(reader) == [2, STATUS_OK, None]
+
+    writer.write(pack_frame([OP_TAKE, 3, "other"]))
+    assert await read_frame(reader) == [3, STATUS_ERROR, "Access to pool denied"]
+
+    writer.close()
@@ -0,0 +1,43 @@
+from queueueue.instrumentation import Instrumentation
+from queueueue.taskqueue import MultiLockPriorityPoolQueue, Task
+
+
+async def test_instrumentation_counters():
+    q = MultiLockPriorityPoolQueue()
+    instrumentation = Instrumentation(q)
+
+    instrumentation.enable()
+
+    q.put(Task("test_task", [1], "pool", [1], {}))
+    q.put(Task("test_task", [1], "pool", [2], {}))
+    q.put(Task("test_task", [1], "pool", [2], {}), unique=True)
+    task = q.get("pool")
+    q.get("pool")
+    q.complete(str(task.id), {"status": "success"})
+
+    data = instrumentation.for_json()
+    assert data["enabled"]
+    assert data["loop_lag"]["running"]
+    assert data["operations"]["put"]["calls"] == 3
+    assert data["operations"]["put"]["scanned"] == 1
+    assert data["operations"]["get"]["calls"] == 2
+    assert data["operations"]["get"]["scanned"] == 2
+    assert data["operations"]["complete"]["calls"] == 1
+
+    instrumentation.disable()
+
+    assert q.observers == []
+    assert not instrumentation.for_json()["loop_lag"]["running"]
+    assert instrumentation.for_json()["operations"] == {}
+
+
+def test_instrumentation_profile():
+    q = MultiLockPriorityPoolQueue()
+    instrumentation = Instrumentation(q)
+
+    instrumentation.start_profile()
+    q.put(Task("test_task", [1], "pool", [1], {}))
+    report = instrumentation.stop_profile(limit=10)
+
+    assert "put" in report
+    assert not instrumentation.profiling
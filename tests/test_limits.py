@@ -0,0 +1,39 @@
+from queueueue.limits import EnqueueLimits, TokenBucket
+
+
+def test_token_bucket():
+    bucket = TokenBucket(rate=2, burst=2, now=0)
+
+    assert bucket.take(0) == 0
+    assert bucket.take(0) == 0
+    assert bucket.take(0) == 0.5
+    assert bucket.take(0.5) == 0
+
+
+def test_enqueue_limits_depth():
+    limits = EnqueueLimits(max_depth=10, pool_max_depth={"small": 1}, depth_retry_after=3)
+
+    assert limits.check("client", "pool", 9) == (None, 0.0)
+    assert limits.check("client", "pool", 10)[1] == 3
+    assert limits.check("client", "small", 1)[0] == "Queue depth limit reached"
+
+
+def test_enqueue_limits_rate():
+    limits = EnqueueLimits(rate=1, burst=1)
+
+    assert limits.check("a", "pool", 0, now=0) == (None, 0.0)
+    assert limits.check("a", "pool", 0, now=0.5) == ("Rate limit exceeded", 0.5)
+    assert limits.check("b", "pool", 0, now=0.5) == (None, 0.0)
+    assert limits.check("a", "pool", 0, now=1) == (None, 0.0)
+
+
+def test_enqueue_limits_evict_least_recent():
+    limits = EnqueueLimits(rate=1, burst=1, max_clients=2)
+
+    limits.check("a", "pool", 0, now=0)
+    limits.check("b", "pool", 0, now=0.1)
+    assert limits.check("a", "pool", 0, now=0.2)[0] == "Rate limit exceeded"
+    limits.check("c", "pool", 0, now=0.3)
+
+    assert list(limits._buckets) == ["a", "c"]
+    assert limits.check("a", "pool", 0, now=0.4)[0] == "Rate limit exceeded"
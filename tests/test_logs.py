@@ -0,0 +1,65 @@
+import json
+import logging
+import queue
+
+from queueueue.logs import BufferedQueueHandler, EventSamplingFilter, StructuredFormatter
+from queueueue.taskqueue import Task
+
+
+def make_record(event=None, task=None, level=logging.INFO):
+    record = logging.LogRecord("Queue", level, __file__, 1, "Queued task %s", (task,), None)
+    if event:
+        record.event = event
+        record.task = task
+    return record
+
+
+def test_event_sampling_filter():
+    log_filter = EventSamplingFilter(3)
+
+    passed = [log_filter.filter(make_record("put")) for _ in range(6)]
+    assert passed == [True, False, False, True, False, False]
+
+    assert log_filter.filter(make_record("get"))
+    assert log_filter.filter(make_record())
+    assert log_filter.filter(make_record("put", level=logging.WARNING))
+
+
+def test_structured_formatter():
+    task = Task("test_task", ["1"], "pool", [1], {})
+    data = json.loads(StructuredFormatter().format(make_record("put", task)))
+
+    assert data["event"] == "put"
+    assert data["task_id"] == str(task.id)
+    assert data["pool"] == "pool"
+    assert data["locks"] == ["1"]
+    assert str(task.id) in data["message"]
+
+
+def test_buffered_handler_is_lazy_and_drops():
+    buffer = queue.Queue(1)
+    handler = BufferedQueueHandler(buffer)
+    task = Task("test_task", ["1"], "pool", [1], {})
+
+    handler.handle(make_record("put", task))
+    handler.handle(make_record("put", task))
+
+    record = buffer.get_nowait()
+    assert record.args == (task,)
+    assert handler.dropped == 1
+
+
+def test_buffered_handler_copies_containers():
+    buffer = queue.Queue(1)
+    handler = BufferedQueueHandler(buffer)
+    task = Task("test_task", ["1"], "pool", [1], {})
+    waiting_on = {1, 2}
+
+    record = logging.LogRecord(
+        "Queue", logging.INFO, __file__, 1, "Task %s is waiting for %s", (task, waiting_on), None)
+    handler.handle(record)
+    waiting_on.clear()
+
+    record = buffer.get_nowait()
+    assert record.args[0] is task
+    assert record.getMessage().endswith("{1, 2}")
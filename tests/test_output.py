@@ -0,0 +1,66 @@
+import asyncio
+
+from queueueue.output import OutputBuffer
+
+
+def test_output_ring_buffer():
+    output = OutputBuffer(limit=10)
+
+    output.append(b"abcd")
+    output.append(b"efgh")
+    output.append(b"ijkl")
+
+    assert (output.start, output.end) == (2, 12)
+    offset, chunks = output.read(0)
+    assert offset == 2
+    assert b"".join(chunks) == b"cdefghijkl"
+
+    offset, chunks = output.read(10)
+    assert offset == 10
+    assert b"".join(chunks) == b"kl"
+
+    output.append(b"0123456789abc")
+    assert output.text == "3456789abc"
+    assert output.start == 15
+
+
+def test_output_spill(tmpdir):
+    path = str(tmpdir.join("task.stdout"))
+    output = OutputBuffer(limit=4, spill_path=path)
+    output.read_block = 3
+
+    output.append(b"hello ")
+    output.append(b"world")
+    output.close()
+
+    assert output.read(0) == (0, [b"hel"])
+    assert output.read(3) == (3, [b"lo "])
+    assert output.read(6) == (6, [b"w"])
+    offset, chunks = output.read(7)
+    assert b"".join(chunks) == b"orld"
+    assert open(path, "rb").read() == b"hello world"
+
+    output.delete()
+    assert not tmpdir.listdir()
+    assert output.read(0) == (7, [b"orld"])
+
+
+def test_output_wait():
+    loop = asyncio.new_event_loop()
+    output = OutputBuffer()
+
+    async def follow():
+        waiter = asyncio.ensure_future(output.wait(0))
+        await asyncio.sleep(0)
+        assert not waiter.done()
+
+        output.append(b"line\n")
+        await waiter
+
+        waiter = asyncio.ensure_future(output.wait(5))
+        await asyncio.sleep(0)
+        output.close()
+        await waiter
+
+    loop.run_until_complete(follow())
+    loop.close()
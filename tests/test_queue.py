@@ -1,9 +1,15 @@
+import os
+import sys
+import tempfile
 import unittest
+import random
 import uuid
+from collections import Counter
+from datetime import datetime, timedelta, timezone
 
 import asyncio
 import pytest
-from queueueue.taskqueue import MultiLockPriorityPoolQueue, Task
+from queueueue.taskqueue import MultiLockPriorityPoolQueue, Task, parse_datetime, weighted_order
 
 
 class TestTaskQueue(unittest.TestCase):
@@ -31,11 +37,11 @@ class TestTaskQueue(unittest.TestCase):
         t = Task("test_task", [], "pool", [], {})
         t2 = Task("test_task", [], "pool", [], {})
 
-        q.put(t)
-        q.put(t2, unique=True)
+        assert q.put(t) is t
+        assert q.put(t2, unique=True) is t
 
         assert len(q._tasks) == 1
-        assert q._tasks[0].id == t.id
+        assert q.tasks[0].id == t.id
         assert q.task_count == 1
         assert len(q._locks) == 0
 
@@ -48,8 +54,8 @@ class TestTaskQueue(unittest.TestCase):
         q.put(t2, unique=True)
 
         assert len(q._tasks) == 2
-        assert q._tasks[0].id == t.id
-        assert q._tasks[1].id == t2.id
+        assert q.tasks[0].id == t.id
+        assert q.tasks[1].id == t2.id
         assert q.task_count == 2
         assert len(q._locks) == 0
 
@@ -62,7 +68,7 @@ class TestTaskQueue(unittest.TestCase):
         q.put(t2, unique=True, unique_ignore_kwargs={"test"})
 
         assert len(q._tasks) == 1
-        assert q._tasks[0].id == t.id
+        assert q.tasks[0].id == t.id
         assert q.task_count == 1
         assert len(q._locks) == 0
 
@@ -75,8 +81,8 @@ class TestTaskQueue(unittest.TestCase):
         q.put(t2, unique=True, unique_ignore_kwargs={"test"})
 
         assert len(q._tasks) == 2
-        assert q._tasks[0].id == t.id
-        assert q._tasks[1].id == t2.id
+        assert q.tasks[0].id == t.id
+        assert q.tasks[1].id == t2.id
         assert q.task_count == 2
         assert len(q._locks) == 0
 
@@ -210,3 +216,778 @@ class TestTaskQueue(unittest.TestCase):
 
         with pytest.raises(LookupError):
             q.safe_remove(str(t.id))
+
+    def test_queue_complete_failed_retry(self):
+        q = MultiLockPriorityPoolQueue()
+        t = Task("test_task", [1, 2], "pool", [], {}, max_retries=2, retry_delay=0)
+
+        q.put(t)
+        task = q.get("pool")
+        q.complete(str(task.id), {"status": "failed"})
+
+        assert len(q._locks) == 0
+        assert len(q._delayed) == 1
+        assert t.retries == 1
+        assert not t.completed.is_set()
+
+        task = q.get("pool")
+        assert task is t
+        assert len(q._delayed) == 0
+
+    def test_queue_complete_failed_retry_delayed(self):
+        q = MultiLockPriorityPoolQueue()
+        t = Task("test_task", [], "pool", [], {}, max_retries=1, retry_delay=60)
+
+        q.put(t)
+        q.get("pool")
+        q.complete(str(t.id), {"status": "failed"})
+
+        assert q.get("pool") is None
+        assert q.tasks_delayed == (t,)
+
+        q.safe_remove(str(t.id))
+        assert len(q._delayed) == 0
+
+    def test_queue_retry_backoff(self):
+        t = Task("test_task", [], "pool", [], {},
+                 max_retries=10, retry_delay=1, retry_backoff=2, retry_max_delay=5)
+
+        delays = []
+        for _ in range(5):
+            delays.append(t.next_retry_delay().total_seconds())
+            t.retries += 1
+
+        assert delays == [1, 2, 4, 5, 5]
+
+    def test_queue_complete_failed_dead_letter(self):
+        q = MultiLockPriorityPoolQueue()
+        t = Task("test_task", [], "pool", [], {}, max_retries=0, dead_letter_pool="dead")
+
+        q.put(t)
+        q.get("pool")
+        q.complete(str(t.id), {"status": "failed"})
+
+        assert t.completed.is_set()
+        assert t.dead_lettered
+        assert q.get("pool") is None
+        assert q.get("dead") is t
+
+    def test_queue_retry_keeps_unique(self):
+        q = MultiLockPriorityPoolQueue()
+        t = Task("test_task", [], "pool", [], {}, max_retries=1, retry_delay=60)
+        t2 = Task("test_task", [], "pool", [], {})
+
+        q.put(t)
+        q.get("pool")
+        q.complete(str(t.id), {"status": "failed"})
+
+        assert q.put(t2, unique=True) is t
+
+    def test_queue_expired_dropped_on_get(self):
+        q = MultiLockPriorityPoolQueue()
+        t1 = Task("test_task", [], "pool", [1], {}, ttl=-1)
+        t2 = Task("test_task", [], "pool", [2], {})
+
+        q.put(t1)
+        q.put(t2)
+
+        assert q.get("pool") is t2
+        assert q.task_count == 0
+        assert t1.completed.is_set()
+        assert t1.status == "expired"
+        assert q.expire() == [t1]
+
+    def test_queue_expire_sweep(self):
+        q = MultiLockPriorityPoolQueue()
+        now = datetime.now(timezone.utc)
+        t1 = Task("test_task", [], "pool", [1], {}, expires_at=(now + timedelta(seconds=10)).isoformat())
+        t2 = Task("test_task", [], "pool", [2], {}, ttl=60)
+        t3 = Task("test_task", [], "pool", [3], {})
+
+        q.put(t1)
+        q.put(t2)
+        q.put(t3)
+
+        assert q.expire(now) == []
+        assert q.expire(now + timedelta(seconds=30)) == [t1]
+        assert q.tasks == (t2, t3)
+
+    def test_queue_expire_taken_task(self):
+        q = MultiLockPriorityPoolQueue()
+        t = Task("test_task", [], "pool", [1], {}, ttl=10)
+
+        q.put(t)
+        q.get("pool")
+
+        assert q.expire(datetime.now(timezone.utc) + timedelta(seconds=30)) == []
+        assert q.tasks_taken == (t,)
+
+    def test_queue_add_replace(self):
+        q = MultiLockPriorityPoolQueue()
+        t1 = Task("test_task", [1], "pool", [1], {"version": 1})
+        t2 = Task("test_task", [1], "pool", [2], {"version": 1})
+        t3 = Task("test_task", [1], "pool", [1], {"version": 2})
+
+        q.put(t1)
+        q.put(t2)
+
+        assert q.put(t3, replace=True) is t1
+        assert q.tasks == (t1, t2)
+        assert t1.kwargs == {"version": 2}
+
+    def test_queue_add_replace_missing(self):
+        q = MultiLockPriorityPoolQueue()
+        t1 = Task("test_task", [1], "pool", [1], {"version": 1})
+        t2 = Task("test_task", [1], "pool", [1], {"version": 2})
+
+        q.put(t1)
+        q.get("pool")
+
+        assert q.put(t2, replace=True) is t2
+        assert q.tasks == (t2,)
+        assert not q._identities[t2.identity].get(t1.id)
+
+    def test_queue_identity_index_cleanup(self):
+        q = MultiLockPriorityPoolQueue()
+        t1 = Task("test_task", [1], "pool", [1], {})
+        t2 = Task("test_task", [2], "pool", [1], {})
+
+        q.put(t1)
+        q.put(t2)
+        q.get("pool")
+        q.safe_remove(str(t2.id))
+
+        assert q._identities == {}
+
+    def test_queue_snapshot_restore(self):
+        q = MultiLockPriorityPoolQueue()
+        t1 = Task("test_task", [1], "pool", [1], {})
+        t2 = Task("test_task", [1], "pool", [2], {"a": 1}, ttl=60)
+        t3 = Task("test_task", [], "pool", [3], {}, max_retries=1, retry_delay=60)
+
+        q.put(t1)
+        q.put(t2)
+        q.put(t3)
+        q.get("pool")
+        q.get("pool")
+        q.complete(str(t3.id), {"status": "failed"})
+
+        q2 = MultiLockPriorityPoolQueue()
+        for state, task, ready_at in q.iter_snapshot():
+            q2.restore(state, Task.from_snapshot(task.snapshot), ready_at)
+
+        assert q2.tasks_active == (t1.id,)
+        assert q2.tasks_pending == (t2.id,)
+        assert [task.id for task in q2.tasks_delayed] == [t3.id]
+        assert q2.tasks_delayed[0].retries == 1
+        assert q2.tasks[0].expires_at == t2.expires_at
+        assert q2.tasks[0].kwargs == {"a": 1}
+        assert set(q2._locks) == {1}
+
+        with pytest.raises(ValueError):
+            q2.restore("queued", t2)
+
+    def test_queue_dependencies(self):
+        q = MultiLockPriorityPoolQueue()
+        t1 = Task("test_task", [], "pool", [1], {})
+        t2 = Task("test_task", [], "pool", [2], {})
+        t3 = Task("test_task", [], "pool", [3], {}, depends_on=[str(t1.id), str(t2.id)])
+        t4 = Task("test_task", [], "pool", [4], {}, depends_on=[str(uuid.uuid4())])
+
+        q.put(t1)
+        q.put(t2)
+        q.put(t3)
+        q.put(t4)
+
+        assert q.tasks_blocked == (t3,)
+        assert q.tasks_pending == (t1.id, t2.id, t4.id)
+        assert q.find(str(t3.id)) is t3
+
+        q.get("pool")
+        q.complete(str(t1.id), {"status": "success"})
+        assert q.tasks_blocked == (t3,)
+        assert t3.waiting_on == {t2.id}
+
+        q.get("pool")
+        q.complete(str(t2.id), {"status": "success"})
+        assert q.tasks_blocked == ()
+        assert q.tasks_pending == (t4.id, t3.id)
+        assert q._dependents == {}
+
+    def test_queue_dependencies_parent_failed(self):
+        q = MultiLockPriorityPoolQueue()
+        t1 = Task("test_task", [], "pool", [1], {})
+        t2 = Task("test_task", [], "pool", [2], {}, depends_on=[str(t1.id)])
+        t3 = Task("test_task", [], "pool", [3], {}, depends_on=[str(t2.id)])
+        t4 = Task("test_task", [], "pool", [4], {}, depends_on=[str(t1.id)], on_parent_failure="run")
+
+        for task in (t1, t2, t3, t4):
+            q.put(task)
+
+        q.get("pool")
+        q.complete(str(t1.id), {"status": "failed"})
+
+        assert t2.status == "cancelled"
+        assert t3.status == "cancelled"
+        assert t3.completed.is_set()
+        assert q.tasks_blocked == ()
+        assert q.tasks_pending == (t4.id,)
+
+        with pytest.raises(ValueError):
+            Task("test_task", [], "pool", [], {}, on_parent_failure="ignore")
+
+    def test_queue_dependencies_retry_and_remove(self):
+        q = MultiLockPriorityPoolQueue()
+        t1 = Task("test_task", [], "pool", [1], {}, max_retries=1, retry_delay=60)
+        t2 = Task("test_task", [], "pool", [2], {}, depends_on=[str(t1.id)])
+        t3 = Task("test_task", [], "pool", [3], {}, depends_on=[str(t2.id)], on_parent_failure="run")
+
+        q.put(t1)
+        q.put(t2)
+        q.put(t3)
+        q.get("pool")
+        q.complete(str(t1.id), {"status": "failed"})
+
+        assert q.tasks_delayed == (t1,)
+        assert q.tasks_blocked == (t2, t3)
+
+        q2 = MultiLockPriorityPoolQueue()
+        for state, task, ready_at in q.iter_snapshot():
+            q2.restore(state, Task.from_snapshot(task.snapshot), ready_at)
+
+        assert [task.id for task in q2.tasks_blocked] == [t2.id, t3.id]
+        assert q2.tasks_blocked[1].on_parent_failure == "run"
+
+        q.safe_remove(str(t2.id))
+        assert q.tasks_blocked == ()
+        assert q.tasks_pending == (t3.id,)
+
+    def test_queue_session_expiry_requeue(self):
+        q = MultiLockPriorityPoolQueue(session_timeout=10)
+        t1 = Task("test_task", [1], "pool", [1], {})
+        t2 = Task("test_task", [2], "pool", [2], {})
+        t3 = Task("test_task", [], "pool", [3], {})
+        t4 = Task("test_task", [], "pool", [4], {})
+
+        for task in (t1, t2, t3, t4):
+            q.put(task)
+
+        q.get("pool", session="a")
+        q.get("pool", session="a")
+        q.get("pool", session="b")
+        now = datetime.now(timezone.utc)
+
+        assert q.session_summary(now)["a"]["active"] == 2
+        assert q.expire_sessions(now) == []
+
+        q.heartbeat("b", now + timedelta(seconds=5))
+        lost = q.expire_sessions(now + timedelta(seconds=11))
+
+        assert lost == [("a", [t1, t2])]
+        assert q.tasks_pending == (t1.id, t2.id, t4.id)
+        assert q.tasks_active == (t3.id,)
+        assert q.locks == frozenset()
+        assert list(q._sessions) == ["b"]
+        assert t1.taken is None
+
+        assert q.get("pool") is t1
+
+    def test_queue_session_expiry_fail(self):
+        q = MultiLockPriorityPoolQueue(session_requeue=False)
+        t1 = Task("test_task", [1], "pool", [1], {})
+        t2 = Task("test_task", [], "pool", [2], {}, max_retries=1, retry_delay=60)
+
+        q.put(t1)
+        q.put(t2)
+        q.get("pool", session="a")
+        q.get("pool", session="a")
+        q.complete(str(t1.id), {"status": "success"})
+
+        assert q.end_session("a") == [t2]
+        assert q.tasks_delayed == (t2,)
+        assert q._session_tasks == {}
+
+        t3 = Task("test_task", [3], "pool", [3], {})
+        q.put(t3)
+        q.get("pool", session="b")
+        q.end_session("b")
+
+        assert t3.status == "failed"
+        assert q.locks == frozenset()
+
+    def test_queue_payload_interning(self):
+        q = MultiLockPriorityPoolQueue()
+        payload = {"blob": "x" * 1000}
+        t1 = Task("test_task", [], "pool", [1], dict(payload))
+        t2 = Task("test_task", [], "pool", [2], dict(payload))
+        t3 = Task("test_task", [], "pool", [1], dict(payload))
+
+        q.put(t1)
+        q.put(t2)
+        assert t1.kwargs is t2.kwargs
+        assert q.payloads.refcount(t1.kwargs_digest) == 2
+
+        assert q.put(t3, unique=True) is t1
+        assert q.payloads.refcount(t1.kwargs_digest) == 2
+
+        q.get("pool")
+        q.complete(str(t1.id), {"status": "success"})
+        assert q.payloads.refcount(t1.kwargs_digest) == 1
+
+        q.safe_remove(str(t2.id))
+        assert len(q.payloads) == 0
+        assert q.payloads.size == 0
+
+    def test_queue_payload_replace(self):
+        q = MultiLockPriorityPoolQueue()
+        t1 = Task("test_task", [], "pool", [1], {"a": 1})
+        t2 = Task("test_task", [], "pool", [1], {"a": 2})
+
+        q.put(t1)
+        q.put(t2, replace=True)
+
+        assert t1.kwargs == {"a": 2}
+        assert t1.kwargs_digest == t2.kwargs_digest
+        assert len(q.payloads) == 2
+        assert q.payloads.refcount(t2.kwargs_digest) == 1
+        assert t2.args_digest in q.payloads
+
+    def test_task_for_json_payload_limit(self):
+        t = Task("test_task", [], "pool", [1], {"blob": "x" * 100})
+
+        data = t.for_json(payload_limit=50)
+        assert data["args"] == [1]
+        assert data["kwargs"] is None
+        assert data["kwargs_digest"] == t.kwargs_digest
+        assert data["kwargs_size"] > 100
+
+        assert t.for_json()["kwargs"] == {"blob": "x" * 100}
+
+    def test_queue_group_counters(self):
+        q = MultiLockPriorityPoolQueue()
+        t1 = Task("test_task", [], "pool", [1], {}, group="g")
+        t2 = Task("test_task", [], "pool", [2], {}, group="g", max_retries=1, retry_delay=0)
+        t3 = Task("test_task", [], "pool", [3], {}, group="g")
+        callback = Task("callback", [], "pool", [], {})
+
+        for task in (t1, t2, t3):
+            q.put(task)
+        q.put(Task("test_task", [], "pool", [1], {}, group="g"), unique=True)
+
+        group = q.find_group("g")
+        assert group.counts == {"queued": 3}
+
+        q.get("pool")
+        q.get("pool")
+        q.complete(str(t1.id), {"status": "success"})
+        q.complete(str(t2.id), {"status": "failed"})
+        assert group.for_json()["done"] == 1
+        assert group.for_json()["queued"] == 2
+
+        q.seal_group("g", callback)
+        q.safe_remove(str(t3.id))
+        assert not group.completed.is_set()
+
+        q.get("pool")
+        q.complete(str(t2.id), {"status": "failed"})
+
+        assert group.completed.is_set()
+        assert group.for_json()["failed"] == 2
+        assert q.tasks == (callback,)
+        assert q.find_group("g") is group
+
+        with pytest.raises(ValueError):
+            q.seal_group("g")
+
+        with pytest.raises(LookupError):
+            q.find_group("other")
+
+    def test_queue_get_any(self):
+        q = MultiLockPriorityPoolQueue()
+        t1 = Task("test_task", [1], "a", [1], {})
+        t2 = Task("test_task", [1], "b", [2], {})
+        t3 = Task("test_task", [], "c", [3], {})
+
+        q.put(t1)
+        q.put(t2)
+        q.put(t3)
+
+        assert q.get_any(["b", "a", "c"]) is t2
+        assert q.get_any(["a", "b"]) is None
+        assert q.get_any(["a", "c"]) is t3
+
+    def test_task_retry_fields(self):
+        task = Task("test_task", [], "pool", [], {}, max_retries="3", retry_delay="0.5")
+        assert task.max_retries == 3
+        assert task.retry_delay == 0.5
+
+        for field, value in (("max_retries", "x"), ("max_retries", -1), ("retry_delay", float("nan")),
+                             ("retry_backoff", None), ("retry_max_delay", float("inf"))):
+            with pytest.raises(ValueError):
+                Task("test_task", [], "pool", [], {}, **{field: value})
+
+    def test_queue_dependency_cancel_deep_chain(self):
+        q = MultiLockPriorityPoolQueue()
+        root = Task("test_task", [], "pool", [0], {})
+        q.put(root)
+
+        parent = root
+        for i in range(sys.getrecursionlimit() + 500):
+            parent = q.put(Task("test_task", [], "pool", [i + 1], {}, depends_on=[str(parent.id)]))
+
+        q.get("pool")
+        q.complete(str(root.id), {"status": "failed"})
+
+        assert q.tasks_blocked == ()
+        assert parent.status == "cancelled"
+        assert len(q) == 0
+
+    def test_parse_datetime(self):
+        utc = datetime(2024, 5, 1, 10, 20, 30, tzinfo=timezone.utc)
+        assert parse_datetime("2024-05-01T10:20:30Z") == utc
+        assert parse_datetime("2024-05-01T10:20:30") == utc
+        assert parse_datetime("2024-05-01T12:20:30.000+02:00") == utc
+        assert parse_datetime(utc.isoformat()) == utc
+        assert parse_datetime("2024-05-01") == datetime(2024, 5, 1, tzinfo=timezone.utc)
+
+        for value in ("tomorrow", "2024-13-01", "2024-05-01T10:20:30+2"):
+            with pytest.raises(ValueError):
+                parse_datetime(value)
+
+        with pytest.raises(TypeError):
+            parse_datetime(5)
+
+    def test_weighted_order(self):
+        rng = random.Random(1)
+        first = Counter(weighted_order(["a", "b"], [9.0, 1.0], rng)[0] for _ in range(1000))
+
+        assert sorted(weighted_order(["a", "b", "c"], [1.0, 1.0, 1.0], rng)) == ["a", "b", "c"]
+        assert first["a"] > 800
+
+    def test_queue_wait_for_task(self):
+        q = MultiLockPriorityPoolQueue()
+        t = Task("test_task", [], "b", [1], {})
+
+        async def wait():
+            waiter = asyncio.ensure_future(q.wait_for_task(["a", "b"], 5))
+            await asyncio.sleep(0)
+            assert set(q._waiters) == {"a", "b"}
+
+            q.put(t)
+            await waiter
+            return q.get_any(["a", "b"])
+
+        assert self.loop.run_until_complete(wait()) is t
+        assert q._waiters == {}
+
+    def test_queue_append_output(self):
+        q = MultiLockPriorityPoolQueue(output_limit=8)
+        t = Task("test_task", [], "pool", [1], {}, max_retries=1, retry_delay=0)
+
+        q.put(t)
+        with pytest.raises(LookupError):
+            q.append_output(str(t.id), "stdout", b"queued")
+
+        q.get("pool")
+        q.append_output(str(t.id), "stdout", b"attempt 1\n")
+        q.complete(str(t.id), {"status": "failed"})
+        assert not t.outputs["stdout"].closed
+
+        q.get("pool")
+        q.append_output(str(t.id), "stdout", b"done\n")
+        q.append_output(str(t.id), "stderr", b"warning\n")
+        q.complete(str(t.id), {"status": "success", "stderr": ""})
+
+        assert t.stdout == " 1\ndone\n"
+        assert t.stderr == ""
+        assert t.outputs["stdout"].closed
+
+        with pytest.raises(ValueError):
+            q.append_output(str(t.id), "stdin", b"")
+
+    def test_queue_output_dir_cleanup(self):
+        with tempfile.TemporaryDirectory() as output_dir:
+            q = MultiLockPriorityPoolQueue(output_dir=output_dir)
+            t1 = Task("test_task", [], "pool", [1], {}, max_retries=1, retry_delay=0)
+            t2 = Task("test_task", [], "pool", [2], {})
+            t3 = Task("test_task", [], "pool", [3], {})
+            for task in (t1, t2, t3):
+                q.put(task)
+                q.get("pool")
+                q.append_output(str(task.id), "stdout", b"output\n")
+            assert len(os.listdir(output_dir)) == 3
+
+            q.complete(str(t1.id), {"status": "failed"})
+            assert len(os.listdir(output_dir)) == 3
+
+            q.get("pool")
+            q.complete(str(t1.id), {"status": "success"})
+            q.safe_remove(str(t2.id))
+            assert os.listdir(output_dir) == ["{}.stdout".format(t3.id.hex)]
+
+            q.close()
+            assert os.listdir(output_dir) == []
+
+    def test_queue_lock_reservation(self):
+        q = MultiLockPriorityPoolQueue(lock_reserve_after=10)
+        a1 = Task("test_task", ["a"], "pool", [1], {})
+        b1 = Task("test_task", ["b"], "pool", [2], {})
+        big = Task("test_task", ["a", "b"], "pool", [3], {})
+        a2 = Task("test_task", ["a"], "pool", [4], {})
+        b2 = Task("test_task", ["b"], "pool", [5], {})
+
+        for task in (a1, b1, big, a2, b2):
+            q.put(task)
+
+        assert q.get("pool") is a1
+        assert q.get("pool") is b1
+        assert q.get("pool") is None
+
+        big.queued_at -= timedelta(seconds=20)
+        q.complete(str(a1.id), {"status": "success"})
+
+        assert q._reservations == {"a": big, "b": big}
+        assert q.get("pool") is None
+        assert q.lock_summary()["a"]["reserved"] == str(big.id)
+
+        q.complete(str(b1.id), {"status": "success"})
+        assert q.get("pool") is big
+        assert q._reservations == {}
+
+    def test_queue_lock_reservation_by_age(self):
+        q = MultiLockPriorityPoolQueue(lock_reserve_after=10)
+        running = Task("test_task", ["a", "b"], "pool", [1], {})
+        older = Task("test_task", ["a", "b"], "pool", [2], {})
+        younger = Task("test_task", ["b"], "pool", [3], {})
+
+        q.put(running)
+        q.get("pool")
+        q.put(older)
+        q.put(younger)
+        older.queued_at -= timedelta(seconds=30)
+        younger.queued_at -= timedelta(seconds=20)
+
+        q._maybe_reserve(younger, datetime.now(timezone.utc))
+        assert q._reservations == {"b": younger}
+
+        assert q.get("pool") is None
+        assert q._reservations == {"a": older, "b": older}
+
+        q.complete(str(running.id), {"status": "success"})
+        assert q.get("pool") is older
+
+    def test_queue_edf_order(self):
+        q = MultiLockPriorityPoolQueue(edf_pools=["edf"])
+        now = datetime.now(timezone.utc)
+        late = Task("test_task", [], "edf", [1], {}, deadline=now + timedelta(minutes=10))
+        none = Task("test_task", [], "edf", [2], {})
+        early = Task("test_task", ["a"], "edf", [3], {}, deadline=now + timedelta(minutes=1))
+        middle = Task("test_task", [], "edf", [4], {}, deadline=(now + timedelta(minutes=5)).isoformat())
+        holder = Task("test_task", ["a"], "fifo", [5], {})
+
+        for task in (late, none, early, middle, holder):
+            q.put(task)
+
+        assert q.get("fifo") is holder
+        assert q.get("edf") is middle
+        assert q.get("edf") is late
+
+        q.complete(str(holder.id), {"status": "success"})
+        assert q.get("edf") is early
+        assert q.get("edf") is none
+        assert q.get("edf") is None
+
+    def test_queue_edf_shed(self):
+        q = MultiLockPriorityPoolQueue(edf_pools=["edf"])
+        now = datetime.now(timezone.utc)
+        t1 = Task("test_task", [], "edf", [1], {}, deadline=now + timedelta(seconds=30))
+        t2 = Task("test_task", [], "edf", [2], {}, deadline=now + timedelta(seconds=90))
+        t3 = Task("test_task", [], "edf", [3], {})
+
+        for task in (t1, t2, t3):
+            q.put(task)
+
+        assert q.get("edf") is t1
+        t1.taken -= timedelta(seconds=60)
+        q.complete(str(t1.id), {"status": "success"})
+        assert q._run_times == {"edf": pytest.approx(60, abs=1)}
+
+        assert q.shed_missed(now) == []
+        assert q.shed_missed(now + timedelta(seconds=40)) == [t2]
+        assert t2.status == "missed"
+        assert t2.completed.is_set()
+        assert q.get("edf") is t3
+
+    def test_queue_edf_shed_releases_dependents(self):
+        q = MultiLockPriorityPoolQueue(edf_pools=["edf"])
+        now = datetime.now(timezone.utc)
+        parent = Task("test_task", [], "edf", [1], {}, deadline=now + timedelta(seconds=5))
+        child = Task("test_task", [], "edf", [2], {}, depends_on=[str(parent.id)],
+                     on_parent_failure="run", deadline=now + timedelta(seconds=4))
+
+        q.put(parent)
+        q.put(child)
+
+        assert q.shed_missed(now + timedelta(seconds=6)) == [parent, child]
+        assert child.status == "missed"
+        assert len(q) == 0
+
+    def test_queue_edf_shed_on_get(self):
+        q = MultiLockPriorityPoolQueue(edf_pools=["edf"])
+        now = datetime.now(timezone.utc)
+        t1 = Task("test_task", [], "edf", [1], {}, deadline=now - timedelta(seconds=1))
+        t2 = Task("test_task", [], "edf", [2], {}, deadline=now + timedelta(seconds=60))
+        child = Task("test_task", [], "edf", [3], {}, depends_on=[str(t1.id)])
+
+        for task in (t1, t2, child):
+            q.put(task)
+
+        assert q.get("edf") is t2
+        assert t1.status == "missed"
+        assert child.status == "cancelled"
+        assert q.shed_missed() == [t1]
+        assert len(q) == 0
+
+    def test_queue_pool_summary(self):
+        q = MultiLockPriorityPoolQueue()
+        t1 = Task("test_task", [1], "pool", [1], {})
+        t2 = Task("test_task", [1, 2], "pool", [2], {})
+        t3 = Task("test_task", [2], "pool_2", [3], {})
+
+        q.put(t1)
+        q.put(t2)
+        q.put(t3)
+        q.get("pool")
+
+        summary = q.pool_summary(t2.created + timedelta(seconds=5))
+        assert summary["pool"]["queued"] == 1
+        assert summary["pool"]["active"] == 1
+        assert summary["pool"]["oldest_queued_age"] == 5
+        assert summary["pool_2"]["queued"] == 1
+        assert summary["pool_2"]["active"] == 0
+
+        assert q.lock_summary() == {
+            "1": {"waiters": 1, "taken": True, "reserved": None},
+            "2": {"waiters": 2, "taken": False, "reserved": None}
+        }
+
+        q.complete(str(t1.id), {"status": "success"})
+        q.safe_remove(str(t2.id))
+        q.get("pool_2")
+
+        assert q.pool_summary() == {"pool_2": {"queued": 0, "active": 1, "oldest_queued_age": None}}
+        assert q.lock_summary() == {"2": {"waiters": 0, "taken": True, "reserved": None}}
+
+    def test_queue_spill(self):
+        with tempfile.TemporaryDirectory() as spill_dir:
+            q = MultiLockPriorityPoolQueue(spill_dir=spill_dir, spill_threshold=2)
+            tasks = [Task("test_task", [], "pool", [i], {}) for i in range(6)]
+
+            for task in tasks:
+                q.put(task)
+
+            assert q.task_count == 2
+            assert len(q) == 6
+            assert q.queued_count("pool") == 6
+            assert len(os.listdir(spill_dir)) == 1
+
+            taken = []
+            while True:
+                task = q.get("pool")
+                if task is None:
+                    break
+                taken.append(task.args[0])
+
+            assert taken == list(range(6))
+            assert len(q) == 0
+            assert os.listdir(spill_dir) == []
+
+    def test_queue_spill_rotation(self):
+        with tempfile.TemporaryDirectory() as spill_dir:
+            q = MultiLockPriorityPoolQueue(spill_dir=spill_dir, spill_threshold=10)
+            q.spill_segment_size = 4096
+
+            for i in range(100):
+                q.put(Task("test_task", [], "pool", [i], {}))
+
+            # A steady backlog keeps the disk use bounded
+            sizes = []
+            for i in range(100, 3100):
+                q.put(Task("test_task", [], "pool", [i], {}))
+                task = q.get("pool")
+                q.complete(str(task.id), {"status": "success"})
+                sizes.append(sum(os.path.getsize(os.path.join(spill_dir, name)) for name in os.listdir(spill_dir)))
+
+            assert task.args == [2999]
+            assert max(sizes[-1000:]) <= max(sizes[:1000]) + q.spill_segment_size
+            assert len(os.listdir(spill_dir)) < 20
+
+            assert [task.args[0] for task in q.iter_queued()] == list(range(3000, 3100))
+            while q.get("pool"):
+                pass
+            assert os.listdir(spill_dir) == []
+
+    def test_queue_spill_unique_and_remove(self):
+        with tempfile.TemporaryDirectory() as spill_dir:
+            q = MultiLockPriorityPoolQueue(spill_dir=spill_dir, spill_threshold=1)
+            t1 = Task("test_task", [], "pool", [1], {})
+            t2 = Task("test_task", [], "pool", [2], {"v": 1})
+            t3 = Task("test_task", [], "pool", [3], {})
+
+            q.put(t1)
+            q.put(t2)
+            q.put(t3)
+
+            duplicate = q.put(Task("test_task", [], "pool", [2], {"v": 1}), unique=True)
+            assert duplicate.id == t2.id
+            assert q._materialized == {}
+
+            replaced = q.put(Task("test_task", [], "pool", [2], {"v": 2}), replace=True)
+            assert replaced.id == t2.id
+            assert q._materialized == {t2.id: replaced}
+
+            q.safe_remove(str(t3.id))
+            assert q.find(str(t2.id)).id == t2.id
+            assert len(q) == 2
+
+            assert q.get("pool") is t1
+            task = q.get("pool")
+            assert task is replaced
+            assert task.kwargs == {"v": 2}
+            assert q.get("pool") is None
+            assert os.listdir(spill_dir) == []
+
+    def test_queue_spill_watched(self):
+        with tempfile.TemporaryDirectory() as spill_dir:
+            q = MultiLockPriorityPoolQueue(spill_dir=spill_dir, spill_threshold=2)
+            parent = Task("test_task", [], "other", [0], {})
+            tasks = [Task("test_task", [], "pool", [i], {}) for i in range(4)]
+            child = Task("test_task", [], "pool", [4], {}, depends_on=[str(parent.id)])
+
+            q.put(parent)
+            q.watch(q.put(child))
+            for task in tasks:
+                q.put(task)
+            q.watch(tasks[3])
+
+            assert [task.args[0] for task in q.iter_queued()] == [0, 0, 1, 2, 3]
+
+            q.complete(str(q.get("other").id), {"status": "success"})
+
+            taken = [q.get("pool") for _ in range(5)]
+            assert taken[3] is tasks[3]
+            assert taken[4] is child
+            assert taken[2] is not tasks[2]
+            q.close()
+
+    def test_queue_spill_snapshot(self):
+        with tempfile.TemporaryDirectory() as spill_dir:
+            q = MultiLockPriorityPoolQueue(spill_dir=spill_dir, spill_threshold=1)
+            tasks = [Task("test_task", [], "pool", [i], {}) for i in range(3)]
+
+            for task in tasks:
+                q.put(task)
+
+            assert [task.id for _, task, _ in q.iter_snapshot()] == [task.id for task in tasks]
+            q.close()
+            assert os.listdir(spill_dir) == []
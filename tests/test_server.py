@@ -1,11 +1,18 @@
 import asyncio
+import json
+from datetime import datetime, timedelta, timezone
 
 import pytest
+from aiohttp import ClientSession, UnixConnector
 
+from queueueue.acceptor import _proxy
 from queueueue.app import (build_app, get_encoded_auth, setup_basic_auth,
-                           setup_bearer_auth)
+                           setup_bearer_auth, setup_token_file)
+from queueueue.auth import hash_secret
+from queueueue.limits import EnqueueLimits
 from queueueue.routes import setup_routes
-from queueueue.taskqueue import Task
+from queueueue.server import start_server
+from queueueue.taskqueue import MultiLockPriorityPoolQueue, Task
 
 
 @pytest.fixture
@@ -373,3 +380,667 @@ async def test_mixed_auth_passing(cli):
     auth = "Bearer really_long_token"
     response = await cli.get("/task", headers={"Authorization": auth})
     assert response.status == 200
+
+
+async def test_queue_task_retry(cli, app):
+    task = Task("test_task", ["1"], "pool", [1], {})
+    data = task.for_json()
+    data.update(max_retries=1, retry_delay=0)
+    await cli.post("/task", json=data)
+
+    response = await cli.patch("/task/pending", params={"pool": "pool"})
+    data = await response.json()
+
+    response = await cli.patch(
+        "/task/{}".format(data["id"]),
+        json={"stdout": "", "stderr": "", "result": "", "status": "failed"}
+    )
+    assert response.status == 200
+
+    response = await cli.get("/task/delayed")
+    data = await response.json()
+    assert len(data) == 1
+    assert data[0]["retries"] == 1
+
+    stats_data = dict(app["stats"].stat_iter())
+    assert stats_data["tasks_retried.pool.pool"] == 1
+    assert stats_data["tasks_completed.total"] == 0
+
+    response = await cli.patch("/task/pending", params={"pool": "pool"})
+    data = await response.json()
+    assert data["id"] == str(task.id)
+
+
+async def test_queue_task_depends_on(cli):
+    parent = Task("test_task", [], "pool", [1], {})
+    child = Task("test_task", [], "pool", [2], {})
+    await cli.post("/task", json=parent.for_json())
+
+    data = child.for_json()
+    data["depends_on"] = [str(parent.id)]
+    await cli.post("/task", json=data)
+
+    response = await cli.get("/task/blocked")
+    data = await response.json()
+    assert [task["id"] for task in data] == [str(child.id)]
+    assert data[0]["depends_on"] == [str(parent.id)]
+
+    response = await cli.patch("/task/pending", params={"pool": "pool"})
+    data = await response.json()
+    assert data["id"] == str(parent.id)
+
+    response = await cli.patch("/task/pending", params={"pool": "pool"})
+    assert await response.json() is None
+
+    await cli.patch(
+        "/task/{}".format(parent.id),
+        json={"stdout": "", "stderr": "", "result": "", "status": "success"}
+    )
+
+    response = await cli.patch("/task/pending", params={"pool": "pool"})
+    data = await response.json()
+    assert data["id"] == str(child.id)
+
+
+async def test_queue_worker_sessions(cli, app):
+    task = Task("test_task", ["1"], "pool", [1], {})
+    await cli.post("/task", json=task.for_json())
+
+    response = await cli.patch("/task/pending", params={"pool": "pool", "session": "worker.1"})
+    data = await response.json()
+    assert data["id"] == str(task.id)
+
+    response = await cli.patch("/session/worker.1")
+    assert response.status == 200
+
+    response = await cli.get("/session")
+    data = await response.json()
+    assert data["worker.1"]["active"] == 1
+
+    stats_data = dict(app["stats"].stat_iter())
+    assert stats_data["worker_taken.worker.worker_1"] == 1
+    assert stats_data["worker_active.worker.worker_1"] == 1
+
+    response = await cli.delete("/session/worker.1")
+    data = await response.json()
+    assert data == {"released": 1}
+
+    stats_data = dict(app["stats"].stat_iter())
+    assert stats_data["tasks_lost.pool.pool"] == 1
+    assert "worker_taken.worker.worker_1" not in stats_data
+
+    response = await cli.patch("/task/pending", params={"pool": "pool"})
+    data = await response.json()
+    assert data["id"] == str(task.id)
+
+
+async def test_queue_task_list_large_payload(cli, app):
+    app["payload_listing_limit"] = 64
+    task = Task("test_task", [], "pool", [1], {"blob": "x" * 100})
+    await cli.post("/task", json=task.for_json())
+
+    response = await cli.get("/task")
+    data = await response.json()
+    assert data[0]["kwargs"] is None
+    assert data[0]["kwargs_digest"] == task.kwargs_digest
+
+    response = await cli.get("/task", params={"payload": "full"})
+    data = await response.json()
+    assert data[0]["kwargs"] == task.kwargs
+
+    response = await cli.get("/summary")
+    data = await response.json()
+    assert data["payloads"]["count"] == 2
+
+
+async def test_queue_task_group(cli):
+    task = Task("test_task", [], "pool", [1], {}, group="batch")
+    await cli.post("/task", json=task.for_json())
+
+    callback = Task("callback", [], "pool", [], {})
+    response = await cli.patch("/group/batch", json={"callback": callback.for_json()})
+    data = await response.json()
+    assert data["sealed"]
+    assert data["queued"] == 1
+
+    response = await cli.get("/group/batch", params={"wait": "true", "timeout": "0"})
+    data = await response.json()
+    assert data["finished"] is None
+
+    waiter = asyncio.ensure_future(cli.get("/group/batch", params={"wait": "true"}))
+
+    response = await cli.patch("/task/pending", params={"pool": "pool"})
+    data = await response.json()
+    await cli.patch(
+        "/task/{}".format(data["id"]),
+        json={"stdout": "", "stderr": "", "result": "", "status": "success"}
+    )
+
+    response = await waiter
+    data = await response.json()
+    assert data["done"] == 1
+    assert data["finished"] is not None
+
+    response = await cli.patch("/task/pending", params={"pool": "pool"})
+    data = await response.json()
+    assert data["id"] == str(callback.id)
+
+    response = await cli.get("/group/unknown")
+    assert response.status == 404
+
+
+async def test_queue_get_task_multiple_pools(cli):
+    task = Task("test_task", [], "b", [1], {})
+    await cli.post("/task", json=task.for_json())
+
+    response = await cli.patch("/task/pending", params=[("pool", "a"), ("pool", "b")])
+    data = await response.json()
+    assert data["id"] == str(task.id)
+
+    response = await cli.patch(
+        "/task/pending", params=[("pool", "a"), ("pool", "b"), ("order", "weighted"), ("weight", "1")])
+    assert response.status == 400
+
+
+async def test_queue_get_task_long_poll(cli):
+    task = Task("test_task", [], "b", [1], {})
+    waiter = asyncio.ensure_future(cli.patch(
+        "/task/pending", params=[("pool", "a"), ("pool", "b"), ("timeout", "5")]))
+
+    await asyncio.sleep(0.05)
+    assert not waiter.done()
+    await cli.post("/task", json=task.for_json())
+
+    response = await waiter
+    data = await response.json()
+    assert data["id"] == str(task.id)
+
+
+async def test_admin_trace(app, cli, tmpdir):
+    path = str(tmpdir.join("trace.ndjson"))
+
+    response = await cli.post("/admin/trace", json={"name": "trace.ndjson"})
+    assert response.status == 403
+
+    app["trace_dir"] = str(tmpdir)
+    for name in [None, "", "..", "../trace.ndjson", "sub/trace.ndjson", path]:
+        response = await cli.post("/admin/trace", json={"name": name})
+        assert response.status == 400
+    assert tmpdir.listdir() == []
+
+    response = await cli.post("/admin/trace", json={"name": "trace.ndjson"})
+    data = await response.json()
+    assert data["recording"]
+    assert data["path"] == path
+
+    response = await cli.post("/admin/trace", json={"name": "trace.ndjson"})
+    assert response.status == 409
+
+    await cli.post("/task", json=Task("test_task", [], "pool", [1], {}).for_json())
+
+    response = await cli.delete("/admin/trace")
+    data = await response.json()
+    assert data == {"recording": False, "path": path, "records": 1}
+
+    response = await cli.delete("/admin/trace")
+    assert response.status == 400
+
+
+async def test_task_output_streaming(cli):
+    task = Task("test_task", [], "pool", [1], {})
+    await cli.post("/task", json=task.for_json())
+    await cli.patch("/task/pending", params={"pool": "pool"})
+
+    response = await cli.post("/task/{}/output/stdout".format(task.id), data=b"first\n")
+    data = await response.json()
+    assert data == {"offset": 6}
+
+    response = await cli.post("/task/{}/output/other".format(task.id), data=b"x")
+    assert response.status == 400
+
+    response = await cli.get("/task/{}/output/stdout".format(task.id), params={"offset": "2"})
+    assert response.headers["X-Output-Offset"] == "2"
+    assert await response.read() == b"rst\n"
+
+    follower = asyncio.ensure_future(cli.get(
+        "/task/{}/output/stdout".format(task.id), params={"follow": "true"}))
+    await asyncio.sleep(0.05)
+
+    await cli.post("/task/{}/output/stdout".format(task.id), data=b"second\n")
+    await cli.patch("/task/{}".format(task.id), json={"status": "success"})
+
+    response = await follower
+    assert await response.read() == b"first\nsecond\n"
+
+    response = await cli.post("/task/{}/output/stdout".format(task.id), data=b"late")
+    assert response.status == 404
+
+
+async def test_queue_expire_sweeper(aiohttp_client):
+    app = build_app()
+    app["expire_interval"] = 0.01
+    setup_routes(app)
+    cli = await aiohttp_client(app)
+
+    task = Task("test_task", [], "pool", [1], {})
+    data = task.for_json()
+    data["ttl"] = 0.05
+    await cli.post("/task", json=data)
+
+    await asyncio.sleep(0.01)
+    assert len(app["queue"]) == 1
+
+    await asyncio.sleep(0.2)
+    assert len(app["queue"]) == 0
+
+    stats_data = dict(app["stats"].stat_iter())
+    assert stats_data["tasks_expired.pool.pool"] == 1
+
+
+async def test_queue_deadline_sweeper(aiohttp_client):
+    app = build_app(MultiLockPriorityPoolQueue(edf_pools=["pool"]))
+    app["expire_interval"] = 0.01
+    setup_routes(app)
+    cli = await aiohttp_client(app)
+
+    task = Task("test_task", [], "pool", [1], {})
+    data = task.for_json()
+    data["deadline"] = (datetime.now(timezone.utc) + timedelta(seconds=0.05)).isoformat()
+    await cli.post("/task", json=data)
+
+    await asyncio.sleep(0.01)
+    assert len(app["queue"]) == 1
+
+    await asyncio.sleep(0.2)
+    assert len(app["queue"]) == 0
+
+    stats_data = dict(app["stats"].stat_iter())
+    assert stats_data["tasks_shed.pool.pool"] == 1
+    assert stats_data["deadline_missed.pool.pool"] == 1
+
+
+async def test_queue_add_unique_wait_coalesced(cli):
+    t1 = Task("test_task", ["1"], "pool", [1], {})
+    t2 = Task("test_task", ["1"], "pool", [1], {})
+
+    first = asyncio.ensure_future(
+        cli.post("/task", json=t1.for_json(), params={"wait": "true", "unique": "true"}))
+    await asyncio.sleep(0.05)
+    second = asyncio.ensure_future(
+        cli.post("/task", json=t2.for_json(), params={"wait": "true", "unique": "true"}))
+    await asyncio.sleep(0.05)
+
+    assert not first.done()
+    assert not second.done()
+
+    response = await cli.patch("/task/pending", params={"pool": "pool"})
+    data = await response.json()
+    assert data["id"] == str(t1.id)
+
+    response = await cli.patch(
+        "/task/{}".format(str(t1.id)),
+        json={"stdout": "", "stderr": "", "result": "shared", "status": "success"}
+    )
+    assert response.status == 200
+
+    for request in (first, second):
+        response = await request
+        data = await response.json()
+        assert data["result"] == "shared"
+
+
+async def test_queue_add_wait_spilled(aiohttp_client, tmp_path):
+    app = build_app(MultiLockPriorityPoolQueue(spill_dir=str(tmp_path), spill_threshold=1))
+    setup_routes(app)
+    cli = await aiohttp_client(app)
+
+    t1 = Task("test_task", [], "pool", [1], {})
+    t2 = Task("test_task", [], "pool", [2], {})
+    await cli.post("/task", json=t1.for_json())
+    waiting = asyncio.ensure_future(cli.post("/task", json=t2.for_json(), params={"wait": "true"}))
+    await asyncio.sleep(0.05)
+
+    response = await cli.get("/task")
+    assert [task["id"] for task in await response.json()] == [str(t1.id), str(t2.id)]
+
+    for task in (t1, t2):
+        response = await cli.patch("/task/pending", params={"pool": "pool"})
+        data = await response.json()
+        assert data["id"] == str(task.id)
+        await cli.patch("/task/{}".format(task.id), json={"result": task.args[0], "status": "success"})
+
+    response = await asyncio.wait_for(waiting, 1)
+    data = await response.json()
+    assert data["result"] == 2
+
+
+async def test_queue_add_replace(cli, app):
+    t1 = Task("test_task", ["1"], "pool", [1], {"version": 1})
+    t2 = Task("test_task", ["1"], "pool", [1], {"version": 2})
+
+    await cli.post("/task", json=t1.for_json(), params={"unique": "replace"})
+    response = await cli.post("/task", json=t2.for_json(), params={"unique": "replace"})
+    assert response.status == 200
+
+    response = await cli.get("/task")
+    data = await response.json()
+    assert len(data) == 1
+    assert data[0]["id"] == str(t1.id)
+    assert data[0]["kwargs"] == {"version": 2}
+
+
+async def test_admin_instrumentation(cli):
+    response = await cli.post("/admin/instrumentation")
+    assert response.status == 200
+
+    task = Task("test_task", [], "pool", [1], {})
+    await cli.post("/task", json=task.for_json())
+
+    response = await cli.get("/admin/instrumentation")
+    data = await response.json()
+    assert data["enabled"]
+    assert data["operations"]["put"]["calls"] == 1
+
+    response = await cli.delete("/admin/instrumentation")
+    data = await response.json()
+    assert not data["enabled"]
+
+
+async def test_admin_profile(cli):
+    response = await cli.delete("/admin/profile")
+    assert response.status == 404
+
+    response = await cli.post("/admin/profile")
+    assert response.status == 200
+
+    await cli.get("/task")
+
+    response = await cli.delete("/admin/profile", params={"sort": "unknown"})
+    assert response.status == 400
+
+    response = await cli.delete("/admin/profile", params={"limit": 5})
+    assert response.status == 200
+    assert "function calls" in await response.text()
+
+
+async def test_admin_snapshot(cli, app, aiohttp_client):
+    for number in range(3):
+        task = Task("test_task", [str(number)], "pool", [number], {})
+        await cli.post("/task", json=task.for_json())
+
+    await cli.patch("/task/pending", params={"pool": "pool"})
+
+    response = await cli.get("/admin/snapshot")
+    assert response.status == 200
+    dump = await response.read()
+    assert len(dump.splitlines()) == 3
+
+    target = build_app()
+    setup_routes(target)
+    target_cli = await aiohttp_client(target)
+
+    response = await target_cli.post("/admin/snapshot", data=dump + b"\n{broken\n")
+    data = await response.json()
+    assert data == {"restored": 3, "skipped": 1}
+
+    assert target["queue"].tasks_pending == app["queue"].tasks_pending
+    assert target["queue"].tasks_active == app["queue"].tasks_active
+    assert target["queue"].locks == app["queue"].locks
+
+
+async def test_queue_stream_tasks(cli):
+    for number in range(120):
+        task = Task("test_task", [], "pool_{}".format(number % 2), [number], {})
+        await cli.post("/task", json=task.for_json())
+
+    response = await cli.get("/task/stream")
+    assert response.status == 200
+    assert response.headers["Content-Type"] == "application/x-ndjson"
+    lines = (await response.read()).splitlines()
+    assert len(lines) == 120
+    assert [json.loads(line)["args"][0] for line in lines] == list(range(120))
+
+    response = await cli.get("/task/stream", params={"pool": "pool_1"})
+    lines = (await response.read()).splitlines()
+    assert len(lines) == 60
+
+    response = await cli.get("/task/stream", params={"state": "taken"})
+    assert await response.read() == b""
+
+    response = await cli.get("/task/stream", params={"state": "unknown"})
+    assert response.status == 400
+
+
+async def test_summary(cli, app):
+    for number in range(3):
+        task = Task("test_task", ["lock"], "pool", [number], {})
+        await cli.post("/task", json=task.for_json())
+
+    await cli.patch("/task/pending", params={"pool": "pool"})
+
+    response = await cli.get("/summary")
+    data = await response.json()
+    assert data["pools"]["pool"]["queued"] == 2
+    assert data["pools"]["pool"]["active"] == 1
+    assert data["locks"]["lock"] == {"waiters": 2, "taken": True, "reserved": None}
+
+    stats_data = dict(app["stats"].stat_iter())
+    assert stats_data["tasks_queued.pool.pool"] == 2
+    assert stats_data["tasks_active.pool.pool"] == 1
+    assert "tasks_oldest_queued_age.pool.pool" in stats_data
+
+
+async def test_token_file_revoke_all(aiohttp_client, tmpdir):
+    token_file = tmpdir.join("tokens")
+    token_file.write("bearer {}\n".format(hash_secret("token")))
+
+    app = build_app()
+    setup_token_file(app, str(token_file))
+    setup_routes(app)
+    cli = await aiohttp_client(app)
+
+    response = await cli.get("/task", headers={"Authorization": "Bearer token"})
+    assert response.status == 200
+
+    token_file.write("# all revoked\n")
+    app["auth"].reload()
+
+    response = await cli.get("/task", headers={"Authorization": "Bearer token"})
+    assert response.status == 403
+    response = await cli.get("/task")
+    assert response.status == 403
+
+
+async def test_bearer_auth_pool_scope(cli):
+    app = cli.server.app
+
+    app["auth"].add("bearer", "scoped", pools=["pool"])
+    auth = {"Authorization": "Bearer scoped"}
+
+    task = Task("test_task", [], "other", [1], {})
+    response = await cli.post("/task", json=task.for_json(), headers=auth)
+    assert response.status == 403
+
+    task = Task("test_task", [], "pool", [1], {})
+    response = await cli.post("/task", json=task.for_json(), headers=auth)
+    assert response.status == 200
+
+    response = await cli.patch("/task/pending", params={"pool": "other"}, headers=auth)
+    assert response.status == 403
+
+    response = await cli.patch("/task/pending", params={"pool": "pool"}, headers=auth)
+    assert response.status == 200
+
+    response = await cli.get("/admin/snapshot", headers=auth)
+    assert response.status == 403
+
+
+async def test_bearer_auth_pool_scope_listings(cli):
+    app = cli.server.app
+
+    app["auth"].add("bearer", "admin")
+    app["auth"].add("bearer", "scoped", pools=["pool"])
+    admin = {"Authorization": "Bearer admin"}
+    auth = {"Authorization": "Bearer scoped"}
+
+    for pool, lock in (("pool", "a"), ("other", "b"), ("pool", "c"), ("other", "d")):
+        task = Task("test_task", [lock], pool, [lock], {})
+        await cli.post("/task", json=task.for_json(), headers=admin)
+
+    await cli.patch("/task/pending", params={"pool": "pool"}, headers=admin)
+    await cli.patch("/task/pending", params={"pool": "other"}, headers=admin)
+
+    for path in ("/task", "/task/taken", "/task/stream"):
+        response = await cli.get(path, headers=auth)
+        if path == "/task/stream":
+            tasks = [json.loads(line) for line in (await response.text()).splitlines()]
+        else:
+            tasks = await response.json()
+        assert {task["pool"] for task in tasks} == {"pool"}
+
+    response = await cli.get("/task", headers=admin)
+    assert len(await response.json()) == 2
+
+    response = await cli.get("/lock", headers=auth)
+    assert [lock["id"] for lock in await response.json()] == ["a"]
+
+    response = await cli.get("/summary", headers=auth)
+    data = await response.json()
+    assert list(data["pools"]) == ["pool"]
+    assert list(data["locks"]) == ["a"]
+
+
+async def test_bearer_auth_pool_scope_sessions(cli):
+    app = cli.server.app
+
+    app["auth"].add("bearer", "admin")
+    app["auth"].add("bearer", "scoped", pools=["pool"])
+    admin = {"Authorization": "Bearer admin"}
+    auth = {"Authorization": "Bearer scoped"}
+
+    task = Task("test_task", [], "other", [1], {})
+    await cli.post("/task", json=task.for_json(), headers=admin)
+    await cli.patch("/task/pending", params={"pool": "other", "session": "w1"}, headers=admin)
+    await cli.patch("/session/w2", headers=auth)
+
+    response = await cli.get("/session", headers=auth)
+    assert list(await response.json()) == ["w2"]
+
+    response = await cli.patch("/session/w1", headers=auth)
+    assert response.status == 403
+
+    response = await cli.delete("/session/w1", headers=auth)
+    assert response.status == 403
+    assert len(app["queue"].tasks_taken) == 1
+
+    response = await cli.delete("/session/w2", headers=auth)
+    assert response.status == 200
+
+    response = await cli.delete("/session/w1", headers=admin)
+    assert (await response.json())["released"] == 1
+
+
+async def test_bearer_auth_pool_scope_groups(cli):
+    app = cli.server.app
+
+    app["auth"].add("bearer", "admin")
+    app["auth"].add("bearer", "scoped", pools=["pool"])
+    admin = {"Authorization": "Bearer admin"}
+    auth = {"Authorization": "Bearer scoped"}
+
+    for pool, group in (("pool", "mixed"), ("other", "mixed"), ("pool", "own")):
+        task = Task("test_task", [], pool, [1], {}, group=group)
+        await cli.post("/task", json=task.for_json(), headers=admin)
+
+    response = await cli.get("/group/mixed", headers=auth)
+    assert response.status == 403
+
+    response = await cli.patch("/group/mixed", headers=auth)
+    assert response.status == 403
+    assert not app["queue"].find_group("mixed").sealed
+
+    response = await cli.get("/group/own", headers=auth)
+    assert response.status == 200
+
+    callback = Task("callback", [], "other", [], {})
+    await cli.patch("/group/own", json={"callback": callback.for_json()}, headers=admin)
+
+    response = await cli.get("/group/own", headers=auth)
+    assert response.status == 403
+
+
+async def test_queue_add_invalid(cli, app):
+    data = Task("test_task", [], "pool", [1], {}).for_json()
+
+    for field, value in (("deadline", "tomorrow"), ("depends_on", ["nope"]),
+                         ("on_parent_failure", "ignore"), ("expires_at", 5),
+                         ("max_retries", "three"), ("retry_delay", -1), ("retry_backoff", None)):
+        response = await cli.post("/task", json=dict(data, **{field: value}))
+        assert response.status == 400
+
+    response = await cli.post("/task", json=dict(data, deadline="2999-01-01T00:00:00Z"))
+    assert response.status == 200
+    assert app["queue"].tasks[0].deadline.year == 2999
+
+    response = await cli.patch("/group/g", json={"callback": dict(data, deadline="soon")})
+    assert response.status == 400
+
+
+async def test_queue_add_over_limit(cli, app):
+    app["limits"] = EnqueueLimits(max_depth=1)
+
+    task = Task("test_task", [], "pool", [1], {})
+    response = await cli.post("/task", json=task.for_json())
+    assert response.status == 200
+
+    task = Task("test_task", [], "pool", [2], {})
+    response = await cli.post("/task", json=task.for_json())
+    assert response.status == 429
+    assert response.headers["Retry-After"] == "1"
+
+    stats_data = dict(app["stats"].stat_iter())
+    assert stats_data["tasks_rejected.pool.pool"] == 1
+    assert len(app["queue"]) == 1
+
+
+async def test_start_server_unix_socket(tmpdir):
+    path = str(tmpdir.join("queue.sock"))
+    app = build_app()
+    setup_routes(app)
+    runner = await start_server(app, path=path, keepalive_timeout=5, access_log=None)
+
+    try:
+        async with ClientSession(connector=UnixConnector(path)) as session:
+            async with session.get("http://localhost/task") as response:
+                assert response.status == 200
+                assert await response.json() == []
+    finally:
+        await runner.cleanup()
+
+
+async def test_start_server_proxied_unix_socket(tmpdir):
+    path = str(tmpdir.join("queue.sock"))
+    app = build_app()
+    app["limits"] = EnqueueLimits(rate=1)
+    setup_routes(app)
+    runner = await start_server(app, path=path, keepalive_timeout=5, proxied=True, access_log=None)
+    relay = await asyncio.start_server(lambda reader, writer: _proxy(reader, writer, path), "127.0.0.1", 0)
+    port = relay.sockets[0].getsockname()[1]
+
+    try:
+        async with ClientSession() as session:
+            for status in (200, 429):
+                task = Task("test_task", [], "pool", [status], {})
+                async with session.post("http://127.0.0.1:{}/task".format(port), json=task.for_json()) as response:
+                    assert response.status == status
+
+        assert list(app["limits"]._buckets) == ["127.0.0.1"]
+
+        async with ClientSession(connector=UnixConnector(path)) as session:
+            async with session.get("http://localhost/task") as response:
+                assert response.status == 200
+                assert len(await response.json()) == 1
+    finally:
+        relay.close()
+        await relay.wait_closed()
+        await runner.cleanup()
@@ -0,0 +1,87 @@
+from datetime import timedelta
+
+from queueueue.stats.collector import StatCollector
+from queueueue.stats.window import RollingCounter, ewma
+from queueueue.taskqueue import MultiLockPriorityPoolQueue, Task
+
+
+def test_rolling_counter_windows():
+    counter = RollingCounter(windows=(60, 300), resolution=10)
+
+    counter.add(6, now=1000)
+    counter.add(6, now=1055)
+    assert counter.rates(now=1059) == [12 / 60, 12 / 300]
+
+    assert counter.rates(now=1065) == [6 / 60, 12 / 300]
+    assert counter.rates(now=1299) == [0, 12 / 300]
+    assert counter.rates(now=1300) == [0, 6 / 300]
+    assert not counter.idle
+
+    assert counter.rates(now=1360) == [0, 0]
+    assert counter.idle
+
+
+def test_rolling_counter_idle_reset():
+    counter = RollingCounter(windows=(60,), resolution=10)
+
+    counter.add(3, now=0)
+    counter.add(1, now=5000)
+
+    assert counter.rates(now=5001) == [1 / 60]
+
+
+def test_ewma():
+    assert ewma(None, 10.0) == 10.0
+    assert ewma(10.0, 20.0) == 12.0
+    assert ewma(10.0, 20.0, alpha=0.5) == 15.0
+
+
+def test_collector_rates_and_ewma():
+    collector = StatCollector()
+    collector.push_task_received("pool.a")
+    collector.push_task_received("pool.a")
+    collector.push_task_duplicate("pool.a")
+
+    task = Task("test_task", [], "pool.a", [], {})
+    task.complete(status="success")
+    task.taken = task.finished - timedelta(seconds=10)
+    collector.push_task_finished(task)
+
+    task.taken = task.finished - timedelta(seconds=20)
+    collector.push_task_finished(task)
+
+    stats_data = dict(collector.stat_iter())
+    assert stats_data["tasks_received_rate_1m.pool.pool_a"] == 2 / 60
+    assert stats_data["tasks_received_rate_15m.total"] == 2 / 900
+    assert stats_data["tasks_duplicates_rate_5m.pool.pool_a"] == 1 / 300
+    assert stats_data["tasks_completed_rate_1m.total"] == 2 / 60
+    assert stats_data["task_processing_ewma.pool.pool_a"] == 12.0
+
+
+def test_collector_drops_idle_windows():
+    collector = StatCollector(MultiLockPriorityPoolQueue())
+    collector.push_task_received("pool")
+    collector.tasks_received_window["pool"].sums = [0, 0, 0]
+
+    stats_data = dict(collector.stat_iter())
+    assert stats_data["tasks_received_rate_1m.pool.pool"] == 0
+    assert collector.tasks_received_window == {}
+
+
+def test_collector_deadline_misses():
+    collector = StatCollector()
+
+    task = Task("test_task", [], "pool.a", [], {}, deadline="2020-01-01T00:00:00+00:00")
+    task.complete(status="success")
+    collector.push_task_finished(task)
+    collector.push_task_shed("pool.a")
+
+    on_time = Task("test_task", [], "pool.b", [], {}, deadline="2999-01-01T00:00:00+00:00")
+    on_time.complete(status="success")
+    collector.push_task_finished(on_time)
+
+    stats_data = dict(collector.stat_iter())
+    assert stats_data["tasks_shed.pool.pool_a"] == 1
+    assert stats_data["deadline_missed.pool.pool_a"] == 2
+    assert stats_data["deadline_missed.total"] == 2
+    assert "deadline_missed.pool.pool_b" not in stats_data
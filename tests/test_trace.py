@@ -0,0 +1,109 @@
+import json
+
+import pytest
+
+from queueueue.instrumentation import Instrumentation
+from queueueue.simulator import Simulation, read_trace
+from queueueue.taskqueue import MultiLockPriorityPoolQueue, Task
+from queueueue.trace import TraceRecorder
+
+
+def test_trace_recording(tmpdir):
+    path = str(tmpdir.join("trace.ndjson"))
+    q = MultiLockPriorityPoolQueue()
+    recorder = TraceRecorder(q)
+
+    recorder.start(path)
+    with pytest.raises(ValueError):
+        recorder.start(path)
+
+    t1 = Task("test_task", [1], "pool", [1], {})
+    t2 = Task("test_task", [], "pool", [2], {})
+    q.put(t1)
+    q.put(t2)
+    q.put(Task("test_task", [1], "pool", [1], {}), unique=True)
+    q.get("pool")
+    q.complete(str(t1.id), {"status": "success"})
+    q.safe_remove(str(t2.id))
+
+    assert recorder.stop() == 5
+    assert q.observers == []
+
+    records = [json.loads(line) for line in open(path)]
+    assert [record[1] for record in records] == ["put", "put", "get", "complete", "remove"]
+    assert records[0][2:] == [t1.id.hex, "pool", "test_task", ["1"]]
+    assert records[4][2] == t2.id.hex
+    assert records[3][0] >= records[0][0]
+
+    with pytest.raises(LookupError):
+        recorder.stop()
+
+
+async def test_trace_with_instrumentation(tmpdir):
+    path = str(tmpdir.join("trace.ndjson"))
+    q = MultiLockPriorityPoolQueue()
+    instrumentation = Instrumentation(q)
+    recorder = TraceRecorder(q)
+
+    instrumentation.enable()
+    recorder.start(path)
+    instrumentation.disable()
+
+    q.put(Task("test_task", [], "pool", [1], {}))
+    assert recorder.records == 1
+
+    instrumentation.enable()
+    assert recorder.stop() == 1
+    q.get("pool")
+    assert instrumentation.counters["get"].calls == 1
+    instrumentation.disable()
+
+
+def test_simulation_worker_fleet(tmpdir):
+    path = str(tmpdir.join("trace.ndjson"))
+    ids = ["{:032x}".format(number) for number in range(4)]
+
+    with open(path, "w") as trace:
+        for number, task_id in enumerate(ids):
+            trace.write(json.dumps([0, "put", task_id, "pool", "task", []]) + "\n")
+            trace.write(json.dumps([number, "get", task_id, "pool"]) + "\n")
+            trace.write(json.dumps([number + 1, "complete", task_id, "success"]) + "\n")
+
+    report = Simulation(read_trace(path)).run()
+    assert report["pools"]["pool"]["workers"] == 1
+    assert report["completed"] == 4
+    assert report["makespan"] == 4
+    assert report["wait_max"] == 3
+
+    report = Simulation(read_trace(path), workers={"pool": 4}).run()
+    assert report["makespan"] == 1
+    assert report["wait_max"] == 0
+
+
+def test_simulation_locks_retries_and_removal():
+    a, b, c = ("{:032x}".format(number) for number in range(3))
+    trace = [
+        [0, "put", a, "pool", "task", ["x"]],
+        [0, "put", b, "pool", "task", ["x"]],
+        [0, "put", c, "pool", "task", []],
+        [0, "get", a, "pool"],
+        [2, "complete", a, "failed"],
+        [2, "get", a, "pool"],
+        [3, "complete", a, "success"],
+        [3, "get", b, "pool"],
+        [4, "complete", b, "success"],
+        [0.5, "remove", c],
+    ]
+
+    # c runs next to a, b waits for the lock of a and its retry
+    report = Simulation(trace, workers={"pool": 2}).run()
+    assert report["completed"] == 2
+    assert report["removed"] == 1
+    assert report["makespan"] == 4
+    assert report["wait_max"] == 2
+    assert report["unfinished"] == 0
+
+    report = Simulation(trace, workers={"pool": 2}, ignore_locks=True).run()
+    assert report["removed"] == 1
+    assert report["makespan"] == 3
+    assert report["wait_max"] == 0